@@ -0,0 +1,136 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: acquisition.py
+
+Acquisition entry point: one ChamberPoller per host plus the outputs fed
+from every sample (CSV log, local publisher, shared memory table). The
+dashboard, the command line and headless scripts share this wiring.
+
+    with Acquisition(hosts, loops = (1, 2), log = 'fleet.csv',
+                     table = 'f4t_fleet') as acq:
+        time.sleep(3600)
+        print(acq.pollers[0].values)
+'''
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from f4tscpi.f4t_interface import F4T
+from f4tscpi.sink import SampleWriter
+from f4tscpi.dashboard import ChamberPoller, field_keys
+from f4tscpi.capabilities import CapabilityCache, discover_fleet
+
+LOG = logging.getLogger(__name__)
+
+class Acquisition:
+    '''pollers for hosts and the outputs they feed
+
+       loops, cascade, outputs: fields polled (see dashboard.field_keys)
+       errors:   also poll the ERROR? flag of every loop (alarms.py)
+       discover: optional capability cache file; each chamber then polls
+                 the loops and cascade it has instead of loops/cascade
+       log:      optional CSV file receiving every sample through a
+                 background SampleWriter
+       publish:  optional Unix socket path; every sample is also fanned out
+                 to local Subscribers (see pubsub.py)
+       table:    optional shared memory name; the latest values of every
+                 chamber are kept there for TableReaders (see shmtable.py)
+    '''
+
+    def __init__(self, hosts, loops = (1,), cascade = False, outputs = True,
+                 rate = 1.0, port = 5025, timeout = 1.0, discover = None,
+                 log = None, publish = None, table = None, errors = False):
+        self.hosts = list(dict.fromkeys(hosts))
+        self.keys = field_keys(loops, cascade, outputs, errors)
+        self.outputs = outputs
+        self.errors = errors
+        self.rate = rate
+        self.port = port
+        self.timeout = timeout
+        self.discover = discover
+        self.log = log
+        self.publish = publish
+        self.table = table
+        self.pollers = []
+        self.sink = None
+        self.publisher = None
+        self.values = None              # ValueTable
+
+    def connect(self, host):
+        return F4T(host = host, port = self.port, timeout = self.timeout)
+
+    def _discover(self):
+        '''connect to the hosts in parallel and discover their capabilities
+           through the cache file; returns ({host: F4T}, {host: caps})
+        '''
+        def attempt(host):
+            try:
+                return self.connect(host)
+            except Exception as exc:
+                LOG.warning('%s: %s', host, exc)
+                return None
+        with ThreadPoolExecutor(max_workers = 16) as pool:
+            devices = dict(zip(self.hosts, pool.map(attempt, self.hosts)))
+        devices = {host: dev for host, dev in devices.items()
+                   if dev is not None}
+        return devices, discover_fleet(devices,
+                                       CapabilityCache(self.discover))
+
+    def _listeners(self):
+        listeners = []
+        if self.log:
+            self.sink = SampleWriter(self.log)
+            listeners.append(self.sink.listener)
+        if self.publish:
+            from f4tscpi.pubsub import Publisher      # Unix sockets
+            self.publisher = Publisher(self.publish)
+            listeners.append(self.publisher.listener)
+        if self.table:
+            fields = []
+            for poller in self.pollers:
+                fields += [name for name, _, _ in poller.keys
+                           if name not in fields]
+            from f4tscpi.shmtable import ValueTable   # Python 3.8+
+            self.values = ValueTable(self.hosts, fields, self.table)
+            listeners.append(self.values.listener)
+        return listeners
+
+    def start(self):
+        devices, caps = self._discover() if self.discover else ({}, {})
+        self.pollers = []
+        for host in self.hosts:
+            poller = ChamberPoller(host, lambda host = host:
+                                   self.connect(host),
+                                   caps[host].field_keys(self.outputs,
+                                                         self.errors)
+                                   if host in caps else self.keys, self.rate)
+            poller.dev = devices.get(host)
+            self.pollers.append(poller)
+        listeners = self._listeners()
+        if self.sink is not None:
+            self.sink.start()
+        if self.publisher is not None:
+            self.publisher.start()
+        for poller in self.pollers:
+            poller.listeners.extend(listeners)
+            poller.start()
+        return self
+
+    def stop(self):
+        for poller in self.pollers:
+            poller.stop()
+        for poller in self.pollers:     # no listener runs past this point
+            if poller.is_alive():
+                poller.join()
+        if self.sink is not None:
+            self.sink.close()
+        if self.publisher is not None:
+            self.publisher.stop()
+        if self.values is not None:
+            self.values.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,192 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: alarms.py
+
+Vectorized alarm and limit evaluation over fleet snapshots.
+
+A snapshot is a set of columnar arrays of shape (chambers, loops): PV, SP
+and the controller's own ERROR? flags. Rules are compiled into flat arrays
+(kind, chamber, loop, limit, hysteresis, delay), so every rule of the
+fleet is evaluated in one NumPy pass per tick; only alarms that change
+state are returned.
+
+Rule kinds:
+    high       PV above limit, clears below limit - hysteresis
+    low        PV below limit, clears above limit + hysteresis
+    rate       |dPV/dt| above limit (units per minute)
+    deviation  |PV - SP| above limit
+    fault      the controller reports ERROR for the loop
+
+delay holds a condition for that many seconds before the alarm becomes
+active (delay-on); alarms clear without delay. Missing readings (NaN)
+leave the state of their alarms unchanged.
+
+NumPy is required for this module only: pip install f4tscpi[analysis]
+'''
+import logging
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError as exc:       # pragma: no cover
+    raise ImportError('f4tscpi.alarms requires NumPy; '
+                      'install it with: pip install numpy') from exc
+
+LOG = logging.getLogger(__name__)
+
+KINDS = ('high', 'low', 'rate', 'deviation', 'fault')
+_SIGN = np.array([1.0, -1.0, 1.0, 1.0, 1.0])
+
+Transition = namedtuple('Transition', 't name chamber loop active value limit')
+
+class AlarmEngine:
+    '''alarm state of every rule over a chambers x loops fleet
+
+       chambers: chamber names (rows of the snapshot arrays)
+       loops:    loop labels (columns), e.g. ['L1', 'L2', 'Out', 'In']
+    '''
+
+    def __init__(self, chambers, loops):
+        self.chambers = list(chambers)
+        self.loops = list(loops)
+        self._rows = {name: i for i, name in enumerate(self.chambers)}
+        self._cols = {name: i for i, name in enumerate(self.loops)}
+        self._rules = []
+        self._compiled = False
+        self._active = np.zeros(0, dtype = bool)
+        self._pending = np.zeros(0)
+        self._prev_t = None
+        self._prev_pv = None
+
+    def __len__(self):
+        return len(self._rules)
+
+    def add(self, name, kind, limit = None, chambers = None, loops = None,
+            hysteresis = 0.0, delay = 0.0):
+        '''add a rule for the given chambers and loops (default: all);
+           one alarm is kept per chamber and loop. fault rules take no
+           limit.
+        '''
+        if kind not in KINDS:
+            raise ValueError(f'kind must be one of {KINDS}')
+        if kind == 'fault':
+            limit = 0.5
+        elif limit is None:
+            raise ValueError(f'{kind} rule needs a limit')
+        code = KINDS.index(kind)
+        rows = [self._rows[c] for c in (chambers or self.chambers)]
+        cols = [self._cols[l] for l in (loops or self.loops)]
+        for row in rows:
+            for col in cols:
+                self._rules.append((name, code, row, col, limit, hysteresis,
+                                    delay))
+        self._compiled = False
+
+    def _compile(self):
+        if self._rules:
+            _, kind, row, col, limit, hyst, delay = zip(*self._rules)
+        else:
+            kind = row = col = limit = hyst = delay = ()
+        self._names = [rule[0] for rule in self._rules]
+        self._kind = np.array(kind, dtype = np.intp)
+        self._row = np.array(row, dtype = np.intp)
+        self._col = np.array(col, dtype = np.intp)
+        sign = _SIGN[self._kind]
+        self._limit = sign * np.array(limit, dtype = float)
+        self._hyst = np.array(hyst, dtype = float)
+        self._delay = np.array(delay, dtype = float)
+        # rules added since the last tick start inactive
+        grow = len(self._rules) - len(self._active)
+        self._active = np.concatenate([self._active,
+                                       np.zeros(grow, dtype = bool)])
+        self._pending = np.concatenate([self._pending,
+                                        np.full(grow, np.nan)])
+        self._sign = sign
+        self._compiled = True
+
+    def evaluate(self, t, pv, sp = None, error = None):
+        '''evaluate every rule on one snapshot
+
+           t:      time stamp (seconds)
+           pv, sp: float arrays (chambers, loops); NaN = no reading
+           error:  bool array (chambers, loops) of ERROR? flags
+           returns the list of Transitions, usually empty
+        '''
+        if not self._compiled:
+            self._compile()
+        pv = np.asarray(pv, dtype = float)
+        shape = pv.shape
+        sp = np.full(shape, np.nan) if sp is None else \
+             np.asarray(sp, dtype = float)
+        fault = np.zeros(shape) if error is None else \
+                np.asarray(error, dtype = float)
+        if self._prev_pv is None or t <= self._prev_t:
+            rate = np.full(shape, np.nan)
+        else:
+            rate = np.abs(pv - self._prev_pv) * (60.0 / (t - self._prev_t))
+        self._prev_t, self._prev_pv = t, pv
+        # one gather over (kind, chamber, loop) for all rules
+        source = np.stack([pv, pv, rate, np.abs(pv - sp), fault])
+        value = source[self._kind, self._row, self._col]
+        x = self._sign * value
+        with np.errstate(invalid = 'ignore'):
+            trip = x > self._limit
+            clear = x < self._limit - self._hyst
+        active = self._active
+        condition = np.where(active, ~clear, trip)
+        # delay-on: the condition must hold for delay seconds; a missing
+        # reading keeps the running delay
+        starting = condition & ~active
+        self._pending = np.where(np.isnan(value), self._pending,
+                                 np.where(starting,
+                                          np.where(np.isnan(self._pending),
+                                                   t, self._pending),
+                                          np.nan))
+        with np.errstate(invalid = 'ignore'):
+            due = starting & (t - self._pending >= self._delay)
+        new = (active & condition) | due
+        changed = np.flatnonzero(new != active)
+        self._active = new
+        return [Transition(t, self._names[i], self.chambers[self._row[i]],
+                           self.loops[self._col[i]], bool(new[i]),
+                           float(value[i]), float(self._sign[i] *
+                                                  self._limit[i]))
+                for i in changed]
+
+    def active(self):
+        '''(name, chamber, loop) of every active alarm
+        '''
+        return [(self._names[i], self.chambers[self._row[i]],
+                 self.loops[self._col[i]])
+                for i in np.flatnonzero(self._active)]
+
+def fleet_loops(loops, cascade = False):
+    '''loop labels matching dashboard.field_keys naming
+    '''
+    labels = [f'L{loop}' for loop in loops]
+    return labels + ['Out', 'In'] if cascade else labels
+
+_SP = {'Out': 'Cas SP', 'In': 'In SP'}    # the outer SP is the cascade SP
+
+def fleet_arrays(pollers, labels):
+    '''(pv, sp, error) arrays from ChamberPoller values polled with
+       field_keys(..., errors = True); missing values are NaN / False
+    '''
+    shape = (len(pollers), len(labels))
+    pv = np.full(shape, np.nan)
+    sp = np.full(shape, np.nan)
+    error = np.zeros(shape, dtype = bool)
+    for i, poller in enumerate(pollers):
+        values = poller.values
+        if poller.error is not None:
+            continue
+        for j, label in enumerate(labels):
+            pv[i, j] = _float(values.get(f'{label} PV'))
+            sp[i, j] = _float(values.get(_SP.get(label, f'{label} SP')))
+            error[i, j] = values.get(f'{label} ERR') == 'ERROR'
+    return pv, sp, error
+
+def _float(value):
+    return np.nan if value is None else value
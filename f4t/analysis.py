@@ -0,0 +1,264 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: analysis.py
+
+Vectorized analysis of recorded F4T process values (PV) and set points (SP).
+All routines work on NumPy arrays of time stamps (seconds), PV and SP samples
+as recorded from get_pv/get_sp; no per-sample Python loops are used.
+
+NumPy is required for this module only: pip install f4tscpi[analysis]
+'''
+import logging
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError as exc:       # pragma: no cover
+    raise ImportError('f4tscpi.analysis requires NumPy; '
+                      'install it with: pip install numpy') from exc
+
+LOG = logging.getLogger(__name__)
+
+STEP_FIELDS = [
+    ('step', 'i8'),
+    ('start', 'f8'),
+    ('end', 'f8'),
+    ('sp', 'f8'),
+    ('pv_mean', 'f8'),
+    ('pv_std', 'f8'),
+    ('ramp_rate', 'f8'),
+    ('overshoot', 'f8'),
+    ('undershoot', 'f8'),
+    ('settling_time', 'f8'),
+    ('time_in_tol', 'f8'),
+]
+
+def as_arrays(samples):
+    '''convert recorded (time, pv, sp) samples into float arrays
+
+       samples: iterable of (t, pv, sp) tuples; pv/sp may be the raw
+       strings returned by get_pv/get_sp. Missing readings (None or
+       empty strings) become NaN.
+    '''
+    rows = list(samples)
+    if not rows:
+        empty = np.empty(0, dtype = float)
+        return empty, empty.copy(), empty.copy()
+    raw = np.asarray(rows, dtype = object)
+    t = raw[:, 0].astype(float)
+    pv = np.array([_to_float(v) for v in raw[:, 1]])
+    sp = np.array([_to_float(v) for v in raw[:, 2]])
+    return t, pv, sp
+
+def _to_float(value):
+    '''parse one reading; unparsable replies are NaN
+    '''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def ramp_rate(t, pv, window = 5, scale = 60.0):
+    '''least-squares slope of PV over a sliding window of samples
+
+       window: number of samples per fit (centered, odd is best)
+       scale:  60.0 gives units per minute, 3600.0 units per hour,
+               matching the RSCALE settings of the controller
+       returns an array the size of pv; edges are NaN
+    '''
+    t = np.asarray(t, dtype = float)
+    pv = np.asarray(pv, dtype = float)
+    n = pv.shape[-1]
+    rate = np.full(pv.shape, np.nan)
+    if window < 2 or n < window:
+        return rate
+    # center each window before the fit; raw cumulative sums lose all
+    # precision on week-long time stamps
+    xw = sliding_window_view(t, window, axis = -1)
+    yw = sliding_window_view(pv, window, axis = -1)
+    xc = xw - xw.mean(axis = -1, keepdims = True)
+    yc = yw - yw.mean(axis = -1, keepdims = True)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        slope = (xc * yc).sum(axis = -1) / (xc * xc).sum(axis = -1)
+    lo = (window - 1) // 2
+    rate[..., lo:lo + slope.shape[-1]] = slope * scale
+    return rate
+
+def step_edges(sp):
+    '''indices where the set point changes, i.e. the start of each step;
+       index 0 is always included
+    '''
+    sp = np.asarray(sp, dtype = float)
+    if sp.size == 0:
+        return np.empty(0, dtype = int)
+    change = np.flatnonzero(sp[1:] != sp[:-1]) + 1
+    return np.concatenate([[0], change])
+
+def _segments(sp, steps):
+    '''start indices and per-sample segment id from sp changes or
+       from an explicit step number column
+    '''
+    if steps is None:
+        starts = step_edges(sp)
+    else:
+        starts = step_edges(steps)
+    seg = np.zeros(len(sp), dtype = int)
+    seg[starts[1:]] = 1
+    return starts, np.cumsum(seg)
+
+def within_tolerance(pv, sp, tol):
+    '''boolean mask: |pv - sp| <= tol
+    '''
+    pv = np.asarray(pv, dtype = float)
+    sp = np.asarray(sp, dtype = float)
+    return np.abs(pv - sp) <= tol
+
+def time_in_tolerance(t, pv, sp, tol):
+    '''total time (seconds) PV spent within tol of SP; each sample is
+       weighted by the interval up to the next sample
+    '''
+    t = np.asarray(t, dtype = float)
+    if t.size < 2:
+        return 0.0
+    dt = np.diff(t)
+    return float(np.sum(dt[within_tolerance(pv, sp, tol)[:-1]]))
+
+def overshoot(pv, sp, steps = None):
+    '''overshoot and undershoot per step
+
+       For each step the approach direction is taken from the SP change.
+       Overshoot is the largest excursion past SP after PV first reaches
+       it; undershoot is the largest excursion back on the approach side
+       after that point. Steps with no SP change (holds) report the
+       largest excursion above and below SP.
+       Missing readings (NaN) are skipped.
+       returns (overshoot, undershoot) arrays, one value per step
+    '''
+    pv = np.asarray(pv, dtype = float)
+    sp = np.asarray(sp, dtype = float)
+    if pv.size == 0:
+        empty = np.empty(0)
+        return empty, empty.copy()
+    starts, seg = _segments(sp, steps)
+    first_sp = sp[starts]
+    prev_sp = np.concatenate([[first_sp[0]], sp[starts[1:] - 1]])
+    direction = np.sign(first_sp - prev_sp)[seg]
+    err = pv - sp
+    valid = ~np.isnan(err)
+    hold = direction == 0
+    crossed = valid & (hold | (direction * err >= 0))
+    count = np.cumsum(crossed)
+    base = np.concatenate([[0], count[starts[1:] - 1]])[seg]
+    after = ((count - base) > 0) & valid
+    over_s = np.where(hold, err, direction * err)
+    under_s = np.where(hold, -err, -direction * err)
+    over = np.maximum.reduceat(np.where(after, over_s, -np.inf), starts)
+    under = np.maximum.reduceat(np.where(after, under_s, -np.inf), starts)
+    over = np.where(np.isfinite(over), np.maximum(over, 0.0), np.nan)
+    under = np.where(np.isfinite(under), np.maximum(under, 0.0), np.nan)
+    return over, under
+
+def settling_time(t, pv, sp, tol, hold = 0.0, steps = None):
+    '''time from the start of each step until PV enters the tolerance
+       band for good (stays within tol to the end of the step)
+
+       hold: minimum time the final in-band run must last; steps that
+             never settle, or settle for less than hold, report NaN
+       Missing readings (NaN) neither settle nor unsettle a step.
+    '''
+    t = np.asarray(t, dtype = float)
+    if t.size == 0:
+        return np.empty(0)
+    starts, seg = _segments(sp, steps)
+    ends = np.concatenate([starts[1:], [t.size]]) - 1
+    idx = np.arange(t.size)
+    missing = np.isnan(np.asarray(pv, dtype = float))
+    out = np.where(within_tolerance(pv, sp, tol) | missing, -1, idx)
+    last_out = np.maximum.reduceat(out, starts)
+    settled = np.where(last_out < starts, starts, last_out + 1)
+    ok = settled <= ends
+    settled = np.minimum(settled, ends)
+    elapsed = t[settled] - t[starts]
+    held = t[ends] - t[settled]
+    return np.where(ok & (held >= hold), elapsed, np.nan)
+
+def stability_windows(t, pv, sp, tol, min_duration = 0.0):
+    '''runs of consecutive in-tolerance samples lasting at least
+       min_duration seconds
+
+       returns an (n, 2) array of [start_time, end_time] rows
+    '''
+    t = np.asarray(t, dtype = float)
+    mask = within_tolerance(pv, sp, tol).astype(np.int8)
+    if mask.size == 0:
+        return np.empty((0, 2))
+    edges = np.diff(np.concatenate([[0], mask, [0]]))
+    begin = np.flatnonzero(edges == 1)
+    end = np.flatnonzero(edges == -1) - 1
+    span = np.column_stack([t[begin], t[end]])
+    return span[(span[:, 1] - span[:, 0]) >= min_duration]
+
+def step_summary(t, pv, sp, tol, hold = 0.0, steps = None, window = 5,
+                 scale = 60.0):
+    '''per-step summary of a recorded run as a structured array
+
+       Steps are split on SP changes, or on an explicit profile step
+       number column when steps is given. Fields are listed in
+       STEP_FIELDS; ramp_rate is the mean windowed slope in units per
+       minute (see ramp_rate for scale). Missing readings (NaN) are left
+       out of every statistic.
+    '''
+    t = np.asarray(t, dtype = float)
+    pv = np.asarray(pv, dtype = float)
+    sp = np.asarray(sp, dtype = float)
+    if steps is not None:
+        steps = np.asarray(steps)
+    starts, seg = _segments(sp, steps)
+    out = np.zeros(len(starts), dtype = STEP_FIELDS)
+    if t.size == 0:
+        return out
+    ends = np.concatenate([starts[1:], [t.size]]) - 1
+    present = ~np.isnan(pv)
+    known = np.where(present, pv, 0.0)
+    counts = np.add.reduceat(present.astype(float), starts)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mean = np.add.reduceat(known, starts) / counts
+        mean_sq = np.add.reduceat(known * known, starts) / counts
+    rate = ramp_rate(t, pv, window = window, scale = scale)
+    valid = ~np.isnan(rate)
+    rate_sum = np.add.reduceat(np.where(valid, rate, 0.0), starts)
+    rate_n = np.add.reduceat(valid.astype(float), starts)
+    dt = np.diff(t, append = t[-1])
+    in_tol = np.where(within_tolerance(pv, sp, tol), dt, 0.0)
+    # drop the interval that spans into the next step
+    in_tol[ends[:-1]] = 0.0
+
+    out['step'] = steps[starts] if steps is not None else np.arange(len(starts)) + 1
+    out['start'] = t[starts]
+    out['end'] = t[ends]
+    out['sp'] = sp[starts]
+    out['pv_mean'] = mean
+    out['pv_std'] = np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        out['ramp_rate'] = rate_sum / rate_n
+    out['overshoot'], out['undershoot'] = overshoot(pv, sp, steps = steps)
+    out['settling_time'] = settling_time(t, pv, sp, tol, hold = hold,
+                                         steps = steps)
+    out['time_in_tol'] = np.add.reduceat(in_tol, starts)
+    return out
+
+def fleet_summary(records, tol, hold = 0.0, **kwargs):
+    '''step_summary for many recordings
+
+       records: mapping of key (chamber, loop, ...) to (t, pv, sp) or
+                (t, pv, sp, steps) tuples
+       returns a dict with the same keys
+    '''
+    result = {}
+    for key, rec in records.items():
+        steps = rec[3] if len(rec) > 3 else None
+        result[key] = step_summary(rec[0], rec[1], rec[2], tol, hold = hold,
+                                   steps = steps, **kwargs)
+    return result
@@ -0,0 +1,232 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: batch.py
+
+Non-interactive batch execution of F4T commands for automation (cron,
+CI, test sequencers). Commands are given as short text lines, either on
+the command line or in a script file, and run in order over a single
+connection. Reads go through the pipelined path; results are written as
+JSON lines or CSV rows with fixed columns:
+
+    t, cmd, target, field, value
+
+Script syntax, one command per line ('#' starts a comment):
+
+    id                          identification (*IDN?)
+    units                       communication temperature units
+    pv LOOP [LOOP ...]          process values
+    sp LOOP [LOOP ...]          set points
+    set-sp LOOP VALUE           write set point
+    ramp-mode LOOP MODE         OFF | STARTUP | SETPOINT | BOTH
+    ramp-rate LOOP [VALUE]      read or write ramp rate
+    ramp-time LOOP [VALUE]      read or write ramp time
+    ramp-scale LOOP H|M         ramp scale in hours or minutes
+    profiles                    list profile names
+    start PROFILE [STEP]        select profile (and step) and start it
+    stop | pause | resume       control the selected profile
+    output N [ON|OFF]           read or write an event output
+    outputs [MASK [SELECT]]     read all outputs as a bitmask (bit 0 =
+                                output 1), or write the selected ones
+    sample COUNT PERIOD LOOP [LOOP ...]
+                                read PV/SP of the loops COUNT times
+    sleep SECONDS               wait
+'''
+import csv
+import json
+import time
+import shlex
+import logging
+from f4tscpi.scpi import encode
+from f4tscpi.planner import read_keys
+from f4tscpi.f4t_class import F4TError
+from f4tscpi.profiles import read_profiles
+from f4tscpi.f4t_interface import ALL_OUTPUTS
+
+LOG = logging.getLogger(__name__)
+
+FIELDS = ('t', 'cmd', 'target', 'field', 'value')
+
+class BatchError(Exception):
+    '''invalid batch command or arguments
+    '''
+
+def read_script(lines):
+    '''split script text into lists of tokens, skipping blanks and comments
+    '''
+    for line in lines:
+        tokens = shlex.split(line, comments = True)
+        if tokens:
+            yield tokens
+
+class Writer:
+    '''machine-readable output of batch results
+    '''
+
+    def __init__(self, out, fmt = 'json'):
+        if fmt not in ('json', 'csv'):
+            raise BatchError(f'unknown output format: {fmt}')
+        self.out = out
+        self.fmt = fmt
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.writer(out)
+            self._csv.writerow(FIELDS)
+
+    def write(self, cmd, target, field, value, t = None):
+        row = (round(time.time() if t is None else t, 3), cmd, target,
+               field, value)
+        if self._csv:
+            self._csv.writerow(row)
+        else:
+            self.out.write(json.dumps(dict(zip(FIELDS, row))) + '\n')
+        self.out.flush()
+
+def _reads(dev, keys):
+    '''planned read of (key, index) pairs; values parsed per catalog
+    '''
+    return read_keys(dev, keys)
+
+def _loops(args):
+    if not args:
+        raise BatchError('loop number required')
+    return [int(a) for a in args]
+
+def cmd_id(dev, out, args):
+    out.write('id', '', 'idn', dev.query(encode('*IDN?')))
+
+def cmd_units(dev, out, args):
+    out.write('units', '', 'units', _reads(dev, [(':UNIT:TEMPERATURE?', ())])[0])
+
+def cmd_pv(dev, out, args, name = 'pv', key = ':SOURCE:CLOOP#:PVALUE?'):
+    loops = _loops(args)
+    t = time.time()
+    for loop, value in zip(loops, _reads(dev, [(key, (l,)) for l in loops])):
+        out.write(name, f'loop{loop}', name, value, t)
+
+def cmd_sp(dev, out, args):
+    cmd_pv(dev, out, args, 'sp', ':SOURCE:CLOOP#:SPOINT?')
+
+def cmd_set_sp(dev, out, args):
+    loop, value = int(args[0]), args[1]
+    dev.send_cmd(encode(':SOURCE:CLOOP#:SPOINT', loop, value = value))
+    out.write('set-sp', f'loop{loop}', 'sp', float(value))
+
+def cmd_ramp_mode(dev, out, args):
+    loop, mode = int(args[0]), args[1]
+    dev.send_cmd(encode(':SOURCE:CLOOP#:RACTION', loop, value = mode))
+    out.write('ramp-mode', f'loop{loop}', 'mode', mode.upper())
+
+def _ramp(node, name):
+    def handler(dev, out, args):
+        loop = int(args[0])
+        if len(args) > 1:
+            dev.send_cmd(encode(f':SOURCE:CLOOP#:{node}', loop,
+                                value = args[1]))
+            out.write(name, f'loop{loop}', node.lower(), float(args[1]))
+        else:
+            value = _reads(dev, [(f':SOURCE:CLOOP#:{node}?', (loop,))])[0]
+            out.write(name, f'loop{loop}', node.lower(), value)
+    return handler
+
+def cmd_ramp_scale(dev, out, args):
+    loop = int(args[0])
+    scale = {'H': 'HOURS', 'M': 'MINUTES'}.get(args[1].upper(), args[1])
+    dev.send_cmd(encode(':SOURCE:CLOOP#:RSCALE', loop, value = scale))
+    out.write('ramp-scale', f'loop{loop}', 'scale', scale.upper())
+
+def cmd_profiles(dev, out, args):
+    for num, name in sorted(read_profiles(dev).items()):
+        out.write('profiles', f'profile{num}', 'name', name)
+
+def cmd_start(dev, out, args):
+    profile = int(args[0])
+    step = int(args[1]) if len(args) > 1 else None
+    dev.program.start(profile, step)
+    out.write('start', f'profile{profile}', 'state', 'START')
+
+def _state(mode):
+    def handler(dev, out, args):
+        dev.program.command(mode)
+        out.write(mode.lower(), 'profile', 'state', mode)
+    return handler
+
+def cmd_output(dev, out, args):
+    num = int(args[0])
+    if len(args) > 1:
+        dev.send_cmd(encode(':OUTPUT#:STATE', num, value = args[1]))
+        out.write('output', f'output{num}', 'state', args[1].upper())
+    else:
+        value = _reads(dev, [(':OUTPUT#:STATE?', (num,))])[0]
+        out.write('output', f'output{num}', 'state', value)
+
+def cmd_outputs(dev, out, args):
+    if args:
+        select = int(args[1], 0) if len(args) > 1 else ALL_OUTPUTS
+        mask = dev.write_outputs(int(args[0], 0), select, confirm = True)
+    else:
+        mask = dev.read_outputs()
+    out.write('outputs', 'outputs', 'mask', mask)
+
+def cmd_sample(dev, out, args):
+    count, period = int(args[0]), float(args[1])
+    loops = _loops(args[2:])
+    keys = []
+    for loop in loops:
+        keys.append((':SOURCE:CLOOP#:PVALUE?', (loop,)))
+        keys.append((':SOURCE:CLOOP#:SPOINT?', (loop,)))
+    due = time.monotonic()
+    for _ in range(count):
+        t = time.time()
+        values = _reads(dev, keys)
+        for i, loop in enumerate(loops):
+            out.write('sample', f'loop{loop}', 'pv', values[2 * i], t)
+            out.write('sample', f'loop{loop}', 'sp', values[2 * i + 1], t)
+        due += period
+        time.sleep(max(0.0, due - time.monotonic()))
+
+def cmd_sleep(dev, out, args):
+    time.sleep(float(args[0]))
+
+COMMANDS = {
+    'id': cmd_id,
+    'units': cmd_units,
+    'pv': cmd_pv,
+    'sp': cmd_sp,
+    'set-sp': cmd_set_sp,
+    'ramp-mode': cmd_ramp_mode,
+    'ramp-rate': _ramp('RRATE', 'ramp-rate'),
+    'ramp-time': _ramp('RTIME', 'ramp-time'),
+    'ramp-scale': cmd_ramp_scale,
+    'profiles': cmd_profiles,
+    'start': cmd_start,
+    'stop': _state('STOP'),
+    'pause': _state('PAUSE'),
+    'resume': _state('RESUME'),
+    'output': cmd_output,
+    'outputs': cmd_outputs,
+    'sample': cmd_sample,
+    'sleep': cmd_sleep,
+}
+
+def run_batch(dev, commands, out, stop_on_error = False):
+    '''run a sequence of tokenized commands on dev; errors are reported
+       as 'error' records. Returns the number of failed commands.
+    '''
+    failed = 0
+    for tokens in commands:
+        name, args = tokens[0].lower(), tokens[1:]
+        try:
+            handler = COMMANDS.get(name)
+            if handler is None:
+                raise BatchError(f'unknown command: {name}')
+            handler(dev, out, args)
+        except (BatchError, F4TError, ValueError, IndexError,
+                KeyError) as exc:
+            failed += 1
+            LOG.error('%s: %s', ' '.join(tokens), exc)
+            out.write(name, ' '.join(args), 'error', str(exc))
+            if stop_on_error:
+                break
+    return failed
@@ -0,0 +1,222 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: capabilities.py
+
+Capability discovery with a persisted cache.
+
+discover() finds out what a chamber answers to (control loops, cascade,
+humidity, named event outputs) with one pipelined batch. The result is
+stored in a CapabilityCache keyed by the *IDN? serial number and firmware
+version, so later startups skip probing; pollers then request only
+commands the chamber supports and never wait out a timeout on a loop
+that does not exist.
+
+A loop or cascade is present when its PV query answers a number. If the
+batch times out (a controller that stays silent on absent nodes), each
+query is probed on its own with a short timeout instead.
+'''
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from f4tscpi.scpi import command, encode, parse
+from f4tscpi.f4t_class import F4TError, F4TTimeout
+
+LOG = logging.getLogger(__name__)
+
+_, _LO, _HI = command(':SOURCE:CLOOP#:PVALUE?').index[0]
+LOOPS = range(_LO, _HI + 1)                 # loops 1-4 in the catalog
+_, _LO, _HI = command(':OUTPUT#:NAME?').index[0]
+OUTPUTS = range(_LO, _HI + 1)               # event outputs 1-7
+HUMIDITY_LOOP = 2           # ESPEC convention: loop 1 temp, loop 2 humidity
+PROBE_TIMEOUT = 0.5         # per query when probing one at a time
+
+class Capabilities:
+    '''what one chamber supports
+    '''
+
+    def __init__(self, serial, firmware, model = '', loops = (),
+                 cascade = False, humidity = False, outputs = None,
+                 probed = None):
+        self.serial = serial
+        self.firmware = firmware
+        self.model = model
+        self.loops = tuple(loops)
+        self.cascade = cascade
+        self.humidity = humidity
+        self.outputs = dict(outputs or {})     # output number -> name
+        self.probed = probed
+
+    @property
+    def key(self):
+        return f'{self.serial}/{self.firmware}'
+
+    @property
+    def family(self):
+        '''command set of the chamber: 'cascade' or 'standard'
+        '''
+        return 'cascade' if self.cascade else 'standard'
+
+    def field_keys(self, outputs = True, errors = False):
+        '''dashboard/poller fields valid for this chamber
+        '''
+        from f4tscpi.dashboard import field_keys
+        return field_keys(self.loops, self.cascade, outputs, errors)
+
+    def to_dict(self):
+        return {'serial': self.serial, 'firmware': self.firmware,
+                'model': self.model, 'loops': list(self.loops),
+                'cascade': self.cascade, 'humidity': self.humidity,
+                'outputs': {str(k): v for k, v in self.outputs.items()},
+                'probed': self.probed}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data['outputs'] = {int(k): v for k, v in data['outputs'].items()}
+        return cls(**data)
+
+    def __repr__(self):
+        return (f'Capabilities({self.key}, loops={self.loops}, '
+                f'{self.family}, humidity={self.humidity})')
+
+class CapabilityCache:
+    '''JSON file of Capabilities keyed by serial/firmware
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as fp:
+                    self._entries = json.load(fp)
+            except (OSError, ValueError) as exc:
+                LOG.warning('%s: ignoring capability cache: %s', path, exc)
+
+    def get(self, serial, firmware):
+        with self._lock:
+            data = self._entries.get(f'{serial}/{firmware}')
+        return None if data is None else Capabilities.from_dict(data)
+
+    def put(self, caps):
+        with self._lock:
+            self._entries[caps.key] = caps.to_dict()
+
+    def save(self):
+        '''write atomically (temporary file + rename)
+        '''
+        with self._lock:
+            text = json.dumps(self._entries, indent = 1, sort_keys = True)
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir = folder, suffix = '.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(text)
+        os.replace(tmp, self.path)
+
+def identity(dev):
+    '''(model, serial, firmware) from *IDN?; uses the id read at connect
+    '''
+    idn = dev.f4t_id or dev.query(encode('*IDN?'))
+    fields = parse('*IDN?', idn)
+    if len(fields) < 4:
+        return idn, idn, ''             # unexpected format: key on all of it
+    return fields[1], fields[2], fields[3]
+
+def _probe_keys():
+    keys = [(':SOURCE:CLOOP#:PVALUE?', (loop,)) for loop in LOOPS]
+    keys.append((':SOURCE:CASCADE#:OUTER:PVALUE?', (1,)))
+    keys += [(':OUTPUT#:NAME?', (num,)) for num in OUTPUTS]
+    return keys
+
+def _probe_each(dev, keys):
+    '''one query at a time; silent nodes count as absent
+    '''
+    replies = []
+    for key, idx in keys:
+        with dev.lock:
+            try:
+                replies.append(dev.read(encode(key, *idx),
+                                        budget = PROBE_TIMEOUT,
+                                        retries = 0)[0])
+            except F4TTimeout:
+                # silence is the answer of an absent node, not a failure
+                # of the chamber: keep the connection and the circuit
+                # breaker out of it
+                dev.accept_silence()
+                replies.append('')
+    return replies
+
+def _number(key, reply):
+    try:
+        parse(key, reply)
+    except ValueError:
+        return False
+    return True
+
+def probe(dev):
+    '''probe the capabilities of a chamber (no cache)
+    '''
+    model, serial, firmware = identity(dev)
+    keys = _probe_keys()
+    try:
+        replies = dev.read([encode(key, *idx) for key, idx in keys],
+                           budget = (dev.timeout or 0) + PROBE_TIMEOUT,
+                           retries = 0)
+    except F4TTimeout:
+        LOG.info('%s: batch probe timed out, probing one by one', serial)
+        replies = _probe_each(dev, keys)
+    found = dict(zip(keys, replies))
+    loops = tuple(loop for loop in LOOPS
+                  if _number(':SOURCE:CLOOP#:PVALUE?',
+                             found[(':SOURCE:CLOOP#:PVALUE?', (loop,))]))
+    cascade = _number(':SOURCE:CASCADE#:OUTER:PVALUE?',
+                      found[(':SOURCE:CASCADE#:OUTER:PVALUE?', (1,))])
+    outputs = {}
+    for num in OUTPUTS:
+        name = parse(':OUTPUT#:NAME?', found[(':OUTPUT#:NAME?', (num,))])
+        if name:
+            outputs[num] = name
+    return Capabilities(serial, firmware, model, loops, cascade,
+                        humidity = HUMIDITY_LOOP in loops and not cascade,
+                        outputs = outputs, probed = time.time())
+
+def discover(dev, cache = None):
+    '''capabilities of dev, from cache when the serial and firmware are
+       known, probed (and cached) otherwise
+    '''
+    model, serial, firmware = identity(dev)
+    if cache is not None:
+        caps = cache.get(serial, firmware)
+        if caps is not None:
+            return caps
+    caps = probe(dev)
+    if cache is not None:
+        cache.put(caps)
+    return caps
+
+def discover_fleet(devices, cache = None, workers = 16):
+    '''discover many chambers in parallel
+
+       devices: mapping of chamber name to F4T
+       returns {chamber: Capabilities}; chambers that fail are logged and
+       left out. The cache is saved once at the end.
+    '''
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = {name: pool.submit(discover, dev, cache)
+                   for name, dev in devices.items()}
+    result = {}
+    for name, future in futures.items():
+        try:
+            result[name] = future.result()
+        except (F4TError, OSError, ValueError) as exc:
+            LOG.error('%s: discovery failed: %s', name, exc)
+    if cache is not None:
+        cache.save()
+    return result
@@ -0,0 +1,278 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: catalog.py
+
+F4T SCPI command catalog.
+
+GENERATED by f4t_scpi_cmds/gen_catalog.py from f4t_scpi_commands.ods;
+do not edit by hand, edit the sheet and re-run the generator.
+
+key: command header with '#' for indexed nodes, ending in '?' for queries
+rw: 'R' query, 'W' write
+values: reply domain (R) or value domain (W):
+    ('float',), ('int', lo, hi), ('enum', choice, ...), ('string',),
+    ('idn',) or None
+index: ((node, lo, hi), ...) for each '#' in the header
+family: 'common', 'standard' (non cascade) or 'cascade'
+'''
+
+COMMANDS = {
+    '*IDN?': {
+        'rw': 'R',
+        'values': ('idn',),
+        'index': (),
+        'family': 'common',
+        'description': 'Identification',
+        'comment': 'Watlow Electric',
+    },
+    ':OUTPUT#:NAME?': {
+        'rw': 'R',
+        'values': ('string',),
+        'index': (('OUTPUT', 1, 7),),
+        'family': 'common',
+        'description': 'Query event output name',
+        'comment': '# = outputs 1-7',
+    },
+    ':OUTPUT#:STATE': {
+        'rw': 'W',
+        'values': ('enum', 'ON', 'OFF'),
+        'index': (('OUTPUT', 1, 7),),
+        'family': 'common',
+        'description': 'Set event output',
+        'comment': '# = outputs 1-7',
+    },
+    ':OUTPUT#:STATE?': {
+        'rw': 'R',
+        'values': ('enum', 'OFF', 'ON'),
+        'index': (('OUTPUT', 1, 7),),
+        'family': 'common',
+        'description': 'Query event output state',
+        'comment': '# = outputs 1-7',
+    },
+    ':PROGRAM:NAME?': {
+        'rw': 'R',
+        'values': ('string',),
+        'index': (),
+        'family': 'common',
+        'description': 'Read selected profile name',
+        'comment': 'the selected profile',
+    },
+    ':PROGRAM:NUMBER': {
+        'rw': 'W',
+        'values': ('int', 1, 40),
+        'index': (),
+        'family': 'common',
+        'description': 'Select a profile',
+        'comment': 'selects the desired profile to control',
+    },
+    ':PROGRAM:SELECTED:STATE': {
+        'rw': 'W',
+        'values': ('enum', 'START', 'STOP', 'PAUSE', 'RESUME'),
+        'index': (),
+        'family': 'common',
+        'description': 'start profile',
+        'comment': 'the selected profile',
+    },
+    ':PROGRAM:STEP': {
+        'rw': 'W',
+        'values': ('int', 1, 50),
+        'index': (),
+        'family': 'common',
+        'description': 'Select a step',
+        'comment': 'the selected profile',
+    },
+    ':SOURCE:CASCADE#:INNER:ERROR?': {
+        'rw': 'R',
+        'values': ('enum', 'ERROR', 'NONE'),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Query Outer Loop Input Error (Cascade)',
+        'comment': 'Input error status',
+    },
+    ':SOURCE:CASCADE#:INNER:PVALUE?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Read Inner Loop PV (Cascade)',
+        'comment': 'Source Value B',
+    },
+    ':SOURCE:CASCADE#:INNER:SPOINT?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Read Inner Loop Set Point (Cascade)',
+        'comment': '',
+    },
+    ':SOURCE:CASCADE#:OUTER:ERROR?': {
+        'rw': 'R',
+        'values': ('enum', 'ERROR', 'NONE'),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Query Outer Loop Input Error (Cascade)',
+        'comment': 'Input error status',
+    },
+    ':SOURCE:CASCADE#:OUTER:PVALUE?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Read Outer Loop PV (Cascade)',
+        'comment': 'Source Value A',
+    },
+    ':SOURCE:CASCADE#:OUTER:SPOINT?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Read Outer Loop Set Point (Cascade)',
+        'comment': '',
+    },
+    ':SOURCE:CASCADE#:SPOINT': {
+        'rw': 'W',
+        'values': ('float',),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Write Set Point (Cascade)',
+        'comment': 'User set point',
+    },
+    ':SOURCE:CASCADE#:SPOINT?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CASCADE', 1, 1),),
+        'family': 'cascade',
+        'description': 'Read Set Point (Cascade)',
+        'comment': 'User set point',
+    },
+    ':SOURCE:CLOOP#:ERROR?': {
+        'rw': 'R',
+        'values': ('enum', 'ERROR', 'NONE'),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'standard',
+        'description': 'Query input error',
+        'comment': 'Input error status',
+    },
+    ':SOURCE:CLOOP#:IDLE': {
+        'rw': 'W',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'standard',
+        'description': 'Write Idle SP',
+        'comment': 'Idle Set Point',
+    },
+    ':SOURCE:CLOOP#:IDLE?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'standard',
+        'description': 'Read Idle SP',
+        'comment': 'Idle Set Point',
+    },
+    ':SOURCE:CLOOP#:PVALUE?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'standard',
+        'description': 'Read Temperature PV (Control loop)',
+        'comment': 'Source Value A',
+    },
+    ':SOURCE:CLOOP#:RACTION': {
+        'rw': 'W',
+        'values': ('enum', 'OFF', 'STARTUP', 'SETPOINT', 'BOTH'),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'common',
+        'description': 'Set ramping',
+        'comment': 'controls instantly to set point',
+    },
+    ':SOURCE:CLOOP#:RRATE': {
+        'rw': 'W',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'common',
+        'description': 'Write ramp rate',
+        'comment': 'rate that controller ramps to set point',
+    },
+    ':SOURCE:CLOOP#:RRATE?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'common',
+        'description': 'Read ramp rate',
+        'comment': 'rate that controller ramps to set point',
+    },
+    ':SOURCE:CLOOP#:RSCALE': {
+        'rw': 'W',
+        'values': ('enum', 'MINUTES', 'HOURS'),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'common',
+        'description': 'Write ramp scale to',
+        'comment': 'ramp rate is per',
+    },
+    ':SOURCE:CLOOP#:RTIME': {
+        'rw': 'W',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'common',
+        'description': 'Write ramp time',
+        'comment': 'rate that controller ramps to set point',
+    },
+    ':SOURCE:CLOOP#:RTIME?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'common',
+        'description': 'Read ramp time',
+        'comment': 'time that controller ramps to set point',
+    },
+    ':SOURCE:CLOOP#:SPOINT': {
+        'rw': 'W',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'standard',
+        'description': 'Write SP',
+        'comment': 'User Set Point',
+    },
+    ':SOURCE:CLOOP#:SPOINT?': {
+        'rw': 'R',
+        'values': ('float',),
+        'index': (('CLOOP', 1, 4),),
+        'family': 'standard',
+        'description': 'Read SP',
+        'comment': 'Set Point Active Closed',
+    },
+    ':UNIT:TEMPERATURE': {
+        'rw': 'W',
+        'values': ('enum', 'F', 'C'),
+        'index': (),
+        'family': 'common',
+        'description': 'Set Comm. Temperature units to',
+        'comment': 'Ethernet display units to',
+    },
+    ':UNIT:TEMPERATURE:DISPLAY': {
+        'rw': 'W',
+        'values': ('enum', 'F', 'C'),
+        'index': (),
+        'family': 'common',
+        'description': 'Set Display Temperature units to',
+        'comment': 'Front panel display units to',
+    },
+    ':UNIT:TEMPERATURE:DISPLAY?': {
+        'rw': 'R',
+        'values': ('enum', 'C', 'F'),
+        'index': (),
+        'family': 'common',
+        'description': 'Query Display Temperature units',
+        'comment': 'Front panel display units',
+    },
+    ':UNIT:TEMPERATURE?': {
+        'rw': 'R',
+        'values': ('enum', 'C', 'F'),
+        'index': (),
+        'family': 'common',
+        'description': 'Query Comm. Temperature units',
+        'comment': 'Ethernet display units',
+    },
+}
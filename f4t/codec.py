@@ -0,0 +1,269 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: codec.py
+
+Deadband compressed long-term storage for PV series.
+
+Samples pass through a swinging-door encoder that keeps only the points
+needed so that straight lines between kept points stay within deadband of
+every raw sample. Kept points are stored as integers (milliseconds and
+value * scale) with delta + zig-zag varint encoding. Decoding gives the
+kept points back, and densify() rebuilds a dense series at any times.
+
+Error bound of a decoded value at a recorded sample time:
+    |decoded - raw| <= deadband + 0.5 / scale
+Samples that are None or NaN (failed reads) are skipped.
+
+compress_log() turns a SampleWriter CSV log into one compressed series per
+(chamber, field); write_archive() / read_archive() store them in one file.
+'''
+import csv
+import math
+import struct
+import logging
+from bisect import bisect_right
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'F4TZ'
+VERSION = 1
+_HEADER = struct.Struct('>4sBdd')       # magic, version, scale, deadband
+_RECORD = struct.Struct('>HI')          # key length, blob length
+ARCHIVE = b'F4TA'
+
+class SwingingDoor:
+    '''streaming swinging-door encoder for one series
+
+       add() returns the points archived by that sample (usually none);
+       flush() returns the final point. Points are (t_ms, value_int).
+    '''
+
+    def __init__(self, deadband, scale = 100.0):
+        self.deadband = deadband
+        self.scale = scale
+        self._band = deadband * scale           # deadband in value units
+        self._anchor = None                     # last archived point
+        self._last = None                       # last raw point seen
+        self._lower = -math.inf
+        self._upper = math.inf
+
+    def _slopes(self, t, v):
+        ta, va = self._anchor
+        dt = t - ta
+        return (v - self._band - va) / dt, (v + self._band - va) / dt
+
+    def add(self, t, value):
+        if value is None or value != value:     # None or NaN
+            return []
+        t = int(round(t * 1000))
+        v = value * self.scale
+        if self._anchor is None:
+            self._anchor = (t, int(round(v)))
+            return [self._anchor]
+        if t <= self._anchor[0] or (self._last and t <= self._last[0]):
+            return []                           # duplicate time stamp
+        lo, hi = self._slopes(t, v)
+        lower = max(self._lower, lo)
+        upper = min(self._upper, hi)
+        if lower <= upper:
+            self._lower, self._upper = lower, upper
+            self._last = (t, v)
+            return []
+        # door closed: archive the previous sample on a line that fits
+        # every sample since the anchor, then restart from it
+        point = self._close()
+        self._lower, self._upper = self._slopes(t, v)
+        self._last = (t, v)
+        return [point]
+
+    def _close(self):
+        ta, va = self._anchor
+        t, _ = self._last
+        slope = (self._lower + self._upper) / 2.0
+        point = (t, int(round(va + slope * (t - ta))))
+        self._anchor = point
+        self._last = None
+        self._lower, self._upper = -math.inf, math.inf
+        return point
+
+    def flush(self):
+        '''archive the pending tail of the series
+        '''
+        if self._last is None:
+            return []
+        return [self._close()]
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+def _unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+def _put_varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _get_varint(data, pos):
+    shift = result = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def pack(points, scale = 100.0, deadband = 0.0):
+    '''serialize archived (t_ms, value_int) points
+    '''
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, scale, deadband))
+    _put_varint(out, len(points))
+    pt = pv = 0
+    for t, v in points:
+        _put_varint(out, _zigzag(t - pt))
+        _put_varint(out, _zigzag(v - pv))
+        pt, pv = t, v
+    return bytes(out)
+
+def unpack(blob):
+    '''deserialize to (times in seconds, values, scale, deadband)
+    '''
+    magic, version, scale, deadband = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not an F4T compressed series')
+    count, pos = _get_varint(blob, _HEADER.size)
+    times, values = [], []
+    t = v = 0
+    for _ in range(count):
+        dt, pos = _get_varint(blob, pos)
+        dv, pos = _get_varint(blob, pos)
+        t += _unzigzag(dt)
+        v += _unzigzag(dv)
+        times.append(t / 1000.0)
+        values.append(v / scale)
+    return times, values, scale, deadband
+
+def compress(times, values, deadband, scale = 100.0):
+    '''compress one recorded series to bytes
+    '''
+    enc = SwingingDoor(deadband, scale)
+    points = []
+    for t, v in zip(times, values):
+        points.extend(enc.add(t, v))
+    points.extend(enc.flush())
+    return pack(points, scale, deadband)
+
+def densify(times, values, query):
+    '''linear interpolation of kept points at the (sorted) query times;
+       times outside the recorded span get the nearest end value
+    '''
+    if not times:
+        return [math.nan] * len(query)
+    out = []
+    n = len(times)
+    i = 0
+    ordered = all(a <= b for a, b in zip(query, query[1:]))
+    for q in query:
+        if ordered:
+            while i < n and times[i] <= q:
+                i += 1
+        else:
+            i = bisect_right(times, q)
+        if i == 0:
+            out.append(values[0])
+        elif i == n:
+            out.append(values[-1])
+        else:
+            t0, t1 = times[i - 1], times[i]
+            v0, v1 = values[i - 1], values[i]
+            out.append(v0 + (v1 - v0) * (q - t0) / (t1 - t0))
+    return out
+
+def decompress(blob, query = None, period = None):
+    '''decode a compressed series
+
+       query:  times to rebuild the series at
+       period: rebuild on a regular grid with this step (seconds)
+       returns (times, values); the kept points when neither is given
+    '''
+    times, values, _, _ = unpack(blob)
+    if query is None and period is not None and times:
+        steps = int((times[-1] - times[0]) / period) + 1
+        query = [times[0] + k * period for k in range(steps)]
+    if query is None:
+        return times, values
+    return list(query), densify(times, values, query)
+
+def compress_many(series, deadbands, scale = 100.0, default = 0.1):
+    '''compress several series, e.g. keyed by (chamber, loop)
+
+       series:    {key: (times, values)}
+       deadbands: {key: deadband}; keys not listed use default
+    '''
+    return {key: compress(t, v, deadbands.get(key, default), scale)
+            for key, (t, v) in series.items()}
+
+def _deadband(deadbands, chamber, field, default):
+    if (chamber, field) in deadbands:
+        return deadbands[(chamber, field)]
+    return deadbands.get(field, default)
+
+def compress_log(path, deadbands = None, scale = 100.0, default = 0.1):
+    '''compress a SampleWriter CSV log (t, chamber, field, value)
+
+       deadbands maps (chamber, field) or field (e.g. 'L1 PV') to the
+       deadband for that series. Non-numeric values (outputs, errors)
+       are skipped. Returns {(chamber, field): bytes}.
+    '''
+    deadbands = deadbands or {}
+    encoders = {}
+    points = {}
+    with open(path, newline = '') as fp:
+        for row in csv.reader(fp):
+            try:
+                t, chamber, field, value = row
+                t, value = float(t), float(value)
+            except ValueError:
+                continue                        # header or non-numeric
+            key = (chamber, field)
+            enc = encoders.get(key)
+            if enc is None:
+                enc = encoders[key] = SwingingDoor(
+                    _deadband(deadbands, chamber, field, default), scale)
+                points[key] = []
+            points[key].extend(enc.add(t, value))
+    return {key: pack(points[key] + enc.flush(), scale, enc.deadband)
+            for key, enc in encoders.items()}
+
+def write_archive(path, blobs):
+    '''store {(chamber, field): bytes} in one archive file
+    '''
+    with open(path, 'wb') as fp:
+        fp.write(ARCHIVE)
+        for (chamber, field), blob in sorted(blobs.items()):
+            key = f'{chamber}\t{field}'.encode()
+            fp.write(_RECORD.pack(len(key), len(blob)))
+            fp.write(key)
+            fp.write(blob)
+
+def read_archive(path):
+    '''load an archive written by write_archive()
+    '''
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if data[:len(ARCHIVE)] != ARCHIVE:
+        raise ValueError(f'{path}: not an F4T archive')
+    blobs = {}
+    pos = len(ARCHIVE)
+    while pos < len(data):
+        klen, blen = _RECORD.unpack_from(data, pos)
+        pos += _RECORD.size
+        chamber, field = data[pos:pos + klen].decode().split('\t', 1)
+        pos += klen
+        blobs[(chamber, field)] = data[pos:pos + blen]
+        pos += blen
+    return blobs
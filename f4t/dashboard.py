@@ -0,0 +1,264 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: dashboard.py
+
+Live terminal dashboard for one or many F4T chambers.
+
+Acquisition runs in one background poller thread per chamber, each reading
+PV/SP of the selected loops, the cascade values and the event output states
+in a single pipelined exchange per refresh. The screen is driven by a curses
+event loop that never blocks on input: keys are read with a timeout, and
+only cells whose text changed are redrawn, which keeps the traffic small
+enough for 50 chambers over SSH.
+
+Keys: q quit, + / - faster / slower polling, space freeze display,
+      up / down / page up / page down scroll
+'''
+import os
+import time
+import logging
+import threading
+import contextlib
+from f4tscpi.planner import plan_keys
+from f4tscpi.f4t_interface import OUTPUTS
+
+try:
+    import curses
+except ImportError:             # e.g. Windows without windows-curses
+    curses = None
+
+LOG = logging.getLogger(__name__)
+
+RATES = (0.2, 0.5, 1.0, 2.0, 5.0, 10.0)     # polling rates in Hz
+
+def field_keys(loops, cascade = False, outputs = True, errors = False):
+    '''(name, catalog key, index) for every value shown per chamber;
+       errors adds the controller's ERROR? flag of each loop
+    '''
+    keys = []
+    for loop in loops:
+        keys.append((f'L{loop} PV', ':SOURCE:CLOOP#:PVALUE?', (loop,)))
+        keys.append((f'L{loop} SP', ':SOURCE:CLOOP#:SPOINT?', (loop,)))
+        if errors:
+            keys.append((f'L{loop} ERR', ':SOURCE:CLOOP#:ERROR?', (loop,)))
+    if cascade:
+        keys.append(('Out PV', ':SOURCE:CASCADE#:OUTER:PVALUE?', (1,)))
+        keys.append(('In PV', ':SOURCE:CASCADE#:INNER:PVALUE?', (1,)))
+        keys.append(('Cas SP', ':SOURCE:CASCADE#:SPOINT?', (1,)))
+        keys.append(('In SP', ':SOURCE:CASCADE#:INNER:SPOINT?', (1,)))
+        if errors:
+            keys.append(('Out ERR', ':SOURCE:CASCADE#:OUTER:ERROR?', (1,)))
+            keys.append(('In ERR', ':SOURCE:CASCADE#:INNER:ERROR?', (1,)))
+    if outputs:
+        for num in OUTPUTS:
+            keys.append((f'O{num}', ':OUTPUT#:STATE?', (num,)))
+    return keys
+
+class ChamberPoller(threading.Thread):
+    '''background acquisition for one chamber
+
+       values holds the latest parsed reading per field name; stamp is the
+       time of the last complete exchange and error the last failure.
+       Each callable in listeners is called with the poller after every
+       successful poll (e.g. SampleWriter.listener); keep them fast.
+       A failed poll closes dev unless owned is False (a session the
+       caller keeps using); connect() is called again either way.
+    '''
+
+    def __init__(self, name, connect, keys, rate = 1.0):
+        super().__init__(name = f'poll-{name}', daemon = True)
+        self.chamber = name
+        self.connect = connect
+        self.keys = keys
+        self.rate = rate
+        self.values = {}
+        self.stamp = None
+        self.error = None
+        self.dev = None
+        self.owned = True
+        self.listeners = []
+        self._halt = threading.Event()
+        self.plan = plan_keys(keys)
+
+    def stop(self):
+        self._halt.set()
+
+    def poll(self):
+        '''one planned read of every field
+        '''
+        self.values = self.plan.execute(self.dev, budget = max(
+            1.0 / self.rate, self.dev.timeout or 0), retries = 0)
+        self.stamp = time.time()
+        self.error = None
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception:
+                LOG.exception('%s: listener failed', self.chamber)
+
+    def run(self):
+        while not self._halt.is_set():
+            start = time.monotonic()
+            try:
+                if self.dev is None:
+                    self.dev = self.connect()
+                self.poll()
+            except Exception as exc:
+                LOG.debug('%s: %s', self.chamber, exc)
+                self.error = str(exc) or exc.__class__.__name__
+                if self.dev is not None and self.owned:
+                    self.dev.close()
+                self.dev = None
+            wait = 1.0 / self.rate - (time.monotonic() - start)
+            self._halt.wait(max(wait, 0.0) if self.error is None
+                            else max(wait, 2.0))
+
+def _is_output(name):
+    '''event output column ('O1'..'O7'), not e.g. 'Out ERR'
+    '''
+    return name[0] == 'O' and name[1:].isdigit()
+
+class Dashboard:
+    '''curses view over a set of ChamberPollers
+    '''
+
+    def __init__(self, pollers, fps = 4.0):
+        self.pollers = pollers
+        self.fps = fps
+        self.frozen = False
+        self.top = 0
+        self._cells = {}
+        # union of the fields of all chambers, in field_keys order
+        order = [name for name, _, _ in field_keys(range(1, 5), True, True,
+                                                   True)]
+        found = {name for poller in pollers for name, _, _ in poller.keys}
+        names = [name for name in order if name in found]
+        self.columns = [('Chamber', 16)]
+        self.columns += [(name, 2 if _is_output(name) else 8)
+                         for name in names]
+        self.columns += [('Age', 6)]
+
+    def _text(self, poller, name, width):
+        if name == 'Chamber':
+            return poller.chamber[:width - 1]
+        if name == 'Age':
+            if poller.error is not None:
+                return 'DOWN'
+            if poller.stamp is None:
+                return '...'
+            return f'{time.time() - poller.stamp:5.1f}'
+        value = poller.values.get(name)
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return f'{value:7.2f}'
+        if _is_output(name):
+            return '*' if value == 'ON' else '.'
+        return str(value)[:width - 1]
+
+    def _put(self, scr, row, col, text, width, attr = 0):
+        '''write a cell only when its text changed
+        '''
+        text = text.ljust(width)[:width]
+        if self._cells.get((row, col)) == (text, attr):
+            return
+        self._cells[(row, col)] = (text, attr)
+        try:
+            scr.addstr(row, col, text, attr)
+        except curses.error:
+            pass        # bottom-right corner or off screen
+
+    def draw(self, scr):
+        height, width = scr.getmaxyx()
+        rate = self.pollers[0].rate if self.pollers else 0
+        status = (f' {len(self.pollers)} chamber(s)  {rate:g} Hz'
+                  f'{"  [frozen]" if self.frozen else ""}'
+                  '   q:quit +/-:rate space:freeze')
+        self._put(scr, 0, 0, status, width - 1, curses.A_REVERSE)
+        col = 0
+        for name, size in self.columns:
+            if col + size >= width:
+                break
+            self._put(scr, 1, col, name, size, curses.A_BOLD)
+            col += size + 1
+        rows = max(height - 2, 0)
+        for i in range(rows):
+            row = i + 2
+            idx = self.top + i
+            col = 0
+            poller = self.pollers[idx] if idx < len(self.pollers) else None
+            for name, size in self.columns:
+                if col + size >= width:
+                    break
+                text = self._text(poller, name, size) if poller else ''
+                attr = 0
+                if poller is not None and poller.error is not None:
+                    attr = curses.A_DIM
+                self._put(scr, row, col, text, size, attr)
+                col += size + 1
+        scr.noutrefresh()
+        curses.doupdate()
+
+    def key(self, scr, ch):
+        '''handle one key; returns False to quit
+        '''
+        height = scr.getmaxyx()[0]
+        page = max(height - 3, 1)
+        if ch in (ord('q'), ord('Q')):
+            return False
+        if ch in (ord('+'), ord('-')):
+            rate = self.pollers[0].rate if self.pollers else 1.0
+            pos = min(range(len(RATES)), key = lambda i: abs(RATES[i] - rate))
+            pos = min(pos + 1, len(RATES) - 1) if ch == ord('+') \
+                else max(pos - 1, 0)
+            for poller in self.pollers:
+                poller.rate = RATES[pos]
+        elif ch == ord(' '):
+            self.frozen = not self.frozen
+        elif ch == curses.KEY_DOWN:
+            self.top = min(self.top + 1, max(len(self.pollers) - 1, 0))
+        elif ch == curses.KEY_UP:
+            self.top = max(self.top - 1, 0)
+        elif ch == curses.KEY_NPAGE:
+            self.top = min(self.top + page, max(len(self.pollers) - 1, 0))
+        elif ch == curses.KEY_PPAGE:
+            self.top = max(self.top - page, 0)
+        elif ch == curses.KEY_RESIZE:
+            self._cells.clear()
+            scr.erase()
+        return True
+
+    def loop(self, scr):
+        '''event loop: redraw on a fixed frame period, react to keys
+           immediately, never wait on the chambers
+        '''
+        curses.curs_set(0)
+        scr.keypad(True)
+        period = 1.0 / self.fps
+        due = time.monotonic()
+        running = True
+        while running:
+            now = time.monotonic()
+            if now >= due:
+                if not self.frozen:
+                    self.draw(scr)
+                due = now + period
+            scr.timeout(max(int((due - time.monotonic()) * 1000), 0))
+            ch = scr.getch()
+            if ch != -1:
+                running = self.key(scr, ch)
+                self.draw(scr)
+
+def run(acquisition, fps = 4.0):
+    '''start an Acquisition (see acquisition.py) and show the dashboard
+       over its pollers until 'q'
+    '''
+    if curses is None:
+        raise RuntimeError('the dashboard needs the curses module '
+                           '(pip install windows-curses on Windows)')
+    # the library prints connection messages; keep them off the screen
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null), \
+         acquisition:
+        curses.wrapper(Dashboard(acquisition.pollers, fps).loop)
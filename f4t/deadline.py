@@ -0,0 +1,50 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: deadline.py
+
+Helpers for bounded-latency queries: round-trip latency tracking (for the
+hedging threshold) and jittered exponential backoff between retries.
+'''
+import random
+import logging
+import threading
+from collections import deque
+
+LOG = logging.getLogger(__name__)
+
+class LatencyTracker:
+    '''sliding record of the last size round-trip times (seconds)
+    '''
+
+    def __init__(self, size = 200, min_samples = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen = size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        '''latency at percentile p (0-1); None until min_samples are in
+        '''
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        idx = min(int(p * len(ordered)), len(ordered) - 1)
+        return ordered[idx]
+
+    @property
+    def last(self):
+        return self._samples[-1] if self._samples else None
+
+def backoff(attempt, base = 0.05, cap = 1.0):
+    '''full-jitter exponential backoff delay for retry attempt (0-based)
+    '''
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
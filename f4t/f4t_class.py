@@ -8,14 +8,42 @@ Class implementation for Watlow F4T direct communication interface
 using built-in Python Library. 
 
 '''
+import time
 import socket
 import struct
+import select
 import logging
+import threading
 from enum import Enum
 from atexit import register, unregister
+from f4tscpi.health import Health, MONITOR
+from f4tscpi.deadline import LatencyTracker, backoff
 
 LOG = logging.getLogger(__name__)
 BUFFER_SIZE = 10        # set buffer size for transmission through the socket
+RECV_SIZE = 4096        # chunk size for buffered line reads (pipelined replies)
+PROBE_TIMEOUT = 2.0     # timeout of health probes when no timeout is set
+
+class F4TError(Exception):
+    '''base class of communication errors with an F4T
+    '''
+
+class F4TTimeout(F4TError, TimeoutError):
+    '''the F4T did not answer within the timeout
+    '''
+
+class F4TConnectionError(F4TError, ConnectionError):
+    '''the connection to the F4T failed or was closed
+    '''
+
+class F4TProtocolError(F4TError):
+    '''the F4T sent a reply that cannot be decoded
+    '''
+
+class F4TUnavailable(F4TError):
+    '''the F4T is marked down by its circuit breaker; the call was not
+       attempted
+    '''
 
 class Controller:
     '''Set up a generic socket for device connection
@@ -25,58 +53,361 @@ class Controller:
     def source_dev(subcls, dev):
         '''generating new instances of objects from factory function 
         for different subclasses
+
+        The new instance shares the session of dev: connection, id,
+        caches, lock and instrumentation. No I/O is done; the
+        connection is closed when the last instance sharing it goes.
         '''
-        assert issubclass(subcls, dev)
-        return subcls(dev.host, dev.port, conn = dev._conn, id = dev._id)
+        if not isinstance(dev, Controller):
+            raise TypeError(f'{dev!r} is not a Controller')
+        view = object.__new__(subcls)
+        view.__dict__ = dev.__dict__
+        with dev.lock:
+            dev._sharers += 1
+        return view
 
     def __init__(self, host, port = 5025, timeout = None, *args, **kwargs):
         self._host = host
         self._port = port
         self.timeout = timeout
-        print (f'Connecting to F4T at: {host}:{port}')
-        self._conn = kwargs.get('conn', socket.create_connection((self._host, 
-                                               self._port), timeout = timeout))
+        conn = kwargs.get('conn')
+        if conn is None:
+            print (f'Connecting to F4T at: {host}:{port}')
+            conn = socket.create_connection((self._host, self._port),
+                                            timeout = timeout)
+        self._conn = conn
+        self._sharers = 1               # instances sharing this session
+        self.lock = threading.RLock()   # one exchange at a time
         self.f4t_id = kwargs.get('id', None)
         self.encoding = kwargs.get('encoding', 'ascii')
         self.EOL = struct.pack('>B', 10)
+        self._rx = bytearray()
+        self._desync = False
+        self._closed = False
+        self.latency = LatencyTracker()
+        self.hedge_percentile = kwargs.get('hedge_percentile', 0.95)
+        self.hedges = 0                 # hedged requests sent
+        self.hedges_won = 0             # ... answered first on the hedge
+        self.health = Health(f'{host}:{port}',
+                    failure_threshold = kwargs.get('failure_threshold', 3),
+                    probe_interval = kwargs.get('probe_interval', 5.0))
         if self.f4t_id is None:
             self.get_id()
         register(self._conn.close)
 
     def clear_buffer(self):
-        '''clear reading buffer after each attempt
+        '''discard stale replies: buffered bytes and whatever has already
+           arrived on the socket (does not wait for more)
         '''
-        self._conn.settimeout(self.timeout)
+        self._check()
+        self._rx.clear()
+        self._conn.settimeout(0)
         try:
-            res = self._conn.recv(BUFFER_SIZE)
-        except socket.timeout:
+            while self._conn.recv(BUFFER_SIZE):
+                pass
+        except (BlockingIOError, socket.timeout):
             pass
+        except OSError as exc:
+            self._fail(F4TConnectionError, exc)
+        finally:
+            self._conn.settimeout(self.timeout)
 
     def read_items(self):
         '''read items from target device
+
+           raises F4TTimeout or F4TConnectionError when no reply arrives
+        '''
+        return self.read_line()
+
+    def read_line(self, deadline = None):
+        '''read one reply line from target device
+
+           Bytes received past the end of the line are kept for the
+           next read, so replies to pipelined queries are never merged.
+           The timeout bounds the whole line, not each fragment of it;
+           deadline (time.monotonic() value) overrides it.
+        '''
+        if deadline is None and self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        while True:
+            idx = self._rx.find(self.EOL)
+            if idx >= 0:
+                line = self._decode(bytes(self._rx[:idx]))
+                del self._rx[:idx + 1]
+                self.health.success()
+                return line
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._fail(F4TTimeout, 'deadline exceeded')
+                self._conn.settimeout(remaining)
+            try:
+                chunk = self._conn.recv(RECV_SIZE)
+            except socket.timeout:
+                self._fail(F4TTimeout, 'no reply within timeout')
+            except OSError as exc:
+                self._fail(F4TConnectionError, exc)
+            if not chunk:
+                self._fail(F4TConnectionError, 'connection closed by F4T')
+            self._rx.extend(chunk)
+
+    def _decode(self, line):
+        '''reply text of a raw line; undecodable bytes fail the exchange
+        '''
+        try:
+            return line.decode(self.encoding).strip()
+        except UnicodeDecodeError as exc:
+            self._fail(F4TProtocolError, f'undecodable reply: {exc}')
+
+    def _fail(self, error, reason):
+        '''record a failed exchange and raise error
+
+           The connection is out of step with the controller (late
+           replies may still arrive), so it is replaced before next use.
+        '''
+        self._rx.clear()
+        self._desync = True
+        if self.health.failure(reason):
+            MONITOR.watch(self)
+        raise error(f'{self._host}:{self._port}: {reason}')
+
+    def _check(self):
+        '''fail fast while the chamber is down; replace a connection
+           that is out of step
+        '''
+        if self.health.is_down:
+            raise F4TUnavailable(f'{self._host}:{self._port} is down '
+                                 f'({self.health.last_error})')
+        if self._desync:
+            self._reconnect()
+
+    def _write(self, data):
+        '''send raw bytes to the device
+        '''
+        self._check()
+        try:
+            self._conn.sendall(data)
+        except OSError as exc:
+            self._fail(F4TConnectionError, exc)
+
+    def _connect(self, timeout = None):
+        try:
+            return socket.create_connection((self._host, self._port),
+                                            timeout = timeout or self.timeout)
+        except OSError as exc:
+            self._fail(F4TConnectionError, exc)
+
+    def _swap(self, conn):
+        '''replace the connection with a fresh one
         '''
-        msg = 'FAILED'.encode()
+        old, self._conn = self._conn, conn
+        unregister(old.close)
+        register(conn.close)
+        self._rx = bytearray()
+        self._desync = False
         try:
-            msg = bytearray(self._conn.recv(BUFFER_SIZE))
-            while msg[-1] != ord(self.EOL):
-                msg.extend(self._conn.recv(BUFFER_SIZE))
-        except socket.timeout:
+            old.close()
+        except OSError:
             pass
-        return msg.decode(self.encoding).strip()
+
+    def _reconnect(self):
+        self._swap(self._connect())
+
+    def probe(self):
+        '''check a chamber marked down: *IDN? on a fresh connection;
+           on success the connection is kept and the chamber is up again
+        '''
+        timeout = self.timeout or PROBE_TIMEOUT
+        try:
+            conn = socket.create_connection((self._host, self._port),
+                                            timeout = timeout)
+        except OSError as exc:
+            self.health.failure(exc)
+            return False
+        try:
+            conn.sendall(b'*IDN?' + self.EOL)
+            reply = bytearray()
+            while not reply.endswith(self.EOL):
+                chunk = conn.recv(RECV_SIZE)
+                if not chunk:
+                    raise ConnectionError('connection closed by F4T')
+                reply.extend(chunk)
+        except OSError as exc:
+            conn.close()
+            self.health.failure(exc)
+            return False
+        conn.settimeout(self.timeout)
+        with self.lock:
+            if self._closed:            # closed while probing: stay closed
+                conn.close()
+                return True
+            self._swap(conn)
+            self.health.recover()
+        return True
+
+    def accept_silence(self):
+        '''undo the failure of a timeout that was the expected answer
+           (a query the controller never replies to, e.g. an absent
+           node): keep the connection, drop whatever has arrived and
+           clear the failure from health
+        '''
+        with self.lock:
+            self._desync = False
+            self.health.recover()
+            self.clear_buffer()
 
     def send_cmd(self, cmd:str):
         '''issue command request to device
         '''
-        self._conn.send(cmd.encode(self.encoding) + self.EOL)
+        with self.lock:
+            self._write(cmd.encode(self.encoding) + self.EOL)
+
+    def query(self, cmd:str):
+        '''issue a query and return its reply
+        '''
+        with self.lock:
+            self.send_cmd(cmd)
+            return self.read_items()
+
+    def pipeline(self, cmds, budget = None):
+        '''issue several commands in a single write and collect the
+           replies of the queries among them, in order
+
+           Commands are sent one per line; each line containing a query
+           ('?') yields exactly one reply line. budget (seconds) bounds
+           the whole exchange; without it each reply gets the timeout.
+        '''
+        cmds = list(cmds)
+        if not cmds:
+            return []
+        deadline = None if budget is None else time.monotonic() + budget
+        with self.lock:
+            self._write(b''.join(cmd.encode(self.encoding) + self.EOL
+                                 for cmd in cmds))
+            return [self.read_line(deadline) for cmd in cmds if '?' in cmd]
+
+    def read(self, cmds, budget = None, retries = 2, hedge = False):
+        '''idempotent read of one or more queries with an end-to-end
+           deadline
+
+           budget:  seconds for the whole call including retries
+                    (default: the timeout per reply)
+           retries: extra attempts after a timeout, connection error or
+                    corrupted reply,
+                    separated by jittered backoff, within budget
+           hedge:   when the first connection has not answered by the
+                    hedge_percentile round-trip time, send the same
+                    request on a second connection and take the first
+                    complete answer
+        '''
+        cmds = [cmds] if isinstance(cmds, str) else list(cmds)
+        if not all(cmd.rstrip().endswith('?') for cmd in cmds):
+            raise ValueError('read() is for queries only')
+        if budget is None and self.timeout is not None:
+            budget = self.timeout * len(cmds)
+        deadline = None if budget is None else time.monotonic() + budget
+        data = b''.join(cmd.encode(self.encoding) + self.EOL for cmd in cmds)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                after = self.latency.percentile(self.hedge_percentile) \
+                        if hedge else None
+                with self.lock:
+                    if after is not None and deadline is not None:
+                        replies = self._hedged(data, len(cmds), deadline,
+                                               after)
+                    else:
+                        self._write(data)
+                        replies = [self.read_line(deadline) for _ in cmds]
+                self.latency.add(time.monotonic() - start)
+                return replies
+            except (F4TTimeout, F4TConnectionError, F4TProtocolError) as exc:
+                if attempt >= retries:
+                    raise
+                delay = backoff(attempt)
+                if deadline is not None and \
+                   time.monotonic() + delay >= deadline:
+                    raise
+                LOG.debug('%s: retry %d after %s', self._host, attempt + 1,
+                          exc)
+                attempt += 1
+                time.sleep(delay)
+
+    def _hedged(self, data, count, deadline, after):
+        '''send data, and again on a second connection if no complete
+           answer arrived within after seconds; the connection that
+           answers first becomes the primary, the other one is closed
+        '''
+        self._write(data)
+        hedge_at = time.monotonic() + after
+        bufs = {self._conn: self._rx}
+        while True:
+            for conn, buf in bufs.items():
+                if buf.count(self.EOL) >= count:
+                    return self._take(conn, buf, count, bufs)
+            now = time.monotonic()
+            if now >= deadline:
+                for conn in bufs:
+                    if conn is not self._conn:
+                        conn.close()
+                self._fail(F4TTimeout, 'deadline exceeded')
+            if len(bufs) == 1 and now >= hedge_at:
+                try:
+                    conn = socket.create_connection(
+                        (self._host, self._port), timeout = deadline - now)
+                    conn.sendall(data)
+                    bufs[conn] = bytearray()
+                    self.hedges += 1
+                except OSError as exc:
+                    LOG.debug('%s: hedge failed: %s', self._host, exc)
+                    hedge_at = deadline
+            wait = (hedge_at if len(bufs) == 1 else deadline) - now
+            ready, _, _ = select.select(list(bufs), [], [], max(wait, 0))
+            for conn in ready:
+                try:
+                    chunk = conn.recv(RECV_SIZE)
+                except OSError:
+                    chunk = b''
+                if chunk:
+                    bufs[conn].extend(chunk)
+                elif conn is self._conn:
+                    self._fail(F4TConnectionError, 'connection closed by F4T')
+                else:
+                    del bufs[conn]
+                    conn.close()
+
+    def _take(self, conn, buf, count, bufs):
+        if conn is not self._conn:
+            self.hedges_won += 1
+            self._swap(conn)
+        self._rx = buf
+        for other in bufs:
+            if other is not conn:
+                other.close()
+        replies = []
+        for _ in range(count):
+            idx = self._rx.find(self.EOL)
+            replies.append(self._decode(bytes(self._rx[:idx])))
+            del self._rx[:idx + 1]
+        self.health.success()
+        return replies
 
     def __del__(self):
-        unregister(self._conn.close)
-        self._conn.close()
+        conn = getattr(self, '_conn', None)     # None if connect failed
+        if conn is None:
+            return
+        self._sharers -= 1
+        if self._sharers <= 0:
+            unregister(conn.close)
+            conn.close()
 
     def close(self):
         '''
         Close the physical interface
         '''
+        self._closed = True
+        MONITOR.unwatch(self)
         try:
             self._conn.close()
         except Exception:
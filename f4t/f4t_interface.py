@@ -7,12 +7,30 @@
 Upper level interface for Watlow F4T controller; control implementation 
 for communication via SCPI register, unregister using built-in Python Library.
 '''
-import time
 import logging
 from f4tscpi.f4t_class import Controller, TempUnits, RampScale
+from f4tscpi.profiles import read_profiles
+from f4tscpi.scpi import command, encode, parse
+from f4tscpi.planner import read_keys
+from f4tscpi.views import LoopView, CascadeView, OutputGroup
+from f4tscpi.program import ProgramControl
 
 LOG = logging.getLogger(__name__)
 
+_, _LO, _HI = command(':OUTPUT#:STATE?').index[0]
+OUTPUTS = range(_LO, _HI + 1)           # event outputs 1-7
+ALL_OUTPUTS = (1 << len(OUTPUTS)) - 1   # bitmask selecting every output
+
+def mask_to_tuple(mask):
+    '''output bitmask -> tuple of booleans, output 1 first
+    '''
+    return tuple(bool(mask >> bit & 1) for bit in range(len(OUTPUTS)))
+
+def tuple_to_mask(states):
+    '''sequence of booleans (output 1 first) -> output bitmask
+    '''
+    return sum(1 << bit for bit, on in enumerate(states) if on)
+
 class F4T(Controller):
 #    def __init__(self, set_point:float = 22.0, 
 #                 units:TempUnits = TempUnits.C, profile:int = 1, *args, **kwargs):
@@ -31,22 +49,52 @@ class F4T(Controller):
             self.timeout = 1.5
         self.profiles = {}
 
+    def loop(self, number):
+        '''view of control loop number on this session (no I/O)
+        '''
+        return LoopView(self, number)
+
+    def cascade(self, number = 1):
+        '''view of the cascade loop on this session (no I/O)
+        '''
+        return CascadeView(self, number)
+
+    def output_group(self, *outputs):
+        '''view of event outputs read and written together (no I/O);
+           all outputs when none are given
+        '''
+        return OutputGroup(self, outputs or OUTPUTS)
+
+    def watch(self, rules = None, **kwargs):
+        '''change-only subscription polling this session in the background
+           (see watch.py)
+        '''
+        from f4tscpi.watch import watch
+        return watch(self, rules, **kwargs)
+
+    def schedule(self, fields, **kwargs):
+        '''started Scheduler polling fields at their own periods on this
+           session (see scheduler.py)
+        '''
+        from f4tscpi.scheduler import Scheduler
+        scheduler = Scheduler(self, fields, **kwargs)
+        scheduler.start()
+        return scheduler
+
     def get_id(self):
         '''reading device id and info
         '''
-        self.clear_buffer()
-        time.sleep(0.5) 
-        self.send_cmd('*IDN?')
-        self.f4t_id = self.read_items()
-        return self.f4t_id 
+        with self.lock:
+            self.clear_buffer()
+            self.f4t_id = self.query(encode('*IDN?'))
+        return self.f4t_id
 
     def get_units(self):
         '''probe controller for current set units
         '''
-        self.clear_buffer()
-        time.sleep(0.5)
-        self.send_cmd(':UNIT:TEMPERATURE?')
-        rsp = self.read_items()
+        with self.lock:
+            self.clear_buffer()
+            rsp = self.query(encode(':UNIT:TEMPERATURE?'))
         self.temp_units = TempUnits(rsp)   
         return self.temp_units
 
@@ -60,30 +108,48 @@ class F4T(Controller):
             print (f'Current unit is: {units} \nRecommend using this unit.')
             pass 
         else: 
-            self.send_cmd(f':UNITS:TEMPERATURE{TempUnits.C.name}')
+            self.send_cmd(encode(':UNIT:TEMPERATURE', value = TempUnits.C))
             print (f'Unit is now set in: {TempUnits.C}')
 
     def get_profiles(self):
         '''set max limit for profile list
+
+           all slot names are read in one pipelined exchange; the list
+           ends at the first empty slot
         '''
-        for i in range(1, 40):
-            self.select_profile(i)
-            time.sleep(0.5)
-            self.send_cmd(':PROGRAM:NAME?')
-            time.sleep(0.5)
-            name = self.read_items().strip().replace('"','')
-            if name:
-                self.profiles[i] = name
-            else:
+        found = read_profiles(self)
+        self.profiles = {}
+        for i in sorted(found):
+            if i != len(self.profiles) + 1:
                 break
+            self.profiles[i] = found[i]
+        return self.profiles
+
+    @property
+    def program(self):
+        '''program control state machine of this session (see program.py)
+        '''
+        control = self.__dict__.get('_program')
+        if control is None:
+            control = self.__dict__.setdefault('_program',
+                                               ProgramControl(self))
+        return control
 
     def select_profile(self, profile: int):
         '''
            set range of limit for profiles on list to be read
            profile number must be: 1 =< or =< 40
+           (no I/O when the profile is already selected)
         '''
-        self.send_cmd(f':PROGRAM:NUMBER {profile}')
-    
+        self.program.select(profile)
+
+    def select_step(self, step: int):
+        '''select the step of the selected profile
+           step number must be: 1 =< or =< 50
+        '''
+        self.send_cmd(encode(':PROGRAM:STEP', value = step))
+        self.program.step = step
+
     def prog_mode(self, mode):
         '''a method with to control profile action
            and its programming mode:
@@ -97,7 +163,7 @@ class F4T(Controller):
            - state: resume
              resume the state of currently paused program.
         '''
-        self.send_cmd(f':PROGRAM:SELECTED:STATE {mode}')
+        self.program.command(mode)
 
     def get_pv(self, loop):
         '''read temperature and humidity process values from controller
@@ -106,9 +172,9 @@ class F4T(Controller):
            TempPV: loop = 1
            HumiPV: loop = 2
         '''
-        self.clear_buffer() 
-        self.send_cmd(f':SOURCE:CLOOP{loop}:PVALUE?')
-        return self.read_items()
+        with self.lock:
+            self.clear_buffer()
+            return self.query(encode(':SOURCE:CLOOP#:PVALUE?', loop))
 
     def get_sp(self, loop):
         '''read temperature and humidity set point values from controller
@@ -117,14 +183,12 @@ class F4T(Controller):
            TempSP: loop = 1
            HumiSP: loop = 2
         '''
-        self.send_cmd(f':SOURCE:CLOOP{loop}:SPOINT?')
-        return self.read_items()
+        return self.query(encode(':SOURCE:CLOOP#:SPOINT?', loop))
 
     def get_cascadeSP(self, cascade = 1):
         '''read cascade set point value from controller
         '''
-        self.send_cmd(f':SOURCE:CASCADE{cascade}:SPOINT?')
-        return self.read_items()
+        return self.query(encode(':SOURCE:CASCADE#:SPOINT?', cascade))
 
     def get_cascadeLoopPV(self, loop, cascade = 1):
         '''read cascade outer loop process value from controller
@@ -133,8 +197,8 @@ class F4T(Controller):
            cascade inner loop PV: innerPV
         '''
         sloop = "OUTER" if loop else "INNER"  
-        self.send_cmd(f':SOURCE:CASCADE{cascade}:{sloop}:PVALUE?')
-        return self.read_items()
+        return self.query(encode(f':SOURCE:CASCADE#:{sloop}:PVALUE?',
+                                 cascade))
 
     def get_cascadeLoopSP(self, loop, cascade = 1):
         '''read cascade outer loop set point value from controller
@@ -143,8 +207,8 @@ class F4T(Controller):
            cascade inner loop SP: innerSP
         '''
         sloop = "OUTER" if loop else "INNER"  
-        self.send_cmd(f':SOURCE:CASCADE{cascade}:{sloop}:SPOINT?')
-        return self.read_items()
+        return self.query(encode(f':SOURCE:CASCADE#:{sloop}:SPOINT?',
+                                 cascade))
 
     def write_sp(self, val, loop):
         '''write temperature or humidity set point controller
@@ -153,36 +217,63 @@ class F4T(Controller):
            TempSP: loop 1
            HumiSP: loop 2 
         '''
-        self.send_cmd(f'SOURCE:CLOOP{loop}:SPOINT {val}')
+        self.send_cmd(encode(':SOURCE:CLOOP#:SPOINT', loop, value = val))
 
     def get_ts(self, ts_num):
         '''read the state of time signal output
         '''
-        self.send_cmd(f':OUTPUT{ts_num}:STATE?') 
-        time.sleep(0.5)
-        rsp = self.read_items()
+        rsp = self.query(encode(':OUTPUT#:STATE?', ts_num))
         print (f'Time Signal#{ts_num} : {rsp}')
-        pass
+        return rsp
 
     def set_output(self, ts_num):
         '''output of selected time signal will be set
            in opposite state of its current condition
         '''
-        self.send_cmd(f':OUTPUT{ts_num}:STATE?') 
-        time.sleep(0.5)
-        rsp = self.read_items()
+        rsp = self.query(encode(':OUTPUT#:STATE?', ts_num))
         state = "ON" if rsp == 'OFF' else "OFF"
-        time.sleep(0.5)
-        self.send_cmd(f':OUTPUT{ts_num}:STATE {state}')
+        self.send_cmd(encode(':OUTPUT#:STATE', ts_num, value = state))
+
+    def read_outputs(self, as_tuple = False):
+        '''read the state of all event outputs (1-7) in one exchange
+
+           returns a bitmask, bit 0 = output 1 (ON = 1), or a tuple of
+           booleans (output 1 first) with as_tuple
+        '''
+        states = read_keys(self, [(':OUTPUT#:STATE?', (num,))
+                                  for num in OUTPUTS])
+        mask = tuple_to_mask(state == 'ON' for state in states)
+        return mask_to_tuple(mask) if as_tuple else mask
+
+    def write_outputs(self, mask, select = ALL_OUTPUTS, confirm = False):
+        '''set event outputs in a single write
+
+           mask:    requested states, bit 0 = output 1 (1 = ON, 0 = OFF);
+                    a tuple/list of booleans is accepted as well
+           select:  bitmask of the outputs to write, others are untouched
+           confirm: read the states back in the same exchange and return
+                    the resulting mask
+        '''
+        if not isinstance(mask, int):
+            mask = tuple_to_mask(mask)
+        cmds = [encode(':OUTPUT#:STATE', num,
+                       value = 'ON' if mask >> (num - 1) & 1 else 'OFF')
+                for num in OUTPUTS if select >> (num - 1) & 1]
+        if not confirm:
+            self.pipeline(cmds)
+            return None
+        cmds += [encode(':OUTPUT#:STATE?', num) for num in OUTPUTS]
+        replies = self.pipeline(cmds)
+        return sum(1 << bit for bit, rsp in enumerate(replies)
+                   if parse(':OUTPUT#:STATE?', rsp) == 'ON')
 
     def get_tsName(self, ts_num):
         '''read the name of assigned time signal
         '''
-        self.send_cmd(f':OUTPUT{ts_num}:NAME?') 
-        time.sleep(0.5)
-        rsp = self.read_items()
+        rsp = parse(':OUTPUT#:NAME?', self.query(encode(':OUTPUT#:NAME?', 
+                                                        ts_num)))
         print (f'Name of Time Signal {ts_num} : {rsp}')
-        pass
+        return rsp
 
     def ramp_mode(self, mode, loop):
         '''set ramp mode: 
@@ -192,7 +283,7 @@ class F4T(Controller):
               mode: SETPOINT (apply setpoint change)
               mode: BOTH (apply both values silmultaneously)
         '''
-        self.send_cmd(f':SOURCE:CLOOP{loop}:RACTION {mode}')
+        self.send_cmd(encode(':SOURCE:CLOOP#:RACTION', loop, value = mode))
 
     def get_ramp(self, rampType, loop):
         '''get ramp mode in rate or time
@@ -203,9 +294,7 @@ class F4T(Controller):
            loop : [1,4]; loop = 1 : Temp, loop = 2 : Humi, etc 
         '''
         rateMode = 'RRATE' if rampType == 'rate' else 'RTIME'
-        self.send_cmd(f':SOURCE:CLOOP{loop}:{rateMode}?')
-        time.sleep(0.5)
-        rsp = self.read_items()
+        rsp = self.query(encode(f':SOURCE:CLOOP#:{rateMode}?', loop))
         print (f'RAMP RATE : {rsp}') if rateMode == 'RRATE' else print (f'RAMP TIME : {rsp}') 
 
     def set_ramp(self, rampType, value, loop):
@@ -215,11 +304,11 @@ class F4T(Controller):
            time: RTIME 
         '''
         rateMode = 'RRATE' if rampType == 'rate' else 'RTIME'
-        self.send_cmd(f':SOURCE:CLOOP{loop}:{rateMode} {value}')
+        self.send_cmd(encode(f':SOURCE:CLOOP#:{rateMode}', loop, value = value))
         print ('Done.')
 
     def set_rampScale(self, ramp_scale, loop):
         '''set ramp scaling for loop
         '''
-        self.send_cmd(f':SOURCE:CLOOP{loop}:RSCALE {ramp_scale}')
+        self.send_cmd(encode(':SOURCE:CLOOP#:RSCALE', loop, value = ramp_scale))
         print ('Done.')
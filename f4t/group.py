@@ -0,0 +1,175 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: group.py
+
+Synchronized program control of a group of chambers.
+
+Starting a profile one chamber at a time (select, sleep, name, sleep,
+start) skews the starts by seconds. ChamberGroup splits it in two phases:
+
+    stage    select profile (and step) on every chamber in parallel and
+             read the selected name back
+    release  one thread per chamber waits on a barrier, then all send
+             :PROGRAM:SELECTED:STATE together
+
+Each release is followed by *IDN? in the same write; its reply proves
+the state command was processed, which bounds when the chamber acted.
+The report gives, per chamber, the send and acknowledge times relative
+to the earliest send, so the start skew is measured rather than assumed.
+'''
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from f4tscpi.scpi import encode, parse
+from f4tscpi.f4t_class import F4TError
+from f4tscpi.program import MODES
+from f4tscpi.profiles import check_profile, check_step
+
+LOG = logging.getLogger(__name__)
+
+class GroupError(F4TError):
+    '''staging failed on some chambers; nothing was released
+    '''
+
+    def __init__(self, message, errors):
+        super().__init__(message)
+        self.errors = errors
+
+class ChamberGroup:
+    '''chambers controlled together
+
+       devices:     mapping of chamber name to F4T
+       require_all: refuse to release unless every chamber staged
+       timeout:     seconds to wait for all threads at the barrier
+    '''
+
+    def __init__(self, devices, require_all = True, timeout = 10.0):
+        self.devices = dict(devices)
+        self.require_all = require_all
+        self.timeout = timeout
+        self.staged = {}            # chamber -> (profile, step, name)
+        self.last_report = None
+
+    def _each(self, func, names):
+        with ThreadPoolExecutor(max_workers = max(len(names), 1)) as pool:
+            futures = {name: pool.submit(func, name, self.devices[name])
+                       for name in names}
+        results, errors = {}, {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except (F4TError, OSError, ValueError,
+                    threading.BrokenBarrierError) as exc:
+                errors[name] = str(exc) or exc.__class__.__name__
+        return results, errors
+
+    def stage(self, profile, step = None):
+        '''select profile (and step) on every chamber in parallel
+
+           returns {chamber: selected profile name}; raises GroupError
+           when a chamber fails and require_all is set
+        '''
+        cmds = [encode(':PROGRAM:NUMBER', value = check_profile(profile))]
+        if step is not None:
+            cmds.append(encode(':PROGRAM:STEP', value = check_step(step)))
+        cmds.append(encode(':PROGRAM:NAME?'))
+
+        def select(name, dev):
+            return parse(':PROGRAM:NAME?', dev.pipeline(cmds)[0])
+
+        names, errors = self._each(select, list(self.devices))
+        empty = [name for name, found in names.items() if not found]
+        for name in empty:
+            errors[name] = f'profile {profile} is empty'
+            del names[name]
+        if errors and self.require_all:
+            raise GroupError(f'staging failed on {len(errors)} chamber(s)',
+                             errors)
+        self.staged = {name: (profile, step, found)
+                       for name, found in names.items()}
+        for name, found in names.items():
+            self.devices[name].program.record_select(profile, step, found)
+        return names
+
+    def release(self, mode, names = None):
+        '''send :PROGRAM:SELECTED:STATE mode to the chambers together
+
+           returns the report: {'mode', 'skew', 'spread', 'chambers':
+           {name: {'sent', 'acked', 'rtt', 'error'}}} with times in
+           seconds relative to the earliest send; skew is the spread of
+           the send times, spread that of the acknowledgements
+        '''
+        mode = mode.upper()
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}')
+        names = list(self.devices if names is None else names)
+        cmds = [encode(':PROGRAM:SELECTED:STATE', value = mode),
+                encode('*IDN?')]
+        barrier = threading.Barrier(len(names), timeout = self.timeout)
+
+        def send(name, dev):
+            barrier.wait()
+            sent = time.perf_counter()
+            dev.pipeline(cmds)
+            acked = time.perf_counter()
+            dev.program.record_state(mode)
+            return sent, acked
+
+        times, errors = self._each(send, names)
+        chambers = {name: {'sent': None, 'acked': None, 'rtt': None,
+                           'error': errors.get(name)} for name in names}
+        report = {'mode': mode, 'skew': None, 'spread': None,
+                  'chambers': chambers}
+        if times:
+            origin = min(sent for sent, _ in times.values())
+            for name, (sent, acked) in times.items():
+                chambers[name].update(sent = sent - origin,
+                                      acked = acked - origin,
+                                      rtt = acked - sent)
+            sends = [row['sent'] for row in chambers.values()
+                     if row['sent'] is not None]
+            acks = [row['acked'] for row in chambers.values()
+                    if row['acked'] is not None]
+            report['skew'] = max(sends) - min(sends)
+            report['spread'] = max(acks) - min(acks)
+        for name, error in errors.items():
+            LOG.error('%s: %s failed: %s', name, mode, error)
+        self.last_report = report
+        return report
+
+    def start(self, profile = None, step = None):
+        '''stage profile (when given) and start it on all chambers
+        '''
+        if profile is not None:
+            self.stage(profile, step)
+        names = list(self.staged) if self.staged else None
+        return self.release('START', names)
+
+    def stop(self):
+        return self.release('STOP')
+
+    def pause(self):
+        return self.release('PAUSE')
+
+    def resume(self):
+        return self.release('RESUME')
+
+def format_report(report):
+    '''plain text table of a release report (times in ms)
+    '''
+    lines = [f'{report["mode"]}: send skew '
+             f'{_ms(report["skew"])} ms, ack spread {_ms(report["spread"])} ms',
+             f'{"chamber":<24} {"sent":>8} {"acked":>8} {"rtt":>8}']
+    for name, row in sorted(report['chambers'].items()):
+        if row['error']:
+            lines.append(f'{name:<24} ERROR {row["error"]}')
+        else:
+            lines.append(f'{name:<24} {_ms(row["sent"]):>8} '
+                         f'{_ms(row["acked"]):>8} {_ms(row["rtt"]):>8}')
+    return '\n'.join(lines)
+
+def _ms(seconds):
+    return '-' if seconds is None else f'{seconds * 1e3:.1f}'
@@ -0,0 +1,162 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: health.py
+
+Per-controller health tracking with a circuit breaker.
+
+Every exchange on a Controller reports success or failure to its Health
+object. After failure_threshold consecutive failures the chamber is marked
+down: further calls fail immediately with F4TUnavailable instead of each
+waiting for the socket timeout. A single background monitor thread probes
+all down chambers with *IDN? on a fresh connection and brings them back up
+as soon as they answer.
+'''
+import time
+import weakref
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger(__name__)
+
+UP = 'UP'
+DOWN = 'DOWN'
+
+class Health:
+    '''health record and circuit breaker state of one controller
+    '''
+
+    def __init__(self, name = '', failure_threshold = 3, probe_interval = 5.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = UP
+        self.consecutive = 0
+        self.successes = 0
+        self.failures = 0
+        self.last_ok = None
+        self.last_error = None
+        self.down_since = None
+        self.next_probe = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_down(self):
+        return self.state == DOWN
+
+    def success(self):
+        with self._lock:
+            self.successes += 1
+            self.consecutive = 0
+            self.last_ok = time.time()
+
+    def failure(self, error):
+        '''record a failure; returns True when this trips the breaker
+        '''
+        with self._lock:
+            self.failures += 1
+            self.consecutive += 1
+            self.last_error = str(error)
+            if self.state == UP and self.consecutive >= self.failure_threshold:
+                self.state = DOWN
+                self.down_since = time.time()
+                self.next_probe = time.monotonic() + self.probe_interval
+                LOG.warning('%s marked down after %d failures: %s',
+                            self.name, self.consecutive, error)
+                return True
+            if self.state == DOWN:
+                self.next_probe = time.monotonic() + self.probe_interval
+        return False
+
+    def recover(self):
+        with self._lock:
+            if self.state == DOWN:
+                LOG.info('%s is back up', self.name)
+            self.state = UP
+            self.consecutive = 0
+            self.down_since = None
+            self.next_probe = None
+            self.last_ok = time.time()
+
+    def snapshot(self):
+        '''plain dict of the health record, e.g. for status pages
+        '''
+        return {
+            'name': self.name,
+            'state': self.state,
+            'consecutive': self.consecutive,
+            'successes': self.successes,
+            'failures': self.failures,
+            'last_ok': self.last_ok,
+            'last_error': self.last_error,
+            'down_since': self.down_since,
+        }
+
+class HealthMonitor:
+    '''background prober for controllers marked down
+
+       One daemon thread serves every controller in the process; probes
+       run on a small thread pool so slow connects do not delay others.
+       Controllers are held weakly: a discarded one is no longer probed.
+    '''
+
+    def __init__(self, tick = 0.5, workers = 8):
+        self.tick = tick
+        self.workers = workers
+        self._watched = weakref.WeakSet()
+        self._busy = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+
+    def watch(self, ctrl):
+        '''probe ctrl until it is back up
+        '''
+        with self._lock:
+            self._watched.add(ctrl)
+            if self._thread is None or not self._thread.is_alive():
+                self._pool = ThreadPoolExecutor(max_workers = self.workers,
+                                                thread_name_prefix = 'probe')
+                self._thread = threading.Thread(target = self._run,
+                                                name = 'health-monitor',
+                                                daemon = True)
+                self._thread.start()
+
+    def unwatch(self, ctrl):
+        '''stop probing ctrl (e.g. it was closed)
+        '''
+        with self._lock:
+            self._watched.discard(ctrl)
+
+    def _probe(self, ctrl):
+        try:
+            if ctrl.probe():
+                with self._lock:
+                    self._watched.discard(ctrl)
+        except Exception as exc:
+            ctrl.health.failure(exc)
+        finally:
+            with self._lock:
+                self._busy.discard(ctrl)
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                due = [ctrl for ctrl in self._watched
+                       if ctrl not in self._busy and
+                       (not ctrl.health.is_down or
+                        (ctrl.health.next_probe or 0) <= now)]
+                self._busy.update(due)
+            for ctrl in due:
+                if not ctrl.health.is_down:
+                    with self._lock:
+                        self._watched.discard(ctrl)
+                        self._busy.discard(ctrl)
+                    continue
+                self._pool.submit(self._probe, ctrl)
+            time.sleep(self.tick)
+
+MONITOR = HealthMonitor()
@@ -0,0 +1,197 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: planner.py
+
+Query planner: logical fields -> minimal batched reads.
+
+Callers name fields ('temp.pv', 'humi.sp', 'cascade.inner.pv',
+'output3'); the planner resolves them to catalog queries, drops
+duplicates and fields the chamber does not have (per its Capabilities),
+and packs the rest into as few pipelined exchanges as the limits of one
+exchange allow. Plans are compiled once per (field set, chamber type)
+and kept in a bounded LRU cache; Plan.execute() returns typed values by
+field name.
+
+    plan = compile_plan(['temp.pv', 'temp.sp', 'output3'], caps)
+    values = plan.execute(dev)          # {'temp.pv': 23.1, ...}
+
+Field names:
+    loopN.pv .sp .error .idle .ramp_rate .ramp_time    N = 1-4
+    temp.* (loop 1), humi.* (loop 2)
+    cascade.sp, cascade.outer.pv/.sp/.error, cascade.inner.pv/.sp/.error
+    outputN (state), outputN.name                      N = 1-7
+    units, units.display, idn
+'''
+import logging
+import threading
+from collections import OrderedDict
+from f4tscpi.scpi import CATALOG, command, encode, parse
+
+LOG = logging.getLogger(__name__)
+
+MAX_QUERIES = 32        # queries per exchange; conservative reply backlog
+MAX_BYTES = 1024        # bytes written per exchange
+CACHE_SIZE = 256        # compiled plans kept, least recently used dropped
+
+_LOOP_NODES = {'pv': 'PVALUE', 'sp': 'SPOINT', 'error': 'ERROR',
+               'idle': 'IDLE', 'ramp_rate': 'RRATE', 'ramp_time': 'RTIME'}
+_ALIASES = {'temp': 'loop1', 'humi': 'loop2'}
+
+def _registry():
+    fields = {'idn': ('*IDN?', ()), 'units': (':UNIT:TEMPERATURE?', ()),
+              'units.display': (':UNIT:TEMPERATURE:DISPLAY?', ())}
+    _, lo, hi = command(':SOURCE:CLOOP#:PVALUE?').index[0]
+    for loop in range(lo, hi + 1):
+        for name, node in _LOOP_NODES.items():
+            fields[f'loop{loop}.{name}'] = (f':SOURCE:CLOOP#:{node}?',
+                                            (loop,))
+    fields['cascade.sp'] = (':SOURCE:CASCADE#:SPOINT?', (1,))
+    for part in ('outer', 'inner'):
+        for name in ('pv', 'sp', 'error'):
+            node = _LOOP_NODES[name]
+            fields[f'cascade.{part}.{name}'] = (
+                f':SOURCE:CASCADE#:{part.upper()}:{node}?', (1,))
+    _, lo, hi = command(':OUTPUT#:STATE?').index[0]
+    for num in range(lo, hi + 1):
+        fields[f'output{num}'] = (':OUTPUT#:STATE?', (num,))
+        fields[f'output{num}.name'] = (':OUTPUT#:NAME?', (num,))
+    assert all(key in CATALOG for key, _ in fields.values())
+    return fields
+
+FIELDS = _registry()
+
+def resolve(field):
+    '''(catalog key, index) of a logical field name
+    '''
+    head, dot, rest = field.partition('.')
+    name = _ALIASES.get(head, head) + dot + rest
+    try:
+        return FIELDS[name]
+    except KeyError:
+        raise KeyError(f'unknown field: {field}') from None
+
+def supported(key, index, caps):
+    '''whether a chamber with caps answers the query
+    '''
+    if caps is None:
+        return True
+    if ':CLOOP#:' in key:
+        return index[0] in caps.loops
+    if ':CASCADE#:' in key:
+        return caps.cascade
+    return True
+
+class Plan:
+    '''compiled read of a set of fields
+
+       batches: command lists, one pipelined exchange each
+       slots:   (field name, catalog key, position in the replies)
+       skipped: fields the chamber does not have (always None)
+    '''
+
+    def __init__(self, items, caps = None):
+        self.fields = tuple(name for name, _, _ in items)
+        positions = {}
+        commands = []
+        self.slots = []
+        self.skipped = []
+        for name, key, index in items:
+            if not supported(key, index, caps):
+                self.skipped.append(name)
+                continue
+            cmd = encode(key, *index)
+            if cmd not in positions:
+                positions[cmd] = len(commands)
+                commands.append(cmd)
+            self.slots.append((name, key, positions[cmd]))
+        self.commands = commands
+        self.batches = _pack(commands)
+
+    @property
+    def round_trips(self):
+        return len(self.batches)
+
+    def parse(self, replies):
+        '''typed values by field from the flat reply list; replies that do
+           not parse are None
+        '''
+        values = dict.fromkeys(self.fields)
+        for name, key, pos in self.slots:
+            try:
+                values[name] = parse(key, replies[pos])
+            except (ValueError, IndexError):
+                values[name] = None
+        return values
+
+    def execute(self, dev, budget = None, retries = 2):
+        '''run the plan on dev; budget applies to each exchange
+        '''
+        replies = []
+        for batch in self.batches:
+            replies += dev.read(batch, budget = budget, retries = retries)
+        return self.parse(replies)
+
+    def __repr__(self):
+        return (f'Plan({len(self.fields)} fields, {len(self.commands)} '
+                f'queries, {self.round_trips} exchange(s))')
+
+def _pack(commands):
+    '''split commands into exchanges within MAX_QUERIES and MAX_BYTES
+    '''
+    batches, batch, size = [], [], 0
+    for cmd in commands:
+        length = len(cmd) + 1
+        if batch and (len(batch) >= MAX_QUERIES or
+                      size + length > MAX_BYTES):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(cmd)
+        size += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+def _caps_key(caps):
+    return None if caps is None else (caps.loops, caps.cascade)
+
+def plan_keys(items, caps = None):
+    '''cached Plan for (name, catalog key, index) triples
+    '''
+    items = tuple((name, key, tuple(index)) for name, key, index in items)
+    cache_key = (items, _caps_key(caps))
+    with _CACHE_LOCK:
+        found = _CACHE.get(cache_key)
+        if found is not None:
+            _CACHE.move_to_end(cache_key)
+    if found is None:
+        found = Plan(items, caps)
+        with _CACHE_LOCK:
+            _CACHE[cache_key] = found
+            while len(_CACHE) > CACHE_SIZE:
+                _CACHE.popitem(last = False)
+    return found
+
+def compile_plan(fields, caps = None):
+    '''cached Plan for logical field names; the order of fields does not
+       matter, so every ordering of one set shares a plan
+    '''
+    return plan_keys([(field, *resolve(field)) for field in
+                      sorted(set(fields))], caps)
+
+def read_keys(dev, keys, **kwargs):
+    '''typed values of (catalog key, index) pairs, in order
+    '''
+    plan = plan_keys((pos, key, index) for pos, (key, index) in
+                     enumerate(keys))
+    values = plan.execute(dev, **kwargs)
+    return [values[pos] for pos in range(len(plan.fields))]
+
+def read_fields(dev, fields, caps = None, **kwargs):
+    '''read logical fields from dev in as few exchanges as possible
+    '''
+    return compile_plan(fields, caps).execute(dev, **kwargs)
@@ -0,0 +1,244 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: profiler.py
+
+Opt-in profiling of F4T calls.
+
+While a Profiler is active every public F4T method is timed, and its wall
+time is split into:
+
+    sleep    time.sleep() inside the call
+    send     writing to the socket
+    recv     waiting for and reading replies (incl. clear_buffer)
+    connect  reconnects after errors
+    parse    SCPI encoding and reply parsing
+    python   everything else (the library's own work)
+
+Times are aggregated per chamber and per method (nested methods included)
+and can be written as folded stacks ('chamber;method;...;kind usec'),
+which flamegraph.pl, speedscope and similar tools read directly.
+
+    with Profiler() as prof:
+        dev.get_profiles()
+    print(prof.report())
+    prof.write_folded('f4t.folded')
+
+Instrumentation patches the F4T class while active, so it covers every
+instance in the process; only one Profiler can be active at a time.
+'''
+import time
+import logging
+import threading
+import functools
+from collections import defaultdict
+from f4tscpi.scpi import Command
+from f4tscpi.f4t_class import Controller
+from f4tscpi.f4t_interface import F4T
+
+LOG = logging.getLogger(__name__)
+
+KINDS = ('sleep', 'send', 'recv', 'connect', 'parse', 'python')
+
+# Controller / Command internals and the kind of time they account for
+LEAVES = {
+    (Controller, '_write'): 'send',
+    (Controller, 'read_line'): 'recv',
+    (Controller, 'clear_buffer'): 'recv',
+    (Controller, '_hedged'): 'recv',
+    (Controller, '_connect'): 'connect',
+    (Command, 'encode'): 'parse',
+    (Command, 'parse'): 'parse',
+}
+
+_ACTIVE = None
+_ACTIVE_LOCK = threading.Lock()
+
+class _Frame:
+    __slots__ = ('path', 'start', 'children', 'leaf')
+
+    def __init__(self, path, leaf):
+        self.path = path
+        self.start = time.perf_counter()
+        self.children = 0.0
+        self.leaf = leaf
+
+class Profiler:
+    '''collects time split per chamber and method; use as a context
+       manager, or as a decorator to profile every call of a function
+    '''
+
+    def __init__(self, cls = F4T):
+        self.cls = cls
+        self.stacks = defaultdict(float)        # path tuple -> seconds
+        self.calls = defaultdict(int)           # (chamber, method) -> calls
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._patched = []
+        self._sleep = None
+
+    # instrumentation -----------------------------------------------------
+
+    def _frames(self):
+        frames = getattr(self._local, 'frames', None)
+        if frames is None:
+            frames = self._local.frames = []
+        return frames
+
+    def _enter(self, path, leaf):
+        frame = _Frame(path, leaf)
+        self._frames().append(frame)
+        return frame
+
+    def _exit(self, frame):
+        elapsed = time.perf_counter() - frame.start
+        frames = self._frames()
+        frames.pop()
+        if frames:
+            frames[-1].children += elapsed
+        own = elapsed - frame.children
+        key = frame.path if frame.leaf else frame.path + ('python',)
+        with self._lock:
+            self.stacks[key] += own
+            if not frame.leaf:
+                self.calls[frame.path[0], frame.path[-1]] += 1
+
+    def _method(self, name, func):
+        @functools.wraps(func)
+        def wrapper(dev, *args, **kwargs):
+            frames = self._frames()
+            if frames:
+                path = frames[-1].path + (name,)
+            else:
+                path = (f'{dev._host}:{dev._port}', name)
+            frame = self._enter(path, False)
+            try:
+                return func(dev, *args, **kwargs)
+            finally:
+                self._exit(frame)
+        return wrapper
+
+    def _leaf(self, kind, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frames = self._frames()
+            if frames and frames[-1].leaf:
+                return func(*args, **kwargs)    # counted by the outer leaf
+            if frames:
+                path = frames[-1].path + (kind,)
+            elif isinstance(args[0], Controller):
+                path = (f'{args[0]._host}:{args[0]._port}', kind)
+            else:
+                return func(*args, **kwargs)    # outside any F4T call
+            frame = self._enter(path, True)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit(frame)
+        return wrapper
+
+    def _patch(self, owner, name, wrapper):
+        self._patched.append((owner, name, vars(owner)[name]))
+        setattr(owner, name, wrapper)
+
+    def start(self):
+        global _ACTIVE
+        with _ACTIVE_LOCK:
+            if _ACTIVE is not None:
+                raise RuntimeError('another Profiler is already active')
+            _ACTIVE = self
+        for (owner, name), kind in LEAVES.items():
+            self._patch(owner, name, self._leaf(kind, vars(owner)[name]))
+        leaves = {name for owner, name in LEAVES if owner is Controller}
+        for owner in self.cls.__mro__:
+            if owner is object:
+                continue
+            for name, attr in list(vars(owner).items()):
+                if name.startswith('_') or name in leaves or \
+                   not callable(attr) or isinstance(attr, type) or \
+                   isinstance(attr, (classmethod, staticmethod)):
+                    continue
+                self._patch(owner, name, self._method(name, attr))
+        self._sleep = time.sleep
+        time.sleep = self._leaf('sleep', self._sleep)
+        return self
+
+    def stop(self):
+        global _ACTIVE
+        if self._sleep is not None:
+            time.sleep = self._sleep
+            self._sleep = None
+        while self._patched:
+            owner, name, orig = self._patched.pop()
+            setattr(owner, name, orig)
+        with _ACTIVE_LOCK:
+            if _ACTIVE is self:
+                _ACTIVE = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+    # results -------------------------------------------------------------
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.calls.clear()
+
+    def summary(self):
+        '''{(chamber, method): {'calls', 'wall', kind...}} in seconds;
+           a method's split includes the methods it calls
+        '''
+        with self._lock:
+            stacks = dict(self.stacks)
+            calls = dict(self.calls)
+        table = {}
+        for path, seconds in stacks.items():
+            chamber, kind = path[0], path[-1]
+            for method in set(path[1:-1]) or ('',):
+                row = table.setdefault((chamber, method), dict.fromkeys(
+                    ('calls', 'wall') + KINDS, 0.0))
+                row[kind] += seconds
+                row['wall'] += seconds
+        for key, row in table.items():
+            row['calls'] = calls.get(key, 0)
+        return table
+
+    def report(self, chamber = None):
+        '''plain text table, slowest methods first (times in ms)
+        '''
+        rows = sorted(self.summary().items(), key = lambda kv: -kv[1]['wall'])
+        head = f'{"chamber":<21} {"method":<20} {"calls":>6} {"wall":>9}' + \
+               ''.join(f' {kind:>8}' for kind in KINDS)
+        lines = [head, '-' * len(head)]
+        for (name, method), row in rows:
+            if chamber is not None and name != chamber:
+                continue
+            lines.append(f'{name:<21} {method or "-":<20} {row["calls"]:>6} '
+                         f'{row["wall"] * 1e3:>9.1f}' +
+                         ''.join(f' {row[kind] * 1e3:>8.1f}'
+                                 for kind in KINDS))
+        return '\n'.join(lines)
+
+    def folded(self):
+        '''folded stack lines ('a;b;c usec') for flame graph tools
+        '''
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        return [f'{";".join(path)} {round(seconds * 1e6)}'
+                for path, seconds in stacks if seconds > 0]
+
+    def write_folded(self, path):
+        with open(path, 'w') as fp:
+            fp.write('\n'.join(self.folded()) + '\n')
@@ -0,0 +1,129 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: profiles.py
+
+Pipelined profile transfer built on :PROGRAM:NUMBER and :PROGRAM:STEP.
+
+The F4T SCPI command set (see f4t_scpi_cmds) exposes the profile slot
+selection, the step selection and the name of the selected profile; step
+content itself (step type, targets, durations) is not reachable over SCPI
+and is still edited on the front panel or with Composer. What is
+transferred here is therefore the profile directory of a chamber:
+
+  - the names of all 40 profile slots, read in one pipelined exchange
+    instead of one select/sleep/query/sleep cycle per slot,
+  - a digest of that directory, used as checksum-style read-back to check
+    that a standard profile set is present on every chamber of a fleet,
+  - a diff against a reference set, so only mismatching slots are
+    reported for re-loading,
+  - positioning of a profile on a given step (1-50) in a single write.
+'''
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from f4tscpi.scpi import command, encode
+
+LOG = logging.getLogger(__name__)
+
+def _domain(key):
+    _, lo, hi = command(key).values
+    return range(lo, hi + 1)
+
+PROFILE_RANGE = _domain(':PROGRAM:NUMBER')      # profile slots 1-40
+STEP_RANGE = _domain(':PROGRAM:STEP')           # steps 1-50 per profile
+
+class ProfileDirectory(dict):
+    '''profile slot number -> profile name, as read from a chamber
+    '''
+
+    def digest(self, profiles = None):
+        '''stable checksum of the directory (or of the given slots)
+        '''
+        slots = sorted(self) if profiles is None else sorted(profiles)
+        text = '\n'.join(f'{i}:{self.get(i, "")}' for i in slots)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def diff(self, other):
+        '''slots whose name differs from other; returns
+           {slot: (this name, other name)} with '' for empty slots
+        '''
+        slots = set(self) | set(other)
+        return {i: (self.get(i, ''), other.get(i, ''))
+                for i in sorted(slots) if self.get(i, '') != other.get(i, '')}
+
+def check_profile(profile):
+    '''validate a profile slot number (1-40)
+    '''
+    if profile not in PROFILE_RANGE:
+        raise ValueError(f'profile must be between 1 and 40, got {profile}')
+    return profile
+
+def check_step(step):
+    '''validate a step number (1-50)
+    '''
+    if step not in STEP_RANGE:
+        raise ValueError(f'step must be between 1 and 50, got {step}')
+    return step
+
+def _name(rsp):
+    return rsp.strip().replace('"', '')
+
+def _record(dev, profile, step = None, name = None):
+    '''keep the program control state of dev in step with a selection
+    '''
+    control = getattr(dev, 'program', None)
+    if control is not None:
+        control.record_select(profile, step, name)
+
+def read_profiles(dev, profiles = PROFILE_RANGE):
+    '''read the names of the given profile slots in one pipelined
+       exchange; empty slots are left out of the result
+    '''
+    cmds = []
+    slots = [check_profile(i) for i in profiles]
+    for i in slots:
+        cmds.append(encode(':PROGRAM:NUMBER', value = i))
+        cmds.append(encode(':PROGRAM:NAME?'))
+    names = dev.pipeline(cmds)
+    if slots:                   # the last slot read stays selected
+        _record(dev, slots[-1], name = _name(names[-1]) or None)
+    return ProfileDirectory((i, _name(rsp)) for i, rsp in zip(slots, names)
+                            if _name(rsp))
+
+def select_step(dev, profile, step):
+    '''select a profile and position it on a step in a single write
+    '''
+    dev.pipeline([encode(':PROGRAM:NUMBER', value = profile),
+                  encode(':PROGRAM:STEP', value = step)])
+    _record(dev, profile, step)
+
+def verify_profiles(dev, expected):
+    '''read back the slots of expected from the chamber and compare
+
+       returns (ok, diff): ok is True when the digests match, diff lists
+       the slots to re-load as {slot: (chamber name, expected name)}
+    '''
+    expected = ProfileDirectory(expected)
+    found = read_profiles(dev, sorted(expected))
+    ok = found.digest(expected) == expected.digest()
+    return ok, ({} if ok else found.diff(expected))
+
+def verify_fleet(devices, expected, workers = 16):
+    '''verify a standard profile set on many chambers in parallel
+
+       devices: mapping of chamber name to F4T
+       returns {chamber: diff} for chambers that do not match
+    '''
+    expected = ProfileDirectory(expected)
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = {name: pool.submit(verify_profiles, dev, expected)
+                   for name, dev in devices.items()}
+    result = {}
+    for name, future in futures.items():
+        ok, diff = future.result()
+        if not ok:
+            LOG.info('%s: %d profile slot(s) differ', name, len(diff))
+            result[name] = diff
+    return result
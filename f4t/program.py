@@ -0,0 +1,177 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: program.py
+
+Program (profile) control state machine of one F4T session.
+
+ProgramControl remembers which profile is selected and which run state
+was last commanded, so selecting the profile that is already selected
+costs nothing, and every command it sends is one write. Every library
+path that selects a profile (read_profiles, select_step, batch, groups)
+records the selection here, so the shortcut does not go stale. Replies are
+always read: a selection with confirm reads the profile name back in the
+same exchange, a state change with confirm is followed by *IDN? whose
+reply proves the command was processed. Nothing is left in the receive
+buffer for a later query to pick up.
+
+    prog = dev.program
+    prog.start(3, confirm = True)       # select + start: one round trip
+    prog.pause()                        # one write, no reply to wait for
+    prog.resume()
+
+The catalog has no query for the run state, so the state is the last
+one commanded through this session; a profile that ends or is stopped at
+the front panel is not seen. invalidate() forgets what is known.
+'''
+import time
+import logging
+import threading
+from f4tscpi.scpi import encode, parse
+from f4tscpi.profiles import check_profile, check_step
+
+LOG = logging.getLogger(__name__)
+
+STOPPED, RUNNING, PAUSED = 'STOPPED', 'RUNNING', 'PAUSED'
+
+# (state before, command) -> state after; None = not known
+TRANSITIONS = {
+    (None, 'START'): RUNNING, (STOPPED, 'START'): RUNNING,
+    (RUNNING, 'START'): RUNNING, (PAUSED, 'START'): RUNNING,
+    (RUNNING, 'PAUSE'): PAUSED, (PAUSED, 'PAUSE'): PAUSED,
+    (PAUSED, 'RESUME'): RUNNING, (RUNNING, 'RESUME'): RUNNING,
+    (None, 'STOP'): STOPPED, (STOPPED, 'STOP'): STOPPED,
+    (RUNNING, 'STOP'): STOPPED, (PAUSED, 'STOP'): STOPPED,
+}
+MODES = ('START', 'STOP', 'PAUSE', 'RESUME')
+
+class ProgramControl:
+    '''selected profile and run state of one session
+    '''
+
+    def __init__(self, dev):
+        self.dev = dev
+        self.selected = None            # profile number
+        self.step = None
+        self.name = None
+        self.state = None
+        self.changed = None             # time.time() of the last command
+        self.skipped = 0                # selections saved
+        self.last_rtt = None
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        '''forget the selection and the state (e.g. after front panel use)
+        '''
+        with self._lock:
+            self.selected = self.step = self.name = self.state = None
+
+    def _select_cmds(self, profile, step, force):
+        cmds = []
+        if force or profile != self.selected or step is not None:
+            cmds.append(encode(':PROGRAM:NUMBER',
+                               value = check_profile(profile)))
+            if step is not None:
+                cmds.append(encode(':PROGRAM:STEP', value = check_step(step)))
+        else:
+            self.skipped += 1
+        return cmds
+
+    def _exchange(self, cmds):
+        start = time.monotonic()
+        try:
+            replies = self.dev.pipeline(cmds)
+        except Exception:
+            # the writes may or may not have been acted on
+            self.invalidate()
+            raise
+        self.last_rtt = time.monotonic() - start
+        return replies
+
+    def record_select(self, profile, step = None, name = None):
+        '''note a selection made outside this object (e.g. ChamberGroup,
+           read_profiles)
+        '''
+        with self._lock:
+            if profile != self.selected:
+                self.name = None
+            self.selected, self.step = profile, step
+            if name is not None:
+                self.name = name
+            self.dev.current_profile = profile
+
+    def record_state(self, mode):
+        '''note a state command sent outside this object
+        '''
+        with self._lock:
+            after = TRANSITIONS.get((self.state, mode))
+            if after is None:
+                if self.state is not None:
+                    LOG.warning('%s: %s while %s', self.dev._host, mode,
+                                self.state.lower())
+                after = {'START': RUNNING, 'RESUME': RUNNING,
+                         'PAUSE': PAUSED, 'STOP': STOPPED}[mode]
+            self.state = after
+            self.changed = time.time()
+
+    def select(self, profile, step = None, confirm = False, force = False):
+        '''select profile (and step); skipped when profile is already
+           selected, unless force, confirm or a step is given
+
+           confirm always selects and reads the name back in the same
+           exchange, and raises ValueError for an empty profile; returns
+           the name when known
+        '''
+        with self._lock:
+            cmds = self._select_cmds(profile, step, force or confirm)
+            if confirm:
+                cmds.append(encode(':PROGRAM:NAME?'))
+            if not cmds:
+                return self.name
+            replies = self._exchange(cmds)
+            name = parse(':PROGRAM:NAME?', replies[0]) if replies else None
+            if confirm and not name:
+                self.selected = None
+                raise ValueError(f'profile {profile} is empty')
+            self.record_select(profile, step, name)
+            return self.name
+
+    def command(self, mode, profile = None, step = None, confirm = False):
+        '''send :PROGRAM:SELECTED:STATE mode, selecting profile first when
+           given and not yet selected (always with confirm), all in one
+           write
+
+           confirm appends *IDN? and waits for its reply; returns the
+           round-trip time then, None otherwise
+        '''
+        mode = mode.upper()
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}')
+        with self._lock:
+            cmds = [] if profile is None else \
+                   self._select_cmds(profile, step, confirm)
+            cmds.append(encode(':PROGRAM:SELECTED:STATE', value = mode))
+            if confirm:
+                cmds.append(encode('*IDN?'))
+            self._exchange(cmds)
+            if profile is not None:
+                self.record_select(profile, step)
+            self.record_state(mode)
+            return self.last_rtt if confirm else None
+
+    def start(self, profile = None, step = None, confirm = False):
+        return self.command('START', profile, step, confirm)
+
+    def stop(self, confirm = False):
+        return self.command('STOP', confirm = confirm)
+
+    def pause(self, confirm = False):
+        return self.command('PAUSE', confirm = confirm)
+
+    def resume(self, confirm = False):
+        return self.command('RESUME', confirm = confirm)
+
+    def __repr__(self):
+        return (f'ProgramControl({self.dev._host}, profile {self.selected}, '
+                f'{(self.state or "unknown").lower()})')
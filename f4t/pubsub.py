@@ -0,0 +1,443 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: pubsub.py
+
+Local publish/subscribe fan-out of live readings.
+
+A Publisher takes samples from ChamberPollers (as a listener) and pushes
+each one to any number of local Subscribers over a Unix domain socket, so
+controller load does not depend on how many consumers run. One thread
+serves all subscribers with non-blocking sockets.
+
+Topics are 'chamber/field', e.g. '10.30.100.55/L1 PV'. Subscribers give
+fnmatch patterns ('10.30.100.55/*', '*/L2 *') and a delivery mode:
+
+    history   every sample, in order; a subscriber that falls more than
+              max_buffer bytes behind is disconnected
+    latest    only the newest value per topic; a slow subscriber skips
+              intermediate samples
+
+Frames: 8-byte header (magic b'F4', version, kind, payload length) and a
+struct-packed payload; see pack_sample().
+
+    python -m f4tscpi.pubsub publish /tmp/f4t.sock 10.30.100.55 --loops 1 2
+    python -m f4tscpi.pubsub subscribe /tmp/f4t.sock '*/L1 PV'
+'''
+import os
+import sys
+import time
+import socket
+import struct
+import logging
+import argparse
+import selectors
+import threading
+from fnmatch import fnmatchcase
+from collections import deque, namedtuple
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'F4'
+VERSION = 1
+SAMPLE = 1
+SUBSCRIBE = 2
+_HEADER = struct.Struct('>2sBBI')
+_T = struct.Struct('>d')
+_U8 = struct.Struct('>B')
+_U16 = struct.Struct('>H')
+MODES = ('latest', 'history')
+NONE, FLOAT, TEXT = 0, 1, 2
+
+Sample = namedtuple('Sample', 't chamber values')
+
+def _text(out, text, size = _U8):
+    data = text.encode('utf-8')
+    out += size.pack(len(data))
+    out += data
+
+def pack_sample(t, chamber, values):
+    '''SAMPLE frame: t (f8), chamber, count (u2), then per field its name
+       and a typed value (none / f8 / text)
+    '''
+    out = bytearray(_T.pack(t))
+    _text(out, chamber)
+    out += _U16.pack(len(values))
+    for field, value in values.items():
+        _text(out, field)
+        if value is None:
+            out += _U8.pack(NONE)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out += _U8.pack(FLOAT) + _T.pack(value)
+        else:
+            if isinstance(value, tuple):
+                value = ','.join(value)         # *IDN? fields
+            out += _U8.pack(TEXT)
+            _text(out, str(value), _U16)
+    return _HEADER.pack(MAGIC, VERSION, SAMPLE, len(out)) + out
+
+def _read_text(data, pos, size = _U8):
+    (length,) = size.unpack_from(data, pos)
+    pos += size.size
+    return data[pos:pos + length].decode('utf-8'), pos + length
+
+def unpack_sample(payload):
+    (t,) = _T.unpack_from(payload, 0)
+    chamber, pos = _read_text(payload, _T.size)
+    (count,) = _U16.unpack_from(payload, pos)
+    pos += _U16.size
+    values = {}
+    for _ in range(count):
+        field, pos = _read_text(payload, pos)
+        kind = payload[pos]
+        pos += 1
+        if kind == FLOAT:
+            (values[field],) = _T.unpack_from(payload, pos)
+            pos += _T.size
+        elif kind == TEXT:
+            values[field], pos = _read_text(payload, pos, _U16)
+        else:
+            values[field] = None
+    return Sample(t, chamber, values)
+
+def _frames(buf):
+    '''complete (kind, payload) frames at the start of buf; consumed
+       bytes are removed
+    '''
+    while len(buf) >= _HEADER.size:
+        magic, version, kind, length = _HEADER.unpack_from(buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('bad frame header')
+        end = _HEADER.size + length
+        if len(buf) < end:
+            return
+        payload = bytes(buf[_HEADER.size:end])
+        del buf[:end]
+        yield kind, payload
+
+class _Client:
+    '''publisher side state of one subscriber
+    '''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.patterns = None            # None until SUBSCRIBE arrives
+        self.mode = 'latest'
+        self.latest = {}                # chamber -> [t, {field: value}]
+        self.topics = {}                # (chamber, field) -> match result
+
+    def wants(self, chamber, field):
+        key = (chamber, field)
+        found = self.topics.get(key)
+        if found is None:
+            topic = f'{chamber}/{field}'
+            found = self.topics[key] = any(fnmatchcase(topic, pattern)
+                                           for pattern in self.patterns)
+        return found
+
+class Publisher(threading.Thread):
+    '''Unix socket fan-out server
+
+       path:        socket file (replaced if it exists)
+       max_buffer:  bytes a history subscriber may fall behind
+    '''
+
+    def __init__(self, path, max_buffer = 4 << 20):
+        super().__init__(name = 'f4t-publisher', daemon = True)
+        self.path = path
+        self.max_buffer = max_buffer
+        self.published = 0
+        self.dropped = 0                # history subscribers disconnected
+        self._queue = deque()
+        self._clients = {}
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._halt = False
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen(64)
+        self._server.setblocking(False)
+
+    # producer side -------------------------------------------------------
+
+    def publish(self, chamber, t, values):
+        '''queue one sample for all subscribers (thread safe, no I/O)
+        '''
+        self._queue.append((chamber, t, dict(values)))
+        self._wake()
+
+    def listener(self, poller):
+        '''callback for ChamberPoller.listeners
+        '''
+        self.publish(poller.chamber, poller.stamp, poller.values)
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass                        # already pending or closed
+
+    @property
+    def subscribers(self):
+        return len(self._clients)
+
+    def stop(self):
+        self._halt = True
+        self._wake()
+        if self.is_alive():
+            self.join()
+
+    def __enter__(self):
+        if not self.is_alive():
+            self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # server side ---------------------------------------------------------
+
+    def run(self):
+        self._sel.register(self._server, selectors.EVENT_READ)
+        self._sel.register(self._wake_r, selectors.EVENT_READ)
+        try:
+            while not self._halt:
+                for key, events in self._sel.select():
+                    if key.fileobj is self._server:
+                        self._accept()
+                    elif key.fileobj is self._wake_r:
+                        self._drain_wake()
+                    else:
+                        client = self._clients.get(key.fileobj)
+                        if client is None:
+                            continue
+                        if events & selectors.EVENT_READ:
+                            self._receive(client)
+                        if events & selectors.EVENT_WRITE and \
+                           client.sock in self._clients:
+                            self._flush(client)
+                self._distribute()
+        finally:
+            for client in list(self._clients.values()):
+                self._drop(client)
+            self._sel.close()
+            self._server.close()
+            self._wake_r.close()
+            self._wake_w.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _accept(self):
+        try:
+            sock, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        self._clients[sock] = _Client(sock)
+        self._sel.register(sock, selectors.EVENT_READ)
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _receive(self, client):
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(client)
+            return
+        client.inbox += data
+        try:
+            for kind, payload in _frames(client.inbox):
+                if kind == SUBSCRIBE:
+                    mode, text = payload[0], payload[1:].decode('utf-8')
+                    client.mode = MODES[mode]
+                    client.patterns = [p for p in text.split('\n') if p]
+                    client.topics.clear()
+        except (ValueError, IndexError, UnicodeDecodeError) as exc:
+            LOG.warning('bad subscriber request: %s', exc)
+            self._drop(client)
+
+    def _distribute(self):
+        while self._queue:
+            chamber, t, values = self._queue.popleft()
+            self.published += 1
+            for client in list(self._clients.values()):
+                if client.patterns is None:
+                    continue
+                fields = {field: value for field, value in values.items()
+                          if client.wants(chamber, field)}
+                if not fields:
+                    continue
+                if client.mode == 'history':
+                    client.outbox += pack_sample(t, chamber, fields)
+                    if len(client.outbox) > self.max_buffer:
+                        LOG.warning('subscriber too slow, disconnected')
+                        self.dropped += 1
+                        self._drop(client)
+                        continue
+                else:
+                    entry = client.latest.setdefault(chamber, [t, {}])
+                    entry[0] = t
+                    entry[1].update(fields)
+                self._flush(client)
+
+    def _flush(self, client):
+        if not client.outbox and client.latest:
+            for chamber, (t, fields) in client.latest.items():
+                client.outbox += pack_sample(t, chamber, fields)
+            client.latest.clear()
+        if client.outbox:
+            try:
+                sent = client.sock.send(client.outbox)
+                del client.outbox[:sent]
+            except BlockingIOError:
+                pass
+            except OSError:
+                self._drop(client)
+                return
+        pending = bool(client.outbox or client.latest)
+        self._sel.modify(client.sock, selectors.EVENT_READ |
+                         (selectors.EVENT_WRITE if pending else 0))
+
+    def _drop(self, client):
+        self._clients.pop(client.sock, None)
+        try:
+            self._sel.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+class Subscriber:
+    '''client of a Publisher
+
+       topics: fnmatch patterns on 'chamber/field'
+       mode:   'latest' or 'history'
+    '''
+
+    def __init__(self, path, topics = ('*',), mode = 'latest',
+                 timeout = None):
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}')
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.timeout = timeout
+        self.latest = {}                # chamber -> {field: value}
+        self._buf = bytearray()
+        self._ready = deque()
+        payload = bytes([MODES.index(mode)]) + \
+                  '\n'.join(topics).encode('utf-8')
+        self.sock.sendall(_HEADER.pack(MAGIC, VERSION, SUBSCRIBE,
+                                       len(payload)) + payload)
+
+    def recv(self, timeout = None):
+        '''next Sample, or None when timeout expires; raises
+           ConnectionError when the publisher goes away
+        '''
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.sock.settimeout(remaining)
+            else:
+                self.sock.settimeout(None)
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                return None
+            if not data:
+                raise ConnectionError('publisher closed the connection')
+            self._buf += data
+            for kind, payload in _frames(self._buf):
+                if kind == SAMPLE:
+                    self._ready.append(unpack_sample(payload))
+        sample = self._ready.popleft()
+        self.latest.setdefault(sample.chamber, {}).update(sample.values)
+        return sample
+
+    def __iter__(self):
+        while True:
+            try:
+                sample = self.recv()
+            except ConnectionError:
+                return
+            if sample is not None:
+                yield sample
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def serve(path, hosts, loops = (1,), cascade = False, outputs = True,
+          rate = 1.0, port = 5025, timeout = 1.0):
+    '''poll hosts and publish their samples on path until interrupted
+    '''
+    from f4tscpi.acquisition import Acquisition
+    with Acquisition(hosts, loops, cascade, outputs, rate = rate,
+                     port = port, timeout = timeout, publish = path):
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'F4T live reading '
+                                     'publisher / subscriber')
+    sub = parser.add_subparsers(dest = 'role', required = True)
+    pub = sub.add_parser('publish')
+    pub.add_argument('path')
+    pub.add_argument('hosts', nargs = '+')
+    pub.add_argument('--port', type = int, default = 5025)
+    pub.add_argument('--timeout', type = float, default = 1.0)
+    pub.add_argument('--loops', nargs = '+', type = int, default = [1])
+    pub.add_argument('--cascade', action = 'store_true')
+    pub.add_argument('--rate', type = float, default = 1.0)
+    cli = sub.add_parser('subscribe')
+    cli.add_argument('path')
+    cli.add_argument('topics', nargs = '*', default = ['*'])
+    cli.add_argument('--history', action = 'store_true',
+                     help = 'every sample instead of the latest values')
+    args = parser.parse_args(argv)
+    if args.role == 'publish':
+        serve(args.path, args.hosts, args.loops, args.cascade,
+              rate = args.rate, port = args.port, timeout = args.timeout)
+        return 0
+    with Subscriber(args.path, args.topics,
+                    'history' if args.history else 'latest') as subscriber:
+        try:
+            for sample in subscriber:
+                values = ' '.join(f'{k}={v}' for k, v in
+                                  sample.values.items())
+                print(f'{sample.t:.3f} {sample.chamber} {values}',
+                      flush = True)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
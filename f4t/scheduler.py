@@ -0,0 +1,221 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: scheduler.py
+
+Priority-based adaptive polling over one F4T connection.
+
+Each field (planner names: 'temp.pv', 'loop1.sp', 'output3', 'units')
+gets a target period and a priority (0 = most important). One thread per
+connection reads, in a single planned exchange, every field that is due,
+most important and most overdue first, and fills spare room in the
+exchange with fields that would fall due before the next exchange, so
+slower fields ride along with fast ones instead of costing their own
+round trip.
+
+Back-off: when the round-trip time per query rises above twice the
+fastest recent one (or exchanges fail), the periods of fields
+with priority 1 and up are stretched by the same factor, up to
+max_backoff; priority 0 fields keep their rate. The time is taken per
+query so a large exchange is not mistaken for a slow chamber.
+
+Writes go through write() and jump the queue: they are sent before the
+next read, at most one exchange after they were queued.
+
+    sched = Scheduler(dev, {'temp.pv': (0.2, 0), 'temp.sp': 1.0,
+                            'output1': 1.0, 'units': (60.0, 2)})
+    sched.start()
+    sched.write(':SOURCE:CLOOP#:SPOINT', 1, value = 85.0)
+'''
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from f4tscpi.scpi import CATALOG, encode, parse
+from f4tscpi.planner import MAX_QUERIES, compile_plan, resolve, supported
+from f4tscpi.f4t_class import F4TError
+
+LOG = logging.getLogger(__name__)
+
+SLACK = 2.0             # RTT over this many times the baseline backs off
+SMOOTHING = 0.2         # weight of the newest RTT in its running average
+DRIFT = 0.002           # rate at which the fast baseline follows slow RTTs
+
+class _Entry:
+    __slots__ = ('field', 'period', 'priority', 'due', 'reads')
+
+    def __init__(self, field, period, priority):
+        if period <= 0:
+            raise ValueError(f'{field}: period must be positive')
+        self.field = field
+        self.period = period
+        self.priority = priority
+        self.due = 0.0
+        self.reads = 0
+
+class Scheduler(threading.Thread):
+    '''adaptive poller of one F4T session
+
+       fields:      {field: period} or {field: (period, priority)}
+       caps:        Capabilities; fields the chamber lacks are dropped
+       listeners:   callables (name, stamp, {field: value}) called after
+                    every exchange with the values it read
+       max_backoff: largest stretch of the lower priority periods
+    '''
+
+    def __init__(self, dev, fields, caps = None, name = None,
+                 listeners = (), max_backoff = 8.0):
+        self.chamber = name or dev._host
+        super().__init__(name = f'sched-{self.chamber}', daemon = True)
+        self.dev = dev
+        self.caps = caps
+        self.max_backoff = max_backoff
+        self.listeners = list(listeners)
+        self.entries = []
+        self.skipped = []
+        for field, spec in fields.items():
+            period, priority = spec if isinstance(spec, tuple) else (spec, 1)
+            if not supported(*resolve(field), caps):
+                self.skipped.append(field)
+                continue
+            self.entries.append(_Entry(field, period, priority))
+        self.values = {}
+        self.stamps = {}
+        self.error = None
+        self.rtt = None                 # running average of exchanges
+        self.cost = None                # running average per query
+        self.backoff = 1.0
+        self.exchanges = 0
+        self.writes = 0
+        self._baseline = None
+        self._writes = queue.Queue()
+        self._wake = threading.Event()
+        self._halt = threading.Event()
+
+    # writes --------------------------------------------------------------
+
+    def write(self, key, *index, value = None, confirm = False):
+        '''queue a write ahead of all pending reads
+
+           returns a Future; with confirm the value is read back in the
+           same exchange and becomes the result of the Future
+        '''
+        cmds = [encode(key, *index, value = value)]
+        readback = key + '?' if confirm else None
+        if readback is not None:
+            if readback not in CATALOG:
+                raise ValueError(f'{key} cannot be read back')
+            cmds.append(encode(readback, *index))
+        future = Future()
+        self._writes.put((cmds, readback, future))
+        self._wake.set()
+        return future
+
+    def _drain_writes(self):
+        while True:
+            try:
+                cmds, readback, future = self._writes.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                replies = self.dev.pipeline(cmds)
+                self.writes += 1
+                result = parse(readback, replies[0]) \
+                         if readback is not None else None
+            except Exception as exc:    # the caller sees every failure
+                future.set_exception(exc)
+                continue
+            future.set_result(result)
+
+    # reads ---------------------------------------------------------------
+
+    def period(self, entry):
+        '''effective period of a field under the current back-off
+        '''
+        return entry.period * (self.backoff if entry.priority > 0 else 1.0)
+
+    def _pick(self, now):
+        '''fields for the next exchange: due ones by priority and lateness,
+           then those that would fall due before the exchange after it
+        '''
+        due = [entry for entry in self.entries if entry.due <= now]
+        if not due:
+            return []
+        horizon = now + min(self.period(entry) for entry in due)
+        soon = [entry for entry in self.entries
+                if now < entry.due <= horizon]
+        due.sort(key = lambda e: (e.priority, e.due))
+        soon.sort(key = lambda e: e.due)
+        return (due + soon)[:MAX_QUERIES]
+
+    def _adapt(self, rtt, queries):
+        cost = rtt / max(queries, 1)
+        self.rtt = rtt if self.rtt is None else \
+                   self.rtt + SMOOTHING * (rtt - self.rtt)
+        self.cost = cost if self.cost is None else \
+                    self.cost + SMOOTHING * (cost - self.cost)
+        if self._baseline is None or cost < self._baseline:
+            self._baseline = cost
+        else:                           # follow lasting changes slowly
+            self._baseline += DRIFT * (cost - self._baseline)
+        self.backoff = min(max(self.cost / (SLACK * self._baseline), 1.0),
+                           self.max_backoff)
+
+    def poll(self):
+        '''run one exchange if anything is due; returns seconds until the
+           next field is due
+        '''
+        now = time.monotonic()
+        batch = self._pick(now)
+        if batch:
+            plan = compile_plan([entry.field for entry in batch], self.caps)
+            try:
+                values = plan.execute(self.dev, retries = 0)
+            except (F4TError, OSError) as exc:
+                LOG.debug('%s: %s', self.chamber, exc)
+                self.error = str(exc) or exc.__class__.__name__
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+                for entry in batch:
+                    entry.due = now + self.period(entry)
+            else:
+                stamp = time.time()
+                self._adapt(time.monotonic() - now, len(plan.commands))
+                self.error = None
+                self.exchanges += 1
+                for entry in batch:
+                    entry.due = now + self.period(entry)
+                    entry.reads += 1
+                    self.stamps[entry.field] = stamp
+                self.values.update(values)
+                for listener in self.listeners:
+                    try:
+                        listener(self.chamber, stamp, values)
+                    except Exception:
+                        LOG.exception('%s: listener failed', self.chamber)
+        if not self.entries:
+            return 1.0
+        return max(min(entry.due for entry in self.entries) -
+                   time.monotonic(), 0.0)
+
+    def run(self):
+        while not self._halt.is_set():
+            self._drain_writes()
+            wait = self.poll()
+            if self._writes.empty():
+                self._wake.wait(wait)
+            self._wake.clear()
+        self._drain_writes()
+
+    def stop(self):
+        self._halt.set()
+        self._wake.set()
+
+    def rates(self):
+        '''{field: (target period, effective period, reads)}
+        '''
+        return {entry.field: (entry.period, self.period(entry), entry.reads)
+                for entry in self.entries}
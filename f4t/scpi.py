@@ -0,0 +1,155 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: scpi.py
+
+Table driven encoding, validation and reply parsing for F4T SCPI commands,
+built once at import time from the generated command catalog (catalog.py).
+The client, the pipelining helpers and the simulator all go through here,
+so a command string is only ever spelled in the command sheet.
+'''
+import math
+import logging
+from itertools import product
+from f4tscpi.catalog import COMMANDS
+
+LOG = logging.getLogger(__name__)
+
+class Command:
+    '''one catalog entry with its pre-rendered headers
+
+       headers maps an index tuple, e.g. (1,) for CLOOP1, to the final
+       command header; encoding is a dictionary lookup.
+    '''
+    __slots__ = ('key', 'rw', 'values', 'index', 'family', 'description',
+                 'headers', '_parse')
+
+    def __init__(self, key, rw, values, index, family, description,
+                 comment = ''):
+        self.key = key
+        self.rw = rw
+        self.values = values
+        self.index = index
+        self.family = family
+        self.description = description
+        ranges = [range(lo, hi + 1) for _, lo, hi in index]
+        parts = key.split('#')
+        self.headers = {}
+        for idx in product(*ranges):
+            head = parts[0]
+            for num, part in zip(idx, parts[1:]):
+                head += f'{num}{part}'
+            self.headers[idx] = head
+        self._parse = PARSERS[values[0]] if values else _strip
+
+    @property
+    def is_query(self):
+        return self.rw == 'R'
+
+    def header(self, *index):
+        '''command header for the given index values
+        '''
+        try:
+            return self.headers[index]
+        except KeyError:
+            raise ValueError(f'{self.key}: index {index} out of range '
+                             f'{self.index}') from None
+
+    def encode(self, *index, value = None):
+        '''complete command line (without EOL); writes validate value
+           against the domain of the command
+        '''
+        head = self.header(*index)
+        if self.rw == 'R':
+            return head
+        if value is None:
+            raise ValueError(f'{self.key}: value required')
+        return f'{head} {self.check(value)}'
+
+    def check(self, value):
+        '''validate and normalize a write value
+        '''
+        kind = self.values[0] if self.values else 'string'
+        if kind == 'float':
+            value = float(value)
+            if not math.isfinite(value):
+                raise ValueError(f'{self.key}: {value} is not a number')
+            return str(value)
+        if kind == 'int':
+            num = int(value)
+            if not self.values[1] <= num <= self.values[2]:
+                raise ValueError(f'{self.key}: {value} not in '
+                                 f'{self.values[1]}-{self.values[2]}')
+            return str(num)
+        if kind == 'enum':
+            text = getattr(value, 'value', value)
+            text = str(text).upper()
+            if text not in self.values[1:]:
+                raise ValueError(f'{self.key}: {value!r} not one of '
+                                 f'{self.values[1:]}')
+            return text
+        return str(value)
+
+    def parse(self, reply):
+        '''convert a reply string to its typed value
+        '''
+        return self._parse(reply)
+
+    def __repr__(self):
+        return f'Command({self.key!r})'
+
+def _strip(reply):
+    return reply.strip()
+
+def _string(reply):
+    return reply.strip().replace('"', '')
+
+def _enum(reply):
+    return reply.strip().upper()
+
+def _idn(reply):
+    return tuple(field.strip() for field in reply.split(','))
+
+PARSERS = {
+    'float': float,
+    'int': int,
+    'enum': _enum,
+    'string': _string,
+    'idn': _idn,
+}
+
+CATALOG = {key: Command(key, **entry) for key, entry in COMMANDS.items()}
+
+def command(key):
+    '''catalog entry for key, e.g. ':SOURCE:CLOOP#:PVALUE?'
+    '''
+    try:
+        return CATALOG[key]
+    except KeyError:
+        raise KeyError(f'{key} is not in the F4T command catalog') from None
+
+def encode(key, *index, value = None):
+    '''shortcut for command(key).encode(...)
+    '''
+    return command(key).encode(*index, value = value)
+
+def parse(key, reply):
+    '''shortcut for command(key).parse(reply)
+    '''
+    return command(key).parse(reply)
+
+def lookup(line):
+    '''reverse lookup of a command line: returns (Command, index, value)
+
+       used by the simulator to dispatch incoming commands
+    '''
+    head, _, value = line.strip().partition(' ')
+    found = _REVERSE.get(head.upper())
+    if found is None:
+        raise KeyError(f'{head} is not in the F4T command catalog')
+    cmd, idx = found
+    return cmd, idx, value.strip() or None
+
+_REVERSE = {head: (cmd, idx) for cmd in CATALOG.values()
+            for idx, head in cmd.headers.items()}
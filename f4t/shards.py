@@ -0,0 +1,406 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: shards.py
+
+Multi-process sharded acquisition for very large fleets.
+
+One Python process runs out of CPU (and GIL) parsing replies for about a
+thousand chambers. ShardedAcquisition splits the hosts across worker
+processes; each worker runs the usual ChamberPollers for its shard and
+sends the samples to the coordinator over a pipe as packed records, in
+one message per flush interval:
+
+    record   chamber index (u4), stamp (f8), one f8 per field
+
+Values are floats as in shmtable (discrete states 1.0 / 0.0, missing NaN).
+The coordinator keeps the latest row per chamber, calls its listeners and
+optionally fills a ValueTable.
+
+Every few seconds the workers report how many of their healthy chambers
+are behind schedule. When one shard lags while another has headroom, a
+part of its chambers is released there and assigned to the other once the
+release is confirmed, so a chamber is never polled by two workers. A
+worker that dies is restarted with its shard; the other shards go on.
+
+    with ShardedAcquisition(hosts, workers = 8, rate = 1.0) as acq:
+        time.sleep(60)
+        print(acq.read('10.30.100.55'), acq.stats())
+'''
+import os
+import sys
+import json
+import time
+import struct
+import logging
+import threading
+import contextlib
+import multiprocessing
+from multiprocessing.connection import wait
+from f4tscpi.shmtable import to_float
+
+LOG = logging.getLogger(__name__)
+
+RECORDS, STATS, RELEASED = b'R', b'S', b'A'
+REPORT_INTERVAL = 2.0       # seconds between worker stats messages
+BEHIND = 0.2                # lagging share of a shard that triggers a move
+HEADROOM = 0.05             # lagging share below which a shard takes more
+MOVE = 0.1                  # share of the lagging shard moved at once
+
+def _record(fields):
+    return struct.Struct(f'=Id{len(fields)}d')
+
+def _address(chamber, port):
+    host, sep, number = chamber.rpartition(':')
+    return (host, int(number)) if sep and number.isdigit() else \
+           (chamber, port)
+
+def _worker(conn, chambers, keys, rate, port, timeout, flush):
+    '''worker process: poll the assigned chambers, ship packed records
+    '''
+    from f4tscpi.f4t_interface import F4T
+    from f4tscpi.dashboard import ChamberPoller
+    fields = [name for name, _, _ in keys]
+    record = _record(fields)
+    index = {name: pos for pos, name in enumerate(chambers)}
+    pending = []
+    lock = threading.Lock()
+    pollers, retiring = {}, []
+
+    def listener(poller):
+        values = poller.values
+        data = record.pack(index[poller.chamber], poller.stamp,
+                           *(to_float(values.get(name)) for name in fields))
+        with lock:
+            pending.append(data)
+
+    def connect(chamber):
+        host, number = _address(chamber, port)
+        return F4T(host = host, port = number, timeout = timeout)
+
+    def assign(names):
+        for name in names:
+            if name in pollers:
+                continue
+            poller = ChamberPoller(name, lambda name = name: connect(name),
+                                   keys, rate)
+            poller.listeners.append(listener)
+            poller.start()
+            pollers[name] = poller
+
+    def released(names):
+        if names:
+            conn.send_bytes(RELEASED + json.dumps(names).encode())
+
+    def release(names):
+        '''stop the pollers of names; each is reported released once its
+           thread has ended, so no two workers poll a chamber at once
+        '''
+        idle = []
+        for name in names:
+            poller = pollers.pop(name, None)
+            if poller is None:
+                idle.append(name)
+            else:
+                poller.stop()
+                retiring.append((name, poller))
+        released(idle)
+
+    def report():
+        now = time.time()
+        late = 2.0 / rate + timeout
+        healthy = [p for p in pollers.values()
+                   if p.error is None and p.stamp is not None]
+        behind = sum(1 for p in healthy if now - p.stamp > late)
+        conn.send_bytes(STATS + json.dumps({
+            'pid': os.getpid(), 'chambers': len(pollers),
+            'healthy': len(healthy), 'behind': behind,
+            'down': sum(1 for p in pollers.values() if p.error is not None),
+            'cpu': time.process_time()}).encode())
+
+    # the library prints connection messages; workers have no console
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        last_report = time.monotonic()
+        while True:
+            if conn.poll(flush):
+                message = json.loads(conn.recv_bytes())
+                if 'stop' in message:
+                    break
+                if 'assign' in message:
+                    assign(message['assign'])
+                if 'release' in message:
+                    release(message['release'])
+            with lock:
+                data, pending[:] = b''.join(pending), []
+            if data:
+                conn.send_bytes(RECORDS + data)
+            ended = [item for item in retiring if not item[1].is_alive()]
+            for item in ended:
+                retiring.remove(item)
+                if item[1].dev is not None:
+                    item[1].dev.close()
+            released([name for name, _ in ended])
+            if time.monotonic() - last_report >= REPORT_INTERVAL:
+                report()
+                last_report = time.monotonic()
+        for poller in pollers.values():
+            poller.stop()
+
+class _Shard:
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.chambers = set()
+        self.stats = {}
+        self.samples = 0
+        self.restarts = 0
+
+class ShardedAcquisition:
+    '''poll hosts from several worker processes
+
+       hosts:     chamber addresses, 'host' or 'host:port'
+       workers:   number of worker processes (default: CPU count)
+       keys:      poller fields (see dashboard.field_keys)
+       listeners: callables (chamber, stamp, {field: value}) called on the
+                  coordinator thread for every sample
+       table:     optional ValueTable receiving every sample
+       rebalance: move chambers away from lagging shards
+    '''
+
+    def __init__(self, hosts, workers = None, keys = None, rate = 1.0,
+                 port = 5025, timeout = 1.0, flush = 0.1, listeners = (),
+                 table = None, rebalance = True, context = 'spawn'):
+        if keys is None:
+            from f4tscpi.dashboard import field_keys
+            keys = field_keys((1,))
+        self.chambers = list(dict.fromkeys(hosts))
+        self.keys = list(keys)
+        self.fields = [name for name, _, _ in self.keys]
+        self.rate = rate
+        self.port = port
+        self.timeout = timeout
+        self.flush = flush
+        self.listeners = list(listeners)
+        self.table = table
+        self.rebalance = rebalance
+        self.rows = {}                  # chamber -> (stamp, values tuple)
+        self.samples = 0
+        self.moves = 0
+        self._record = _record(self.fields)
+        self._context = multiprocessing.get_context(context)
+        self._shards = [_Shard(n) for n in range(workers or os.cpu_count())]
+        self._moving = {}               # chamber -> (source, target) shard
+        self._halt = threading.Event()
+        self._thread = None
+        for pos, chamber in enumerate(self.chambers):
+            self._shards[pos % len(self._shards)].chambers.add(chamber)
+
+    # life cycle ----------------------------------------------------------
+
+    def _spawn(self, shard):
+        parent, child = self._context.Pipe()
+        shard.process = self._context.Process(
+            target = _worker, name = f'f4t-shard-{shard.index}',
+            args = (child, self.chambers, self.keys, self.rate,
+                    self.port, self.timeout, self.flush), daemon = True)
+        shard.process.start()
+        child.close()
+        shard.conn = parent
+        shard.stats = {}
+        self._send(shard, {'assign': sorted(shard.chambers)})
+
+    def _send(self, shard, message):
+        try:
+            shard.conn.send_bytes(json.dumps(message).encode())
+        except OSError as exc:
+            LOG.warning('shard %d: %s', shard.index, exc)
+
+    def start(self):
+        for shard in self._shards:
+            self._spawn(shard)
+        self._thread = threading.Thread(target = self._run, daemon = True,
+                                        name = 'f4t-shards')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._halt.set()
+        if self._thread is not None:
+            self._thread.join()
+        for shard in self._shards:
+            self._send(shard, {'stop': True})
+        for shard in self._shards:
+            shard.process.join(self.timeout + 2.0)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.conn.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # coordinator ---------------------------------------------------------
+
+    def _run(self):
+        last_balance = time.monotonic()
+        while not self._halt.is_set():
+            conns = {shard.conn: shard for shard in self._shards}
+            sentinels = {shard.process.sentinel: shard
+                         for shard in self._shards}
+            for ready in wait(list(conns) + list(sentinels), self.flush):
+                shard = conns.get(ready)
+                if shard is None:
+                    shard = sentinels[ready]
+                    if ready == shard.process.sentinel:
+                        self._restart(shard)
+                    continue
+                if ready is not shard.conn:
+                    continue            # restarted during this round
+                try:
+                    message = ready.recv_bytes()
+                except (EOFError, OSError):
+                    self._restart(shard)
+                    continue
+                self._handle(shard, message)
+            if self.rebalance and \
+               time.monotonic() - last_balance >= 2 * REPORT_INTERVAL:
+                self._balance()
+                last_balance = time.monotonic()
+
+    def _handle(self, shard, message):
+        kind, body = message[:1], memoryview(message)[1:]
+        if kind == RECORDS:
+            record = self._record
+            for row in record.iter_unpack(body):
+                chamber = self.chambers[row[0]]
+                self.rows[chamber] = (row[1], row[2:])
+                shard.samples += 1
+                self.samples += 1
+                if self.table is not None:
+                    self.table.put(chamber, row[1],
+                                   dict(zip(self.fields, row[2:])))
+                if self.listeners:
+                    values = dict(zip(self.fields, row[2:]))
+                    for listener in self.listeners:
+                        try:
+                            listener(chamber, row[1], values)
+                        except Exception:
+                            LOG.exception('%s: listener failed', chamber)
+        elif kind == STATS:
+            shard.stats = json.loads(bytes(body))
+        elif kind == RELEASED:
+            for chamber in json.loads(bytes(body)):
+                _, target = self._moving.pop(chamber, (None, None))
+                if target is not None:
+                    target.chambers.add(chamber)
+                    self._send(target, {'assign': [chamber]})
+
+    def _restart(self, shard):
+        if self._halt.is_set():
+            return
+        if shard.process.is_alive():
+            shard.process.terminate()   # pipe broken, process hung
+        shard.process.join()
+        LOG.error('shard %d: worker died (exit code %s), restarting',
+                  shard.index, shard.process.exitcode)
+        shard.conn.close()
+        shard.restarts += 1
+        # chambers on their way out of this shard go straight to the target
+        for chamber, (source, target) in list(self._moving.items()):
+            if source is shard:
+                del self._moving[chamber]
+                target.chambers.add(chamber)
+                self._send(target, {'assign': [chamber]})
+        self._spawn(shard)
+
+    def _lag(self, shard):
+        stats = shard.stats
+        if not stats.get('healthy'):
+            return None
+        return stats['behind'] / stats['healthy']
+
+    def _balance(self):
+        '''move chambers from the most lagging shard to the least loaded
+        '''
+        if self._moving:
+            return                      # previous move still in flight
+        lags = []
+        for shard in self._shards:
+            lag = self._lag(shard)
+            if lag is not None:
+                lags.append((lag, shard))
+        if len(lags) < 2:
+            return
+        worst, source = max(lags, key = lambda item: item[0])
+        best, target = min(lags, key = lambda item: item[0])
+        if worst < BEHIND or best > HEADROOM or source is target:
+            return
+        count = max(1, int(len(source.chambers) * MOVE))
+        names = sorted(source.chambers)[:count]
+        LOG.info('moving %d chamber(s) from shard %d to shard %d',
+                 count, source.index, target.index)
+        for name in names:
+            source.chambers.discard(name)
+            self._moving[name] = (source, target)
+        self.moves += count
+        source.stats = target.stats = {}    # wait for fresh reports
+        self._send(source, {'release': names})
+
+    # results -------------------------------------------------------------
+
+    def read(self, chamber):
+        '''(stamp, {field: value}) of the latest sample, None before one
+        '''
+        row = self.rows.get(chamber)
+        if row is None:
+            return None
+        return row[0], dict(zip(self.fields, row[1]))
+
+    def stats(self):
+        '''per shard: chambers, samples, restarts and the latest report
+        '''
+        return [{'shard': shard.index, 'chambers': len(shard.chambers),
+                 'samples': shard.samples, 'restarts': shard.restarts,
+                 **shard.stats} for shard in self._shards]
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(description = 'sharded F4T acquisition')
+    parser.add_argument('hosts', nargs = '+', help = "'host' or 'host:port'")
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--rate', type = float, default = 1.0)
+    parser.add_argument('--timeout', type = float, default = 1.0)
+    parser.add_argument('--port', type = int, default = 5025)
+    parser.add_argument('--loops', nargs = '+', type = int, default = [1])
+    parser.add_argument('--table', metavar = 'NAME',
+                        help = 'keep the latest values in this shared '
+                               'memory table')
+    args = parser.parse_args(argv)
+    from f4tscpi.dashboard import field_keys
+    keys = field_keys(args.loops)
+    table = None
+    if args.table:
+        from f4tscpi.shmtable import ValueTable
+        table = ValueTable(list(dict.fromkeys(args.hosts)),
+                           [name for name, _, _ in keys], args.table)
+    acq = ShardedAcquisition(args.hosts, args.workers, keys, args.rate,
+                             args.port, args.timeout, table = table)
+    with acq:
+        try:
+            while True:
+                time.sleep(10)
+                for row in acq.stats():
+                    print(json.dumps(row), flush = True)
+        except KeyboardInterrupt:
+            pass
+    if table is not None:
+        table.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: shmtable.py
+
+Shared-memory table of the latest value of every chamber field.
+
+A ValueTable is created by the acquisition process and filled by its
+ChamberPollers (as a listener). Any local process attaches a TableReader
+by name and reads current values straight from shared memory: no socket
+I/O, no serialization, and the cost of a read does not depend on the
+number of readers.
+
+Layout (native byte order, fixed at creation):
+
+    header   magic b'F4TT', version, chambers, fields, size of the names
+    names    chamber names then field names, utf-8, newline separated
+    rows     one per chamber: sequence (u8), stamp (f8), one f8 per field
+
+Each row is a seqlock: the writer makes the sequence odd, writes the row
+and makes it even again. A reader copies the row and retries while the
+sequence was odd or changed during the copy, so it never sees half of an
+update. Values are floats; discrete states are stored as 1.0 (ON, ERROR)
+or 0.0 (OFF, NONE) and a missing value as NaN.
+'''
+import math
+import time
+import struct
+import logging
+import threading
+from multiprocessing import shared_memory
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'F4TT'
+VERSION = 1
+_HEADER = struct.Struct('=4sHHHI')
+_SEQ = struct.Struct('=Q')
+STATES = {'ON': 1.0, 'ERROR': 1.0, 'OFF': 0.0, 'NONE': 0.0}
+RETRIES = 1000          # reads attempted before giving up on a busy row
+_TRACK_LOCK = threading.Lock()
+
+def _align(size):
+    return (size + 7) & ~7
+
+def _attach(name):
+    '''open an existing segment without letting this process's resource
+       tracker remove it at exit
+    '''
+    try:
+        return shared_memory.SharedMemory(name = name, track = False)
+    except TypeError:                   # Python < 3.13: no track argument
+        pass
+    from multiprocessing import resource_tracker
+    with _TRACK_LOCK:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name = name)
+        finally:
+            resource_tracker.register = register
+
+def to_float(value):
+    '''value as stored in a table row (see module docstring)
+    '''
+    if value is None:
+        return math.nan
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return STATES.get(value, math.nan)
+
+class _Layout:
+
+    def __init__(self, chambers, fields):
+        self.chambers = tuple(chambers)
+        self.fields = tuple(fields)
+        self.names = '\n'.join(self.chambers + self.fields).encode('utf-8')
+        self.row = struct.Struct(f'=Qd{len(self.fields)}d')
+        self.start = _align(_HEADER.size + len(self.names))
+        self.size = self.start + self.row.size * len(self.chambers)
+        self.index = {name: pos for pos, name in enumerate(self.chambers)}
+        self.column = {name: pos for pos, name in enumerate(self.fields)}
+
+    def offset(self, chamber):
+        return self.start + self.row.size * self.index[chamber]
+
+class ValueTable:
+    '''writer side; create once per acquisition process
+
+       chambers, fields: names of the rows and columns
+       name:             shared memory name (generated when None)
+    '''
+
+    def __init__(self, chambers, fields, name = None):
+        self.layout = layout = _Layout(chambers, fields)
+        self.shm = shared_memory.SharedMemory(name = name, create = True,
+                                              size = layout.size)
+        self.name = self.shm.name
+        buf = self.shm.buf
+        _HEADER.pack_into(buf, 0, MAGIC, VERSION, len(layout.chambers),
+                          len(layout.fields), len(layout.names))
+        buf[_HEADER.size:_HEADER.size + len(layout.names)] = layout.names
+        empty = [math.nan] * len(layout.fields)
+        for chamber in layout.chambers:
+            layout.row.pack_into(buf, layout.offset(chamber), 0, math.nan,
+                                 *empty)
+
+    def put(self, chamber, stamp, values):
+        '''write the values of one chamber; fields not in the table are
+           ignored, fields not in values keep their value
+        '''
+        layout = self.layout
+        buf = self.shm.buf
+        offset = layout.offset(chamber)
+        row = list(layout.row.unpack_from(buf, offset))
+        for field, value in values.items():
+            pos = layout.column.get(field)
+            if pos is not None:
+                row[2 + pos] = to_float(value)
+        seq = row[0]
+        row[0], row[1] = seq + 2, stamp
+        _SEQ.pack_into(buf, offset, seq + 1)            # odd: being written
+        layout.row.pack_into(buf, offset, seq + 1, *row[1:])
+        _SEQ.pack_into(buf, offset, seq + 2)            # even: consistent
+
+    def listener(self, poller):
+        '''callback for ChamberPoller.listeners
+        '''
+        self.put(poller.chamber, poller.stamp, poller.values)
+
+    def close(self, unlink = True):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TableReader:
+    '''reader side; attach by the name of a ValueTable
+    '''
+
+    def __init__(self, name):
+        self.shm = _attach(name)
+        buf = self.shm.buf
+        magic, version, chambers, fields, size = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError(f'{name}: not a value table')
+        names = bytes(buf[_HEADER.size:_HEADER.size + size])
+        names = names.decode('utf-8').split('\n')
+        self.layout = _Layout(names[:chambers], names[chambers:])
+        self.name = name
+
+    @property
+    def chambers(self):
+        return self.layout.chambers
+
+    @property
+    def fields(self):
+        return self.layout.fields
+
+    def row(self, chamber):
+        '''(sequence, stamp, values tuple) of one chamber, consistent
+        '''
+        layout = self.layout
+        buf = self.shm.buf
+        offset = layout.offset(chamber)
+        unpack = layout.row.unpack_from
+        for _ in range(RETRIES):
+            row = unpack(buf, offset)
+            if not row[0] & 1 and _SEQ.unpack_from(buf, offset)[0] == row[0]:
+                return row[0], row[1], row[2:]
+            time.sleep(0)
+        raise TimeoutError(f'{chamber}: row kept changing')
+
+    def read(self, chamber):
+        '''(stamp, {field: value}) of one chamber; stamp is NaN before the
+           first write
+        '''
+        _, stamp, values = self.row(chamber)
+        return stamp, dict(zip(self.layout.fields, values))
+
+    def get(self, chamber, field):
+        return self.row(chamber)[2][self.layout.column[field]]
+
+    def snapshot(self):
+        '''{chamber: (stamp, {field: value})} of every chamber
+        '''
+        return {chamber: self.read(chamber) for chamber in self.chambers}
+
+    def close(self):
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
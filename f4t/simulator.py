@@ -0,0 +1,474 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: simulator.py
+
+Simulated F4T endpoints and a load generator for sizing the polling path.
+
+A Simulator runs any number of lightweight F4T endpoints on localhost
+ports from a single asyncio thread. Incoming lines are dispatched through
+the command catalog (scpi.lookup), so every catalog command is answered.
+Each endpoint has:
+
+    latency    per-reply delay, lognormal around a median (or a callable)
+    faults     failure injection per reply: connection reset, stall,
+               garbage reply
+    thermal    first-order model per loop: PV follows SP with time
+               constant tau, plus gaussian noise
+
+load_test() connects library clients to N endpoints and runs polling
+sweeps with ChamberPoller.poll (the dashboard/acquisition path), then
+reports sweep times, client CPU per chamber and memory per connection.
+
+    python -m f4tscpi.simulator --chambers 1000 --sweeps 20 --stall 0.001
+'''
+import io
+import sys
+import math
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import tracemalloc
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from f4tscpi.scpi import lookup
+
+LOG = logging.getLogger(__name__)
+
+FAULTS = ('reset', 'stall', 'garbage')
+
+class Faults:
+    '''failure injection probabilities, drawn once per reply
+
+       reset:      close the connection instead of replying
+       stall:      delay the reply by stall_time (usually past timeouts)
+       garbage:    reply with a line of random bytes
+    '''
+
+    def __init__(self, reset = 0.0, stall = 0.0, garbage = 0.0,
+                 stall_time = 30.0):
+        self.reset = reset
+        self.stall = stall
+        self.garbage = garbage
+        self.stall_time = stall_time
+
+    def draw(self, rng):
+        roll = rng.random()
+        for name in FAULTS:
+            roll -= getattr(self, name)
+            if roll < 0:
+                return name
+        return None
+
+def lognormal(median = 0.005, sigma = 0.5):
+    '''latency sampler: lognormal delay around median seconds
+    '''
+    mu = math.log(median) if median > 0 else None
+    def sample(rng):
+        return 0.0 if mu is None else rng.lognormvariate(mu, sigma)
+    return sample
+
+class Thermal:
+    '''first-order process: PV moves toward SP with time constant tau
+    '''
+
+    def __init__(self, pv = 23.0, tau = 600.0, noise = 0.05, speed = 1.0):
+        self.pv = pv
+        self.sp = pv
+        self.tau = tau
+        self.noise = noise
+        self.speed = speed
+        self._t = time.monotonic()
+
+    def read(self, rng):
+        now = time.monotonic()
+        dt = (now - self._t) * self.speed
+        self._t = now
+        self.pv = self.sp + (self.pv - self.sp) * math.exp(-dt / self.tau)
+        return self.pv + rng.gauss(0.0, self.noise)
+
+def _default(cmd):
+    kind = cmd.values[0] if cmd.values else 'string'
+    if kind == 'float':
+        return '0.0'
+    if kind == 'enum':
+        return cmd.values[1]
+    return '""'
+
+class SimChamber:
+    '''state and command handling of one simulated F4T
+
+       loops:    number of control loops (1-4); queries of other loops
+                 get an empty reply, like an unconfigured loop
+       cascade:  whether the cascade loop is present
+    '''
+
+    def __init__(self, serial, loops = 2, cascade = False, profiles = 3,
+                 latency = 0.0, faults = None, tau = 600.0, noise = 0.05,
+                 speed = 1.0, seed = None, firmware = '01.00'):
+        self.idn = f'WATLOW,F4T,{serial},{firmware}'
+        self.loops = loops
+        self.cascade = cascade
+        self.latency = latency if callable(latency) else \
+                       (lambda rng, value = latency: value)
+        self.faults = faults or Faults()
+        self.rng = random.Random(seed)
+        self.thermal = {f'CLOOP{n}': Thermal(tau = tau, noise = noise,
+                                             speed = speed)
+                        for n in range(1, loops + 1)}
+        if cascade:
+            self.thermal['OUTER'] = Thermal(tau = tau, noise = noise,
+                                            speed = speed)
+            self.thermal['INNER'] = Thermal(tau = tau / 3, noise = noise,
+                                            speed = speed)
+        self.names = {n: f'"Profile {n}"' for n in range(1, profiles + 1)}
+        self.state = {}             # write header -> value
+        self.program = 1
+        self.step = 1
+        self.run_state = 'STOP'
+        self.connections = 0
+        self.requests = 0
+        self.injected = dict.fromkeys(FAULTS, 0)
+
+    def _present(self, head):
+        for node in head.split(':'):
+            if node.startswith('CLOOP') and \
+               int(node[5:]) > self.loops:
+                return False
+            if node.startswith('CASCADE') and not self.cascade:
+                return False
+        return True
+
+    def _process(self, head):
+        if ':INNER:' in head:
+            return self.thermal['INNER']
+        if head.startswith(':SOURCE:CASCADE'):
+            return self.thermal['OUTER']
+        return self.thermal[head.split(':')[2]]
+
+    def handle(self, line):
+        '''answer one command line; None for writes (no reply)
+        '''
+        self.requests += 1
+        try:
+            cmd, idx, value = lookup(line)
+        except KeyError:
+            LOG.debug('unknown command: %s', line.strip())
+            return '' if '?' in line else None
+        head = cmd.header(*idx)
+        if not self._present(head):
+            return '' if cmd.is_query else None
+        if not cmd.is_query:
+            try:
+                value = cmd.check(value)
+            except (TypeError, ValueError):
+                return None             # the F4T ignores invalid writes
+            self._write(head, value)
+            return None
+        return self._read(cmd, head.rstrip('?'))
+
+    def _write(self, head, value):
+        if head == ':PROGRAM:NUMBER':
+            self.program = int(value)
+        elif head == ':PROGRAM:STEP':
+            self.step = int(value)
+        elif head == ':PROGRAM:SELECTED:STATE':
+            self.run_state = value
+        elif head.endswith(':SPOINT'):
+            if head.startswith(':SOURCE:CASCADE'):
+                self.thermal['OUTER'].sp = self.thermal['INNER'].sp = \
+                    float(value)
+            else:
+                self._process(head).sp = float(value)
+        self.state[head] = value
+
+    def _read(self, cmd, head):
+        if head == '*IDN':
+            return self.idn
+        if head == ':PROGRAM:NAME':
+            return self.names.get(self.program, '""')
+        if head.endswith(':PVALUE'):
+            return f'{self._process(head).read(self.rng):.1f}'
+        if head.endswith(':SPOINT'):
+            return f'{self._process(head).sp:.1f}'
+        if head.endswith(':NAME'):
+            return f'"Output {head.split(":")[1][6:]}"'
+        if head.endswith(':ERROR'):
+            return 'NONE'
+        return self.state.get(head, _default(cmd))
+
+class Simulator:
+    '''simulated endpoints served from one background asyncio thread
+
+       use as a context manager; add() returns the chambers it started,
+       ports lists (port, chamber) of every endpoint
+    '''
+
+    def __init__(self, host = '127.0.0.1'):
+        self.host = host
+        self.ports = []
+        self._loop = asyncio.new_event_loop()
+        self._servers = []
+        self._thread = threading.Thread(target = self._loop.run_forever,
+                                         name = 'f4t-simulator',
+                                         daemon = True)
+        self._thread.start()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def add(self, count = 1, seed = 0, **kwargs):
+        '''start count endpoints; kwargs go to SimChamber
+        '''
+        start = len(self.ports)
+        chambers = [SimChamber(f'SIM{start + i:05d}', seed = seed + start + i,
+                               **kwargs) for i in range(count)]
+        self.ports.extend(self._call(self._start(chambers)))
+        return chambers
+
+    async def _start(self, chambers):
+        ports = []
+        for chamber in chambers:
+            server = await asyncio.start_server(
+                lambda r, w, c = chamber: self._serve(c, r, w),
+                self.host, 0)
+            self._servers.append(server)
+            ports.append((server.sockets[0].getsockname()[1], chamber))
+        return ports
+
+    async def _serve(self, chamber, reader, writer):
+        chamber.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = chamber.handle(line.decode('ascii', 'replace'))
+                if reply is None:
+                    continue
+                delay = chamber.latency(chamber.rng)
+                fault = chamber.faults.draw(chamber.rng)
+                if fault is not None:
+                    chamber.injected[fault] += 1
+                if fault == 'reset':
+                    writer.transport.abort()
+                    return
+                if fault == 'stall':
+                    delay += chamber.faults.stall_time
+                elif fault == 'garbage':
+                    reply = bytes(chamber.rng.randrange(33, 256) for _ in
+                                  range(12)).decode('latin-1')
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                writer.write(reply.encode('latin-1') + b'\n')
+                await writer.drain()
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            pass                        # client gone or simulator stopping
+        finally:
+            chamber.connections -= 1
+            writer.close()
+
+    def cpu_time(self):
+        '''CPU seconds used by the simulator thread so far
+        '''
+        return self._call(self._cpu())
+
+    async def _cpu(self):
+        return time.thread_time()
+
+    async def _close(self):
+        for server in self._servers:
+            server.close()
+        tasks = [task for task in asyncio.all_tasks()
+                 if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+    def stop(self):
+        if self._loop.is_running():
+            self._call(self._close())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def _percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+def _rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def load_test(chambers = 100, sweeps = 10, workers = 64, loops = 2,
+              cascade = False, outputs = True, timeout = 1.0, rate = 1.0,
+              period = None, **sim):
+    '''poll chambers simulated endpoints sweeps times with a pool of
+       workers; sim keyword arguments go to SimChamber (latency, faults,
+       tau, ...). period paces sweeps (default: back to back).
+       Returns a report dict.
+    '''
+    from f4tscpi.f4t_interface import F4T
+    from f4tscpi.dashboard import ChamberPoller, field_keys
+
+    keys = field_keys(range(1, loops + 1), cascade, outputs)
+    report = {'chambers': chambers, 'fields': len(keys), 'workers': workers}
+    # every connect prints a banner; keep thousands of them off stdout
+    with contextlib.redirect_stdout(io.StringIO()), Simulator() as simulator, \
+         ThreadPoolExecutor(max_workers = workers) as pool:
+        simulator.add(chambers, loops = loops, cascade = cascade, **sim)
+
+        def connect(port):
+            return F4T(host = simulator.host, port = port, timeout = timeout)
+
+        rss = _rss_kb()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.monotonic()
+        pollers = []
+        for (port, _), dev in zip(simulator.ports, pool.map(
+                lambda p: _try(connect, p[0]), simulator.ports)):
+            poller = ChamberPoller(f'{simulator.host}:{port}',
+                                   lambda p = port: connect(p), keys, rate)
+            poller.dev = dev
+            pollers.append(poller)
+        report['connect_time'] = time.monotonic() - start
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        connected = sum(p.dev is not None for p in pollers)
+        report['connected'] = connected
+        report['bytes_per_connection'] = used / max(connected, 1)
+        if rss is not None:
+            report['rss_kb_per_connection'] = (_rss_kb() - rss) / \
+                                              max(connected, 1)
+
+        def poll(poller):
+            t0 = time.monotonic()
+            try:
+                if poller.dev is None:
+                    poller.dev = poller.connect()
+                poller.poll()
+                return time.monotonic() - t0, None
+            except Exception as exc:
+                return time.monotonic() - t0, exc.__class__.__name__
+
+        sweep_times, latencies, errors = [], [], {}
+        cpu0, sim0 = time.process_time(), simulator.cpu_time()
+        due = time.monotonic()
+        for _ in range(sweeps):
+            start = time.monotonic()
+            for latency, error in pool.map(poll, pollers):
+                latencies.append(latency)
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+            sweep_times.append(time.monotonic() - start)
+            if period:
+                due += period
+                time.sleep(max(0.0, due - time.monotonic()))
+        sim_cpu = simulator.cpu_time() - sim0
+        client_cpu = time.process_time() - cpu0 - sim_cpu
+        for poller in pollers:
+            if poller.dev is not None:
+                poller.dev.close()
+        report.update({
+            'sweep_p50': _percentile(sweep_times, 0.5),
+            'sweep_p95': _percentile(sweep_times, 0.95),
+            'sweep_max': max(sweep_times),
+            'poll_p50': _percentile(latencies, 0.5),
+            'poll_p99': _percentile(latencies, 0.99),
+            'errors': errors,
+            'client_cpu_per_chamber_sweep': client_cpu / (chambers * sweeps),
+            'sim_cpu_per_chamber_sweep': sim_cpu / (chambers * sweeps),
+            'injected': _injected(simulator),
+        })
+    return report
+
+def _try(connect, port):
+    try:
+        return connect(port)
+    except Exception as exc:
+        LOG.debug('port %d: %s', port, exc)
+        return None
+
+def _injected(simulator):
+    total = dict.fromkeys(FAULTS, 0)
+    for _, chamber in simulator.ports:
+        for name, count in chamber.injected.items():
+            total[name] += count
+    return total
+
+def _raise_fd_limit(needed):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        limit = needed if hard == resource.RLIM_INFINITY else \
+                min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'F4T simulator and '
+                                     'polling load generator')
+    parser.add_argument('--chambers', type = int, default = 100)
+    parser.add_argument('--sweeps', type = int, default = 10)
+    parser.add_argument('--workers', type = int, default = 64)
+    parser.add_argument('--loops', type = int, default = 2)
+    parser.add_argument('--cascade', action = 'store_true')
+    parser.add_argument('--timeout', type = float, default = 1.0)
+    parser.add_argument('--period', type = float, default = None,
+                        help = 'seconds between sweep starts')
+    parser.add_argument('--latency', type = float, default = 0.005,
+                        help = 'median reply latency (s)')
+    parser.add_argument('--sigma', type = float, default = 0.5,
+                        help = 'lognormal spread of the latency')
+    parser.add_argument('--reset', type = float, default = 0.0)
+    parser.add_argument('--stall', type = float, default = 0.0)
+    parser.add_argument('--garbage', type = float, default = 0.0)
+    parser.add_argument('--stall-time', type = float, default = 30.0)
+    parser.add_argument('--serve', action = 'store_true',
+                        help = 'only run the endpoints and list their ports')
+    args = parser.parse_args(argv)
+    _raise_fd_limit(args.chambers * 3 + 256)
+    sim = dict(latency = lognormal(args.latency, args.sigma),
+               faults = Faults(args.reset, args.stall, args.garbage,
+                               args.stall_time))
+    if args.serve:
+        with Simulator() as simulator:
+            simulator.add(args.chambers, loops = args.loops,
+                          cascade = args.cascade, **sim)
+            for port, chamber in simulator.ports:
+                print(f'{simulator.host}:{port} {chamber.idn}')
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        return 0
+    report = load_test(args.chambers, args.sweeps, args.workers, args.loops,
+                       args.cascade, timeout = args.timeout,
+                       period = args.period, **sim)
+    for key, value in report.items():
+        if isinstance(value, float):
+            value = f'{value:.6f}'
+        print(f'{key:<30} {value}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
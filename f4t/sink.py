@@ -0,0 +1,301 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: sink.py
+
+Background writer pipeline for logging samples to disk.
+
+Acquisition code hands rows to a SampleWriter through a bounded in-memory
+queue and returns immediately; a writer thread drains the queue in
+batches, writes them as CSV in large chunks, fsyncs periodically and
+rotates files by size or age. Disk stalls (NFS, log rotation) therefore
+never delay the next read from the controller.
+
+A failing disk does not stop the writer: a failed write, fsync, rotation
+or reopen is logged and counted (errors), the file is reopened on the
+next round and the reason stays in error until a write succeeds again.
+Rows of a failed write are written again after the reopen; rows that
+close() still cannot write after CLOSE_RETRIES attempts are counted as
+dropped.
+
+Overflow policy when the queue is full:
+    'block'        wait for room (lossless, acquisition may stall)
+    'drop_oldest'  discard the oldest queued row and count it
+    'spill'        keep the row in an unbounded in-memory overflow list
+'''
+import io
+import os
+import csv
+import time
+import logging
+import threading
+from collections import deque
+
+LOG = logging.getLogger(__name__)
+
+FIELDS = ('t', 'chamber', 'field', 'value')
+POLICIES = ('block', 'drop_oldest', 'spill')
+CLOSE_RETRIES = 3       # failed writes of one batch tolerated while closing
+
+class SampleWriter(threading.Thread):
+    '''bounded queue + background CSV writer
+
+       path:             log file; rotated files get a time stamp suffix
+       maxsize:          queue capacity in rows
+       policy:           overflow policy, see module docstring
+       batch:            rows per write chunk
+       flush_interval:   seconds between writes when rows are pending
+       fsync_interval:   seconds between fsync calls (None: never)
+       max_bytes:        rotate when the file grows past this size
+       rotate_interval:  rotate when the file is older than this (seconds)
+    '''
+
+    def __init__(self, path, maxsize = 10000, policy = 'drop_oldest',
+                 batch = 1000, flush_interval = 1.0, fsync_interval = 10.0,
+                 max_bytes = None, rotate_interval = None, header = FIELDS):
+        super().__init__(name = f'sink-{os.path.basename(path)}',
+                         daemon = True)
+        if policy not in POLICIES:
+            raise ValueError(f'policy must be one of {POLICIES}')
+        self.path = path
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch = batch
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.header = header
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.rotations = 0
+        self.errors = 0
+        self.error = None               # last disk failure, None once healthy
+        self._queue = deque()
+        self._spill = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._file = None
+        self._opened = None
+        self._synced = time.monotonic()
+        self._failed_writes = 0         # in a row
+
+    # producer side -------------------------------------------------------
+
+    def put(self, row):
+        '''queue one row (a tuple matching header)
+        '''
+        with self._cond:
+            if self._closing:
+                raise ValueError('writer is closed')
+            if self._spill:
+                # keep order: once spilling, append behind the spill
+                self._spill.append(row)
+                self.spilled += 1
+                self.queued += 1
+                return
+            if len(self._queue) >= self.maxsize:
+                if self.policy == 'block':
+                    while len(self._queue) >= self.maxsize and \
+                          not self._closing:
+                        self._cond.wait()
+                elif self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self._spill.append(row)
+                    self.spilled += 1
+                    self.queued += 1
+                    return
+            self._queue.append(row)
+            self.queued += 1
+            if len(self._queue) >= self.batch:
+                self._cond.notify_all()
+
+    def put_many(self, rows):
+        for row in rows:
+            self.put(row)
+
+    def snapshot(self, chamber, t, values):
+        '''queue one poll result: values maps field name to value
+        '''
+        for field, value in values.items():
+            self.put((round(t, 3), chamber, field, value))
+
+    def listener(self, poller):
+        '''callback for ChamberPoller.listeners
+        '''
+        self.snapshot(poller.chamber, poller.stamp, poller.values)
+
+    @property
+    def backlog(self):
+        return len(self._queue) + len(self._spill)
+
+    def stats(self):
+        return {'queued': self.queued, 'written': self.written,
+                'dropped': self.dropped, 'spilled': self.spilled,
+                'backlog': self.backlog, 'rotations': self.rotations,
+                'errors': self.errors, 'error': self.error}
+
+    def close(self, timeout = None):
+        '''write everything still queued, then stop the thread
+        '''
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+
+    def __enter__(self):
+        if not self.is_alive():
+            self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # writer side ---------------------------------------------------------
+
+    def _take(self):
+        '''move up to batch rows out of the queues
+        '''
+        rows = []
+        with self._cond:
+            while (not self._queue and not self._spill and
+                   not self._closing):
+                self._cond.wait(self.flush_interval)
+            while self._queue and len(rows) < self.batch:
+                rows.append(self._queue.popleft())
+            while self._spill and len(rows) < self.batch:
+                rows.append(self._spill.popleft())
+            if rows:
+                self._cond.notify_all()     # room for blocked producers
+        return rows
+
+    def _open(self):
+        new = not os.path.exists(self.path) or \
+              os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a', buffering = 1 << 20, newline = '')
+        self._opened = time.time()
+        if new and self.header:
+            self._file.write(','.join(self.header) + '\r\n')
+
+    def _rotate_due(self):
+        if self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+            return True
+        return self.rotate_interval is not None and \
+               time.time() - self._opened >= self.rotate_interval
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        target = f'{self.path}.{stamp}'
+        n = 1
+        while os.path.exists(target):
+            target = f'{self.path}.{stamp}.{n}'
+            n += 1
+        os.replace(self.path, target)
+        self.rotations += 1
+        LOG.info('rotated %s to %s', self.path, target)
+        self._open()
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync_interval is not None:
+            os.fsync(self._file.fileno())
+        self._synced = time.monotonic()
+
+    def _write(self, rows):
+        chunk = io.StringIO()
+        csv.writer(chunk).writerows(rows)
+        self._file.write(chunk.getvalue())
+        self._file.flush()
+        self.written += len(rows)
+
+    def _guard(self, what, action, *args):
+        '''run action; an OSError is counted and kept in error, and the
+           file is dropped so that the next round reopens it
+        '''
+        try:
+            action(*args)
+        except OSError as exc:
+            self.errors += 1
+            error = f'{what} failed: {exc}'
+            if error != self.error:     # log a lasting failure once
+                LOG.error('%s: %s', self.path, error)
+            self.error = error
+            self._discard()
+            return False
+        return True
+
+    def _discard(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _wait_for_disk(self):
+        '''after a failed open: retry later, or give up once closing
+        '''
+        with self._cond:
+            if self._closing:
+                lost = self.backlog
+                self._queue.clear()
+                self._spill.clear()
+                self.dropped += lost
+                LOG.error('%s: %d row(s) not written', self.path, lost)
+                return False
+            self._cond.wait(self.flush_interval)
+        return True
+
+    def _requeue(self, rows):
+        '''put rows of a failed write back in front for the reopened file,
+           or count them as dropped when closing and retrying did not help
+        '''
+        with self._cond:
+            if self._closing and self._failed_writes >= CLOSE_RETRIES:
+                self.dropped += len(rows)
+                LOG.error('%s: %d row(s) not written', self.path, len(rows))
+                return
+            self._queue.extendleft(reversed(rows))
+            if not self._closing:
+                self._cond.wait(self.flush_interval)    # let the disk recover
+
+    def _maybe_rotate(self):
+        if self._rotate_due():
+            self._rotate()
+
+    def run(self):
+        try:
+            while True:
+                if self._file is None and not self._guard('open', self._open):
+                    if not self._wait_for_disk():
+                        break
+                    continue
+                rows = self._take()
+                if rows:
+                    if self._guard('write', self._write, rows):
+                        self.error = None
+                        self._failed_writes = 0
+                    else:
+                        self._failed_writes += 1
+                        self._requeue(rows)
+                if self._file is not None and \
+                   self.fsync_interval is not None and \
+                   time.monotonic() - self._synced >= self.fsync_interval:
+                    self._guard('fsync', self._sync)
+                if self._file is not None:
+                    self._guard('rotate', self._maybe_rotate)
+                with self._cond:
+                    if self._closing and not self._queue and not self._spill:
+                        break
+        finally:
+            if self._file is not None:
+                self._guard('fsync', self._sync)
+            self._discard()
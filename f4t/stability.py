@@ -0,0 +1,281 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: stability.py
+
+Online stability detection on the PV stream. A detector is fed one sample
+at a time and keeps running sums over a sliding time window, so each update
+is O(1) amortized. It signals the moment a loop has stayed within tolerance
+of its set point for the required hold time, which lets a soak step end as
+soon as the chamber has settled instead of after a fixed wait.
+'''
+import time
+import logging
+import threading
+from collections import deque
+from f4tscpi.f4t_class import F4TError
+
+LOG = logging.getLogger(__name__)
+
+class StabilityDetector:
+    '''sliding-window stability detector for a single loop
+
+       tol:       allowed |PV - SP| band
+       hold:      seconds PV must stay inside the band
+       window:    seconds of history for mean/variance/slope
+       max_slope: allowed |slope| in units per minute (None: not checked)
+       max_std:   allowed standard deviation over window (None: not checked)
+       sp_tol:    set point changes up to this size are followed without
+                  restarting detection (e.g. the inner SP of a cascade)
+    '''
+
+    def __init__(self, sp = None, tol = 0.5, hold = 300.0, window = 60.0,
+                 max_slope = None, max_std = None, sp_tol = 0.0):
+        self.sp = sp
+        self.sp_tol = sp_tol
+        self.tol = tol
+        self.hold = hold
+        self.window = window
+        self.max_slope = max_slope
+        self.max_std = max_std
+        self.event = threading.Event()
+        self.missing = 0                # samples that were not readings
+        self._callbacks = []
+        self.reset()
+
+    def reset(self, sp = None):
+        '''drop all history; optionally apply a new set point
+        '''
+        if sp is not None:
+            self.sp = sp
+        self._buf = deque()
+        self._t0 = None
+        self._n = 0
+        self._sx = self._sy = self._sxx = self._sxy = self._syy = 0.0
+        self._since = None
+        self.stable = False
+        self.stable_at = None
+        self.event.clear()
+
+    def on_stable(self, callback):
+        '''register callback(detector, t) fired on each transition to stable
+        '''
+        self._callbacks.append(callback)
+        return callback
+
+    def _add(self, x, y):
+        self._n += 1
+        self._sx += x
+        self._sy += y
+        self._sxx += x * x
+        self._sxy += x * y
+        self._syy += y * y
+
+    def _remove(self, x, y):
+        self._n -= 1
+        self._sx -= x
+        self._sy -= y
+        self._sxx -= x * x
+        self._sxy -= x * y
+        self._syy -= y * y
+
+    @property
+    def mean(self):
+        return self._sy / self._n if self._n else None
+
+    @property
+    def std(self):
+        if self._n < 2:
+            return None
+        var = (self._syy - self._sy * self._sy / self._n) / (self._n - 1)
+        return max(var, 0.0) ** 0.5
+
+    @property
+    def slope(self):
+        '''least-squares slope over the window in units per minute
+        '''
+        if self._n < 2:
+            return None
+        den = self._n * self._sxx - self._sx * self._sx
+        if den <= 0:
+            return None
+        return (self._n * self._sxy - self._sx * self._sy) / den * 60.0
+
+    def update(self, pv, t = None, sp = None):
+        '''feed one PV sample; returns True while the loop is stable
+
+           pv may be the raw reply string of get_pv; unparsable replies
+           are ignored. An sp that moved by more than sp_tol restarts
+           detection; a smaller move only shifts the band.
+        '''
+        if t is None:
+            t = time.monotonic()
+        if sp is not None and sp != self.sp:
+            if self.sp is None or abs(sp - self.sp) > self.sp_tol:
+                self.reset(sp)
+            else:
+                self.sp = sp
+        try:
+            pv = float(pv)
+        except (TypeError, ValueError):
+            self.missing += 1
+            return self.stable
+        if self._t0 is None:
+            self._t0 = t
+        x = t - self._t0
+        self._buf.append((x, pv))
+        self._add(x, pv)
+        while self._buf and x - self._buf[0][0] > self.window:
+            self._remove(*self._buf.popleft())
+
+        if self.sp is None or abs(pv - self.sp) > self.tol:
+            self._since = None
+            self._set(False, t)
+            return False
+        if self._since is None:
+            self._since = t
+        ok = t - self._since >= self.hold
+        if ok and self.max_slope is not None:
+            slope = self.slope
+            ok = slope is not None and abs(slope) <= self.max_slope
+        if ok and self.max_std is not None:
+            std = self.std
+            ok = std is not None and std <= self.max_std
+        self._set(ok, t)
+        return ok
+
+    def _set(self, state, t):
+        if state == self.stable:
+            return
+        self.stable = state
+        if state:
+            self.stable_at = t
+            self.event.set()
+            LOG.debug('stable at %s (sp %s)', t, self.sp)
+            for callback in self._callbacks:
+                callback(self, t)
+        else:
+            self.stable_at = None
+            self.event.clear()
+
+class GroupStabilityDetector:
+    '''combined detector for several loops, e.g. temperature and humidity,
+       or the outer and inner loops of a cascade
+
+       detectors: mapping of name to StabilityDetector; the group is stable
+       only while every member is stable
+    '''
+
+    def __init__(self, detectors):
+        self.detectors = dict(detectors)
+        self.event = threading.Event()
+        self.stable = False
+        self.stable_at = None
+        self._callbacks = []
+
+    def __getitem__(self, name):
+        return self.detectors[name]
+
+    def on_stable(self, callback):
+        '''register callback(group, t) fired on each transition to stable
+        '''
+        self._callbacks.append(callback)
+        return callback
+
+    def update(self, values, t = None):
+        '''feed one sample per member: values maps name to pv or (pv, sp)
+        '''
+        if t is None:
+            t = time.monotonic()
+        for name, value in values.items():
+            pv, sp = value if isinstance(value, tuple) else (value, None)
+            self.detectors[name].update(pv, t = t, sp = sp)
+        state = all(det.stable for det in self.detectors.values())
+        if state != self.stable:
+            self.stable = state
+            self.stable_at = t if state else None
+            if state:
+                self.event.set()
+                for callback in self._callbacks:
+                    callback(self, t)
+            else:
+                self.event.clear()
+        return state
+
+def cascade_detector(sp = None, tol = 0.5, hold = 300.0, inner_tol = None,
+                     inner_sp_tol = None, **kwargs):
+    '''group detector for a cascade loop; the inner loop uses inner_tol
+       (defaults to tol) against its own set point
+
+       The outer controller moves the inner set point all the time; moves
+       up to inner_sp_tol (defaults to inner_tol) do not restart the inner
+       detector.
+    '''
+    inner_tol = inner_tol if inner_tol else tol
+    return GroupStabilityDetector({
+        'outer': StabilityDetector(sp = sp, tol = tol, hold = hold, **kwargs),
+        'inner': StabilityDetector(tol = inner_tol, hold = hold,
+                                   sp_tol = inner_tol if inner_sp_tol is None
+                                   else inner_sp_tol, **kwargs),
+    })
+
+def wait_stable(dev, loop = 1, sp = None, tol = 0.5, hold = 300.0,
+                period = 1.0, timeout = None, detector = None, **kwargs):
+    '''poll get_pv on an F4T until the loop is stable; returns True when
+       stable, False on timeout
+
+       Use in place of a fixed soak wait after write_sp. The set point is
+       read from the controller when not given. A reading that fails
+       (timeout, chamber down) counts as missing; waiting goes on until
+       timeout.
+    '''
+    if sp is None:
+        sp = float(dev.get_sp(loop))
+    if detector is None:
+        detector = StabilityDetector(sp = sp, tol = tol, hold = hold, **kwargs)
+    start = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if detector.update(_read(dev.get_pv, loop), t = now):
+            return True
+        if timeout is not None and now - start >= timeout:
+            return False
+        time.sleep(max(0.0, period - (time.monotonic() - now)))
+
+def wait_cascade_stable(dev, sp = None, tol = 0.5, hold = 300.0, cascade = 1,
+                        period = 1.0, timeout = None, **kwargs):
+    '''poll the outer and inner cascade PVs until both are stable;
+       failed readings count as missing, as in wait_stable
+    '''
+    if sp is None:
+        sp = float(dev.get_cascadeLoopSP(True, cascade))
+    group = cascade_detector(sp = sp, tol = tol, hold = hold, **kwargs)
+    start = time.monotonic()
+    while True:
+        now = time.monotonic()
+        values = {
+            'outer': _read(dev.get_cascadeLoopPV, True, cascade),
+            'inner': (_read(dev.get_cascadeLoopPV, False, cascade),
+                      _float(_read(dev.get_cascadeLoopSP, False, cascade))),
+        }
+        if group.update(values, t = now):
+            return True
+        if timeout is not None and now - start >= timeout:
+            return False
+        time.sleep(max(0.0, period - (time.monotonic() - now)))
+
+def _read(getter, *args):
+    '''reply of one getter, None when the exchange failed
+    '''
+    try:
+        return getter(*args)
+    except F4TError as exc:
+        LOG.debug('missing sample: %s', exc)
+        return None
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
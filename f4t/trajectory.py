@@ -0,0 +1,295 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: trajectory.py
+
+Client-side setpoint trajectories.
+
+The controller ramps only linearly (rate or time). A TrajectoryEngine
+computes arbitrary setpoint curves on the host (sine cycling, piecewise
+profiles, humidity derived from temperature) and streams them to any
+number of loops and chambers from one scheduler thread:
+
+    - one pipelined exchange per chamber per tick carries the setpoint
+      writes of all its loops and the PV queries used for tracking
+    - a write is skipped (coalesced) while the target moved less than
+      the loop's resolution, and sent at most every min_interval seconds
+    - the target is evaluated at the moment the write takes effect: now
+      plus half the measured round-trip time of the chamber
+
+    engine = TrajectoryEngine(rate = 2.0)
+    temp = Trajectory.sine(mean = 40, amplitude = 20, period = 600,
+                           duration = 3600)
+    engine.add(dev, 1, temp)
+    engine.add(dev, 2, temp.map(lambda t: 90 - t))     # humidity follows
+    engine.run()
+    print(format_report(engine.report()))
+'''
+import math
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from f4tscpi.scpi import command, encode, parse
+from f4tscpi.f4t_class import F4TError
+
+LOG = logging.getLogger(__name__)
+
+SMOOTHING = 0.2         # weight of the newest RTT in its running average
+RETENTION = 100000      # tracking samples kept per track, oldest dropped
+
+class Trajectory:
+    '''setpoint as a function of seconds since start, over duration
+    '''
+
+    def __init__(self, func, duration):
+        self.func = func
+        self.duration = duration
+
+    def __call__(self, t):
+        return self.func(min(max(t, 0.0), self.duration))
+
+    def map(self, func):
+        '''trajectory of func(value), e.g. humidity tied to temperature
+        '''
+        return Trajectory(lambda t: func(self(t)), self.duration)
+
+    @classmethod
+    def constant(cls, value, duration):
+        return cls(lambda t: value, duration)
+
+    @classmethod
+    def ramp(cls, start, end, duration):
+        return cls(lambda t: start + (end - start) * t / duration, duration)
+
+    @classmethod
+    def sine(cls, mean, amplitude, period, duration, phase = 0.0):
+        return cls(lambda t: mean + amplitude *
+                   math.sin(2 * math.pi * t / period + phase), duration)
+
+    @classmethod
+    def piecewise(cls, points):
+        '''linear interpolation between (seconds, value) points
+        '''
+        points = sorted(points)
+        times = [t for t, _ in points]
+
+        def func(t):
+            pos = bisect.bisect_right(times, t)
+            if pos == 0:
+                return points[0][1]
+            if pos == len(points):
+                return points[-1][1]
+            (t0, v0), (t1, v1) = points[pos - 1], points[pos]
+            return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+        return cls(func, times[-1])
+
+class Track:
+    '''one loop following one trajectory; samples keeps the latest
+       retention (t, target, pv, written) readings
+    '''
+
+    def __init__(self, dev, loop, trajectory, resolution, min_interval,
+                 name, retention = RETENTION):
+        command(':SOURCE:CLOOP#:SPOINT').header(loop)       # range check
+        self.dev = dev
+        self.loop = loop
+        self.trajectory = trajectory
+        self.resolution = resolution
+        self.min_interval = min_interval
+        self.name = name
+        self.written = None             # last setpoint sent
+        self.last_write = None
+        self.writes = 0
+        self.coalesced = 0
+        self.done = False
+        self.samples = deque(maxlen = retention)
+
+    def due(self, target, now, final):
+        '''whether target must be written now
+        '''
+        if self.written is None or final:
+            return self.written != target
+        if self.last_write is not None and \
+           now - self.last_write < self.min_interval:
+            return False
+        return abs(target - self.written) >= self.resolution
+
+    def stats(self):
+        '''tracking of PV against the trajectory over the kept samples
+        '''
+        errors = [pv - target for _, target, pv, _ in self.samples
+                  if pv is not None]
+        if not errors:
+            return {'samples': 0, 'writes': self.writes,
+                    'coalesced': self.coalesced}
+        absolute = sorted(abs(err) for err in errors)
+        return {'samples': len(errors), 'writes': self.writes,
+                'coalesced': self.coalesced,
+                'mean': sum(errors) / len(errors),
+                'rms': math.sqrt(sum(err * err for err in errors) /
+                                 len(errors)),
+                'p95': absolute[min(int(0.95 * len(absolute)),
+                                    len(absolute) - 1)],
+                'max': absolute[-1]}
+
+class TrajectoryEngine:
+    '''streams trajectories to many loops and chambers
+
+       rate:    ticks per second (each tick is one exchange per chamber)
+       workers: chambers served in parallel per tick
+    '''
+
+    def __init__(self, rate = 1.0, workers = 16):
+        self.rate = rate
+        self.workers = workers
+        self.tracks = []
+        self.rtt = {}                   # id(dev) -> running average RTT
+        self.start_time = None
+        self.ticks = 0
+        self.overruns = 0
+        self._halt = threading.Event()
+        self._thread = None
+        self._pool = None               # shared by the ticks of run()
+
+    def add(self, dev, loop, trajectory, resolution = 0.1,
+            min_interval = 0.0, name = None, retention = RETENTION):
+        '''stream trajectory to loop of dev; returns the Track
+        '''
+        track = Track(dev, loop, trajectory, resolution, min_interval,
+                      name or f'{dev._host} L{loop}', retention)
+        self.tracks.append(track)
+        return track
+
+    @property
+    def duration(self):
+        return max((track.trajectory.duration for track in self.tracks),
+                   default = 0.0)
+
+    def _exchange(self, dev, tracks, elapsed):
+        '''one pipelined write + read for the tracks of one chamber
+        '''
+        lead = self.rtt.get(id(dev), 0.0) / 2
+        cmds, writes, finals = [], [], []
+        for track in tracks:
+            final = elapsed + lead >= track.trajectory.duration
+            target = round(track.trajectory(elapsed + lead), 6)
+            if track.due(target, elapsed, final):
+                cmds.append(encode(':SOURCE:CLOOP#:SPOINT', track.loop,
+                                   value = target))
+                writes.append((track, target))
+            else:
+                track.coalesced += 1
+            if final:
+                finals.append(track)
+        cmds += [encode(':SOURCE:CLOOP#:PVALUE?', track.loop)
+                 for track in tracks]
+        start = time.monotonic()
+        try:
+            replies = dev.pipeline(cmds)
+        finally:                        # a chamber that is down ends too
+            for track in finals:
+                track.done = True
+        rtt = time.monotonic() - start
+        old = self.rtt.get(id(dev))
+        self.rtt[id(dev)] = rtt if old is None else \
+                            old + SMOOTHING * (rtt - old)
+        for track, target in writes:
+            track.written, track.last_write = target, elapsed
+            track.writes += 1
+        at = start + rtt / 2 - self.start_time
+        for track, reply in zip(tracks, replies):
+            try:
+                pv = parse(':SOURCE:CLOOP#:PVALUE?', reply)
+            except ValueError:
+                pv = None
+            track.samples.append((at, track.trajectory(at), pv,
+                                  track.written))
+
+    def _executor(self):
+        count = len({id(track.dev) for track in self.tracks})
+        return ThreadPoolExecutor(max_workers = max(min(self.workers, count),
+                                                    1))
+
+    def _submit(self, pool, chambers, elapsed):
+        return {pool.submit(self._exchange, dev, tracks, elapsed): tracks
+                for dev, tracks in chambers.values()}
+
+    def tick(self):
+        '''one round over every chamber with unfinished tracks; the first
+           tick outside run() starts the clock
+        '''
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+        elapsed = time.monotonic() - self.start_time
+        chambers = {}
+        for track in self.tracks:
+            if not track.done:
+                chambers.setdefault(id(track.dev), (track.dev, []))[1] \
+                    .append(track)
+        if self._pool is None:
+            with self._executor() as pool:
+                futures = self._submit(pool, chambers, elapsed)
+        else:
+            futures = self._submit(self._pool, chambers, elapsed)
+        for future, tracks in futures.items():
+            try:
+                future.result()
+            except (F4TError, OSError) as exc:
+                LOG.warning('%s: %s', tracks[0].name, exc)
+        self.ticks += 1
+        return bool(chambers)
+
+    def run(self):
+        '''stream until every trajectory is finished (or stop())
+        '''
+        self.start_time = time.monotonic()
+        period = 1.0 / self.rate
+        tick = 0
+        with self._executor() as self._pool:
+            try:
+                while not self._halt.is_set() and self.tick():
+                    tick += 1
+                    wait = self.start_time + tick * period - time.monotonic()
+                    if wait < 0:        # fell behind: skip missed ticks
+                        self.overruns += 1
+                        tick += int(-wait / period) + 1
+                        wait = self.start_time + tick * period - \
+                               time.monotonic()
+                    self._halt.wait(wait)
+            finally:
+                self._pool = None
+
+    def start(self):
+        self._thread = threading.Thread(target = self.run, daemon = True,
+                                        name = 'f4t-trajectory')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._halt.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self):
+        '''{track name: tracking stats}
+        '''
+        return {track.name: track.stats() for track in self.tracks}
+
+def format_report(report):
+    '''plain text table of a tracking report
+    '''
+    lines = [f'{"track":<24} {"writes":>6} {"skipped":>7} {"rms":>7} '
+             f'{"p95":>7} {"max":>7} {"mean":>7}']
+    for name, row in sorted(report.items()):
+        if not row['samples']:
+            lines.append(f'{name:<24} {row["writes"]:>6} '
+                         f'{row["coalesced"]:>7}  no PV readings')
+            continue
+        lines.append(f'{name:<24} {row["writes"]:>6} {row["coalesced"]:>7} '
+                     f'{row["rms"]:>7.3f} {row["p95"]:>7.3f} '
+                     f'{row["max"]:>7.3f} {row["mean"]:>+7.3f}')
+    return '\n'.join(lines)
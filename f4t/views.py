@@ -0,0 +1,193 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: views.py
+
+Lightweight views on one F4T session.
+
+A view binds a part of the controller (a loop, the cascade loop, a group
+of event outputs) to an existing F4T and sends everything through it:
+same connection, lock, health record and latency statistics. Creating a
+view does no I/O and costs one small object, so application code can be
+organized by loop without opening more TCP sessions on the controller.
+
+    dev = F4T(host = '10.30.100.55')
+    temp, humi = dev.loop(1), dev.loop(2)
+    temp.set_sp(85.0)
+    print(temp.pv(), humi.pv())
+'''
+import logging
+from f4tscpi.scpi import command, encode, parse
+from f4tscpi.planner import read_keys
+
+LOG = logging.getLogger(__name__)
+
+class _View:
+    __slots__ = ('dev',)
+
+    def __init__(self, dev):
+        self.dev = dev
+
+    def _get(self, key, *index):
+        return parse(key, self.dev.query(encode(key, *index)))
+
+    def _get_many(self, keys):
+        '''planned read of (key, index) pairs (one exchange)
+        '''
+        return read_keys(self.dev, keys)
+
+    def _set(self, key, *index, value):
+        self.dev.send_cmd(encode(key, *index, value = value))
+
+class LoopView(_View):
+    '''one control loop (:SOURCE:CLOOP#)
+    '''
+    __slots__ = ('number',)
+
+    def __init__(self, dev, number):
+        super().__init__(dev)
+        command(':SOURCE:CLOOP#:PVALUE?').header(number)    # range check
+        self.number = number
+
+    def pv(self):
+        return self._get(':SOURCE:CLOOP#:PVALUE?', self.number)
+
+    def sp(self):
+        return self._get(':SOURCE:CLOOP#:SPOINT?', self.number)
+
+    def set_sp(self, value):
+        self._set(':SOURCE:CLOOP#:SPOINT', self.number, value = value)
+
+    def error(self):
+        '''True when the controller reports an error on the loop
+        '''
+        return self._get(':SOURCE:CLOOP#:ERROR?', self.number) == 'ERROR'
+
+    def idle(self):
+        return self._get(':SOURCE:CLOOP#:IDLE?', self.number)
+
+    def set_idle(self, value):
+        self._set(':SOURCE:CLOOP#:IDLE', self.number, value = value)
+
+    def ramp_rate(self):
+        return self._get(':SOURCE:CLOOP#:RRATE?', self.number)
+
+    def ramp_time(self):
+        return self._get(':SOURCE:CLOOP#:RTIME?', self.number)
+
+    def set_ramp(self, mode = None, rate = None, time = None, scale = None):
+        '''write the given ramp settings in a single exchange
+        '''
+        cmds = []
+        for key, value in ((':SOURCE:CLOOP#:RACTION', mode),
+                           (':SOURCE:CLOOP#:RSCALE', scale),
+                           (':SOURCE:CLOOP#:RRATE', rate),
+                           (':SOURCE:CLOOP#:RTIME', time)):
+            if value is not None:
+                cmds.append(encode(key, self.number, value = value))
+        self.dev.pipeline(cmds)
+
+    def read(self):
+        '''PV, SP and error flag in one exchange
+        '''
+        pv, sp, err = self._get_many([(':SOURCE:CLOOP#:PVALUE?',
+                                       (self.number,)),
+                                      (':SOURCE:CLOOP#:SPOINT?',
+                                       (self.number,)),
+                                      (':SOURCE:CLOOP#:ERROR?',
+                                       (self.number,))])
+        return {'pv': pv, 'sp': sp, 'error': err == 'ERROR'}
+
+    def __repr__(self):
+        return f'LoopView({self.dev._host}, loop {self.number})'
+
+class CascadeView(_View):
+    '''the cascade loop (:SOURCE:CASCADE#) with its outer and inner loop
+    '''
+    __slots__ = ('number',)
+
+    def __init__(self, dev, number = 1):
+        super().__init__(dev)
+        command(':SOURCE:CASCADE#:SPOINT?').header(number)  # range check
+        self.number = number
+
+    def sp(self):
+        return self._get(':SOURCE:CASCADE#:SPOINT?', self.number)
+
+    def set_sp(self, value):
+        self._set(':SOURCE:CASCADE#:SPOINT', self.number, value = value)
+
+    def outer_pv(self):
+        return self._get(':SOURCE:CASCADE#:OUTER:PVALUE?', self.number)
+
+    def inner_pv(self):
+        return self._get(':SOURCE:CASCADE#:INNER:PVALUE?', self.number)
+
+    def read(self):
+        '''SPs, PVs and error flags of both loops in one exchange
+        '''
+        keys = [(':SOURCE:CASCADE#:SPOINT?', (self.number,))]
+        for part in ('OUTER', 'INNER'):
+            for node in ('PVALUE', 'SPOINT', 'ERROR'):
+                keys.append((f':SOURCE:CASCADE#:{part}:{node}?',
+                             (self.number,)))
+        values = self._get_many(keys)
+        return {'sp': values[0],
+                'outer_pv': values[1], 'outer_sp': values[2],
+                'outer_error': values[3] == 'ERROR',
+                'inner_pv': values[4], 'inner_sp': values[5],
+                'inner_error': values[6] == 'ERROR'}
+
+    def __repr__(self):
+        return f'CascadeView({self.dev._host}, cascade {self.number})'
+
+class OutputGroup(_View):
+    '''a set of event outputs read and written together
+
+       states are bitmasks over the outputs of the group in the order
+       given: bit 0 = first output of the group
+    '''
+    __slots__ = ('outputs',)
+
+    def __init__(self, dev, outputs):
+        super().__init__(dev)
+        cmd = command(':OUTPUT#:STATE?')
+        for num in outputs:
+            cmd.header(num)                                 # range check
+        self.outputs = tuple(outputs)
+
+    def _select(self, mask):
+        '''group mask -> device mask (bit 0 = output 1)
+        '''
+        return sum(1 << (num - 1) for bit, num in enumerate(self.outputs)
+                   if mask >> bit & 1)
+
+    def read(self):
+        states = self._get_many([(':OUTPUT#:STATE?', (num,))
+                                 for num in self.outputs])
+        return sum(1 << bit for bit, state in enumerate(states)
+                   if state == 'ON')
+
+    def write(self, mask, confirm = False):
+        '''set the outputs of the group; others are untouched
+        '''
+        result = self.dev.write_outputs(self._select(mask),
+                                        self._select(-1), confirm)
+        if result is None:
+            return None
+        return sum(1 << bit for bit, num in enumerate(self.outputs)
+                   if result >> (num - 1) & 1)
+
+    def on(self):
+        return self.write(-1)
+
+    def off(self):
+        return self.write(0)
+
+    def names(self):
+        return self._get_many([(':OUTPUT#:NAME?', (num,))
+                               for num in self.outputs])
+
+    def __repr__(self):
+        return f'OutputGroup({self.dev._host}, outputs {self.outputs})'
@@ -0,0 +1,290 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: watch.py
+
+Change-only (report-by-exception) subscriptions.
+
+A Subscription sits behind ChamberPollers (or a pubsub Subscriber) and
+passes on a value only when it changed significantly. Rules are chosen per
+field name with fnmatch patterns, first match wins:
+
+    deadband       numeric fields: report when the value moved more than
+                   this from the last reported value
+    edge           discrete fields (outputs ON/OFF, ERROR? flags): 'both',
+                   'rising' (to ON/ERROR) or 'falling'
+    min_interval   no report sooner than this after the previous one
+    max_interval   report anyway (heartbeat) when nothing was reported for
+                   this long
+
+    rules = {'L* PV': Rule(deadband = 0.5, max_interval = 60),
+             'O*': Rule(edge = 'both'), '* ERR': Rule(edge = 'rising')}
+    sub = watch(dev, rules, callback = print)
+
+Changes go to the callback (called on the poller thread) or, without one,
+to a queue read with get(), a for loop or an async for loop.
+'''
+import queue
+import asyncio
+import logging
+import threading
+from fnmatch import fnmatchcase
+from collections import namedtuple
+from f4tscpi.f4t_class import F4TError
+
+LOG = logging.getLogger(__name__)
+
+EDGES = ('both', 'rising', 'falling')
+ACTIVE = frozenset(('ON', 'ERROR'))     # discrete values counted as high
+
+Change = namedtuple('Change', 't chamber field value previous reason')
+
+class Rule:
+    '''reporting rule of one field pattern
+    '''
+
+    def __init__(self, deadband = 0.0, edge = 'both', min_interval = 0.0,
+                 max_interval = None, initial = True):
+        if edge not in EDGES:
+            raise ValueError(f'edge must be one of {EDGES}')
+        if deadband < 0:
+            raise ValueError('deadband must not be negative')
+        self.deadband = deadband
+        self.edge = edge
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial = initial
+
+    def __repr__(self):
+        return (f'Rule(deadband={self.deadband}, edge={self.edge!r}, '
+                f'min_interval={self.min_interval}, '
+                f'max_interval={self.max_interval})')
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class ChangeFilter:
+    '''per (chamber, field) state; update() returns the significant changes
+
+       rules:   {pattern: Rule}; fields matching no pattern use default,
+                or are ignored when default is None
+    '''
+
+    def __init__(self, rules = None, default = Rule()):
+        self.rules = list((rules or {}).items())
+        self.default = default
+        self._match = {}
+        self._state = {}                # key -> [reported, t, seen]
+
+    def rule(self, field):
+        try:
+            return self._match[field]
+        except KeyError:
+            pass
+        found = next((rule for pattern, rule in self.rules
+                      if fnmatchcase(field, pattern)), self.default)
+        self._match[field] = found
+        return found
+
+    def reset(self, chamber = None):
+        '''forget the reported values (of one chamber); the next sample is
+           reported as initial
+        '''
+        if chamber is None:
+            self._state.clear()
+        else:
+            for key in [key for key in self._state if key[0] == chamber]:
+                del self._state[key]
+
+    def _reason(self, rule, prev, seen, value):
+        if value is None or prev is None:
+            return None if value is prev else 'change'
+        if _number(value) and _number(prev):
+            return 'deadband' if abs(value - prev) > rule.deadband else None
+        if value == seen:
+            return None
+        high, was = value in ACTIVE, seen in ACTIVE
+        if high == was:
+            return 'change'             # not a two-state field
+        edge = 'rising' if high else 'falling'
+        return edge if rule.edge in ('both', edge) else None
+
+    def update(self, chamber, t, values):
+        changes = []
+        for field, value in values.items():
+            rule = self.rule(field)
+            if rule is None:
+                continue
+            key = (chamber, field)
+            state = self._state.get(key)
+            if state is None:
+                self._state[key] = [value, t, value]
+                if rule.initial:
+                    changes.append(Change(t, chamber, field, value, None,
+                                          'initial'))
+                continue
+            prev, reported, seen = state
+            elapsed = t - reported
+            if elapsed < rule.min_interval:
+                continue
+            reason = self._reason(rule, prev, seen, value)
+            if reason is None and rule.max_interval is not None and \
+               elapsed >= rule.max_interval:
+                reason = 'heartbeat'
+            state[2] = value
+            if reason is not None:
+                state[0], state[1] = value, t
+                changes.append(Change(t, chamber, field, value,
+                                      prev if _number(value) else seen,
+                                      reason))
+        return changes
+
+class Subscription:
+    '''change-only stream over one or many chambers
+
+       callback: called with each Change on the feeding thread; without
+                 it changes are queued (up to maxsize, oldest dropped)
+    '''
+
+    def __init__(self, rules = None, default = Rule(), callback = None,
+                 maxsize = 10000):
+        self.filter = ChangeFilter(rules, default)
+        self.callback = callback
+        self.pollers = []
+        self._owned = []                # pollers started by watch()
+        self.samples = 0                # samples fed in
+        self.values = 0                 # field values fed in
+        self.changes = 0                # changes passed on
+        self.overflow = 0               # queued changes dropped
+        self._queue = queue.Queue(maxsize)
+        self._loop = None
+        self._aqueue = None
+        self._lock = threading.Lock()
+
+    def feed(self, chamber, t, values):
+        '''filter one sample (thread safe)
+        '''
+        with self._lock:
+            self.samples += 1
+            self.values += len(values)
+            changes = self.filter.update(chamber, t, values)
+        for change in changes:
+            self.changes += 1
+            if self.callback is not None:
+                self.callback(change)
+            elif self._loop is not None:
+                self._loop.call_soon_threadsafe(self._aqueue.put_nowait,
+                                                change)
+            else:
+                self._put(change)
+
+    def _put(self, change):
+        while True:
+            try:
+                self._queue.put_nowait(change)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.overflow += 1
+                except queue.Empty:
+                    pass
+
+    def listener(self, poller):
+        '''callback for ChamberPoller.listeners
+        '''
+        self.feed(poller.chamber, poller.stamp, poller.values)
+
+    def attach(self, pollers):
+        '''follow a fleet of ChamberPollers
+        '''
+        for poller in pollers:
+            poller.listeners.append(self.listener)
+            self.pollers.append(poller)
+        return self
+
+    @property
+    def ratio(self):
+        '''changes passed on per value fed in
+        '''
+        return self.changes / self.values if self.values else 0.0
+
+    def get(self, timeout = None):
+        '''next queued Change, None after timeout
+        '''
+        try:
+            return self._queue.get(timeout = timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        while True:
+            yield self._queue.get()
+
+    def __aiter__(self):
+        '''bind to the running event loop; queued changes move along
+        '''
+        if self._loop is None:
+            self._aqueue = asyncio.Queue()
+            self._loop = asyncio.get_running_loop()
+            while not self._queue.empty():
+                self._aqueue.put_nowait(self._queue.get_nowait())
+        return self
+
+    async def __anext__(self):
+        return await self._aqueue.get()
+
+    def close(self):
+        '''stop the pollers started by watch()
+        '''
+        for poller in self.pollers:
+            try:
+                poller.listeners.remove(self.listener)
+            except ValueError:
+                pass
+        for poller in self._owned:
+            poller.stop()
+        self.pollers, self._owned = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def watch(dev, rules = None, keys = None, rate = 1.0, callback = None,
+          name = None, default = Rule()):
+    '''change-only subscription on one F4T; the poller shares the session
+       of dev and never closes it
+
+       keys: poller fields (see dashboard.field_keys); by default the PV,
+             SP and error flag of every loop and cascade the chamber has
+             (capabilities.discover) and the event outputs
+    '''
+    from f4tscpi.dashboard import ChamberPoller, field_keys
+    from f4tscpi.capabilities import discover
+    name = name or dev._host
+    if keys is None:
+        try:
+            keys = discover(dev).field_keys(errors = True)
+        except F4TError as exc:
+            LOG.warning('%s: capabilities unknown, watching loop 1: %s',
+                        name, exc)
+            keys = field_keys((1,), errors = True)
+
+    def connect():
+        # reconnect after a failed poll; the lock keeps the session's
+        # other users out until the connection is replaced
+        with dev.lock:
+            if dev._closed or not dev.probe():
+                raise ConnectionError(f'{name}: not reachable')
+        return dev
+
+    poller = ChamberPoller(name, connect, keys, rate)
+    poller.dev = dev
+    poller.owned = False
+    sub = Subscription(rules, default, callback).attach([poller])
+    sub._owned.append(poller)
+    poller.start()
+    return sub
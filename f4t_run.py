@@ -11,14 +11,30 @@ call methods to utilize the Watlow F4T control interface
 from its class and method definitions. 
 
 TCP/IP protocol is applied. 
+
+Without arguments the interactive menus are started. With -c/--command
+or -s/--script the commands run non-interactively over one connection
+and results are printed as JSON lines or CSV, e.g.:
+
+   f4t_run.py --host 192.168.0.101 -c 'set-sp 1 25' -c 'sample 10 1 1 2'
+   f4t_run.py --host 192.168.0.101 --format csv --script soak.txt
+
+See f4tscpi/batch.py for the command list. --dashboard shows a live view
+of one or more chambers:
+
+   f4t_run.py --dashboard 192.168.0.101 192.168.0.102 --loops 1 2
 '''
 import os, sys, re
 sys.path.insert(0,'../f4tscpi')
 import time
+import shlex
 import logging
+import argparse
+import contextlib
 
-from f4tscpi.f4t_class import Controller, TempUnits, RampScale
+from f4tscpi.f4t_class import Controller, TempUnits, RampScale, F4TError
 from f4tscpi.f4t_interface import F4T
+from f4tscpi.batch import Writer, read_script, run_batch
 
 LOG = logging.getLogger(__name__)
 
@@ -93,11 +109,13 @@ def runProg():   # test def
             prog_num = int(input('Enter profile number (Ctrl+C to exit profile execution): '))
             if isinstance(prog_num, int) and 1 <= prog_num <= 40:
                 print (f'\nExecuting profile {prog_num}:')
-                tst.select_profile(prog_num)
-                time.sleep(0.5)
-                tst.send_cmd(':PROGRAM:NAME?')
-                time.sleep(0.5)
-                tst.prog_mode('START')
+                try:
+                    name = tst.program.select(prog_num, confirm = True)
+                except ValueError as exc:
+                    print (exc)
+                    continue
+                tst.program.start()
+                print (f'{name} started.')
                 break
             else:
                 print ('Invalid Profile No. Must be between 1 and 40.')
@@ -115,11 +133,7 @@ def progMode(mode):
           mode: STOP, PAUSE, RESUME 
     '''
     print (f'{mode} currently running profile...')
-    tst.select_profile(0)
-    time.sleep(0.5)
-    tst.send_cmd(':PROGRAM:NAME?')
-    time.sleep(0.5)
-    tst.prog_mode(mode)
+    tst.program.command(mode)
 
 def readTS():
     '''read time signal state
@@ -233,7 +247,7 @@ def thCtrl():
             print('Returning to Main Menu.')
             time.sleep(.5)
             os.system('clear||cls')
-            main_menu()
+            return
         else:
             print('Invalid option; expected a letter [a-z].')
 
@@ -258,7 +272,7 @@ def unit():
             print('Returning to Main Menu.')
             time.sleep(.5)
             os.system('clear||cls')
-            main_menu()
+            return
         else:
             print('Invalid option; expected a letter [r,s,z].')
 
@@ -280,23 +294,26 @@ def main_menu():
             option = input('Select option (i, t, p, ...): ')
         except:
             print('Invalid input; expected a letter [a-z].')
-        if option == 'i':
-            deviceID()
-        elif option == 't':
-            thCtrl()
-        elif option == 'p':
-            progMenu()
-        elif option == 'e':
-            eventCtrl()
-        elif option == 'r':
-            rampMenu()
-        elif option == 'u':
-            unit() 
-        elif option == 'z':
-            print('Program terminated.')
-            exit()
-        else:
-            print('Invalid option; expected a letter [a-z].')
+        try:
+            if option == 'i':
+                deviceID()
+            elif option == 't':
+                thCtrl()
+            elif option == 'p':
+                progMenu()
+            elif option == 'e':
+                eventCtrl()
+            elif option == 'r':
+                rampMenu()
+            elif option == 'u':
+                unit() 
+            elif option == 'z':
+                print('Program terminated.')
+                exit()
+            else:
+                print('Invalid option; expected a letter [a-z].')
+        except F4TError as exc:
+            print (f'F4T communication error: {exc}')
 
 def eventCtrl():
     '''Test TS events
@@ -318,7 +335,7 @@ def eventCtrl():
             print('Return to Main Menu...')
             time.sleep(0.5)
             os.system('clear||cls')
-            main_menu() 
+            return
         else:
             print('Invalid option; expected a letter [a-z].')
 
@@ -399,7 +416,7 @@ def rampMenu():
             print('Return to Main Menu...')
             time.sleep(0.5)
             os.system('clear||cls')
-            main_menu() 
+            return
         else:
             print('Invalid option.')
 
@@ -435,7 +452,7 @@ def progMenu():  # test
             print('Return to Main.')
             time.sleep(0.5)
             os.system('clear||cls')
-            main_menu()
+            return
         else:
             print('Invalid option; expected a letter [a-z].')
 
@@ -528,13 +545,91 @@ def print_menu(choice):
         print (f'  [{key}]:', menu(choice)[key] )
     print ('------------------------------') 
 
+def batch(args):
+    '''run commands non-interactively and exit with the number of
+       failed commands as status (0: all succeeded)
+    '''
+    commands = [shlex.split(cmd) for cmd in args.command]
+    if args.script:
+        with (sys.stdin if args.script == '-' else open(args.script)) as src:
+            commands.extend(read_script(src))
+    # keep stdout machine-readable
+    with contextlib.redirect_stdout(sys.stderr):
+        dev = F4T(host = args.host, port = args.port, timeout = args.timeout)
+    try:
+        failed = run_batch(dev, commands, Writer(sys.stdout, args.format),
+                           stop_on_error = args.stop_on_error)
+    finally:
+        dev.close()
+    sys.exit(min(failed, 125))
+
+def parse_args(argv = None):
+    '''command line options
+    '''
+    parser = argparse.ArgumentParser(
+        description = 'Watlow F4T control, interactive or batch mode.')
+    parser.add_argument('--host', help = 'F4T IP address')
+    parser.add_argument('--port', type = int, default = 5025)
+    parser.add_argument('--timeout', type = float, default = 1.0,
+                        help = 'socket timeout in seconds')
+    parser.add_argument('-c', '--command', action = 'append', default = [],
+                        help = 'batch command, may be repeated')
+    parser.add_argument('-s', '--script',
+                        help = 'file with one batch command per line '
+                               '("-" reads stdin)')
+    parser.add_argument('--format', choices = ('json', 'csv'),
+                        default = 'json', help = 'batch output format')
+    parser.add_argument('--stop-on-error', action = 'store_true',
+                        help = 'stop batch at the first failed command')
+    parser.add_argument('--dashboard', nargs = '+', metavar = 'HOST',
+                        help = 'live view of PV/SP and outputs of chambers')
+    parser.add_argument('--loops', nargs = '+', type = int, default = [1],
+                        help = 'loops shown on the dashboard')
+    parser.add_argument('--cascade', action = 'store_true',
+                        help = 'show cascade values on the dashboard')
+    parser.add_argument('--errors', action = 'store_true',
+                        help = 'also poll the ERROR? flag of every loop')
+    parser.add_argument('--rate', type = float, default = 1.0,
+                        help = 'dashboard polling rate in Hz')
+    parser.add_argument('--log', metavar = 'FILE',
+                        help = 'log dashboard samples to a CSV file')
+    parser.add_argument('--discover', metavar = 'CACHE',
+                        help = 'discover the loops of each chamber, cached '
+                               'in this file (overrides --loops/--cascade)')
+    parser.add_argument('--publish', metavar = 'SOCKET',
+                        help = 'fan dashboard samples out to local '
+                               'subscribers on this Unix socket')
+    parser.add_argument('--table', metavar = 'NAME',
+                        help = 'keep the latest dashboard values in this '
+                               'shared memory table')
+    args = parser.parse_args(argv)
+    if (args.command or args.script) and not args.host:
+        parser.error('--host is required in batch mode')
+    return args
+
 if __name__ == "__main__":
 
+    args = parse_args()
+    if args.command or args.script:
+        batch(args)
+    if args.dashboard:
+        # curses and shared memory are only needed here
+        from f4tscpi import dashboard
+        from f4tscpi.acquisition import Acquisition
+        dashboard.run(Acquisition(args.dashboard, loops = args.loops,
+                                  cascade = args.cascade, rate = args.rate,
+                                  port = args.port, timeout = args.timeout,
+                                  discover = args.discover, log = args.log,
+                                  publish = args.publish, table = args.table,
+                                  errors = args.errors))
+        sys.exit(0)
+
     # clear terminal pay attention to GNU/Linux and MS Windows
     os.system('clear||cls')
 
     # connecto to watlow F4T via proper IP address using TCP/IP protocol
-    tst = F4T(host = ip_addr(), timeout = 1)
+    tst = F4T(host = args.host or ip_addr(), port = args.port, 
+              timeout = args.timeout)
 
     # Get current temp P and SP values
     loop = 1
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: gen_catalog.py
+
+Build step: convert f4t_scpi_commands.ods into the static command catalog
+f4t/catalog.py. Only the built-in Python Library is used (the .ods file is
+a zip archive holding content.xml).
+
+usage: python3 f4t_scpi_cmds/gen_catalog.py [sheet.ods] [catalog.py]
+'''
+import os
+import re
+import sys
+import argparse
+import zipfile
+import xml.etree.ElementTree as ET
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHEET = os.path.join(HERE, 'f4t_scpi_commands.ods')
+TARGET = os.path.join(HERE, os.pardir, 'f4t', 'catalog.py')
+
+TABLE = '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}'
+TEXT = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+
+# index ranges for the '#' placeholders of each node
+INDEX_RANGES = {
+    'CLOOP': (1, 4),
+    'OUTPUT': (1, 7),
+    'CASCADE': (1, 1),
+}
+
+# rows that apply to every controller type, wherever they sit in the sheet
+COMMON = re.compile(r'(\*IDN|:UNIT|:OUTPUT|:PROGRAM|:SOURCE:CLOOP#:R)')
+
+# commands used by the library that are missing from the sheet
+EXTRA_ROWS = [
+    ('Query event output name', ':OUTPUT#:NAME?', '<string value>', 'R',
+     '# = outputs 1-7', 'common'),
+]
+
+FIELDS = ('rw', 'values', 'index', 'family', 'description', 'comment')
+
+HEADER = """'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: catalog.py
+
+F4T SCPI command catalog.
+
+GENERATED by f4t_scpi_cmds/gen_catalog.py from f4t_scpi_commands.ods;
+do not edit by hand, edit the sheet and re-run the generator.
+
+key: command header with '#' for indexed nodes, ending in '?' for queries
+rw: 'R' query, 'W' write
+values: reply domain (R) or value domain (W):
+    ('float',), ('int', lo, hi), ('enum', choice, ...), ('string',),
+    ('idn',) or None
+index: ((node, lo, hi), ...) for each '#' in the header
+family: 'common', 'standard' (non cascade) or 'cascade'
+'''
+
+"""
+
+def read_rows(path):
+    '''yield the text cells of each non-empty row of the first table
+    '''
+    with zipfile.ZipFile(path) as ods:
+        root = ET.fromstring(ods.read('content.xml'))
+    table = next(root.iter(TABLE + 'table'))
+    for row in table.iter(TABLE + 'table-row'):
+        cells = []
+        for cell in row.findall(TABLE + 'table-cell'):
+            rep = int(cell.get(TABLE + 'number-columns-repeated', '1'))
+            txt = ' / '.join(''.join(p.itertext())
+                             for p in cell.findall(TEXT + 'p'))
+            cells.extend([txt] * min(rep, 16))
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            yield cells
+
+def normalize(cmd):
+    '''clean up a sheet command: drop stray blanks inside the header
+       and turn fixed cascade numbers into '#' placeholders
+    '''
+    cmd = re.sub(r':\s+', ':', cmd.strip())
+    head, _, arg = cmd.partition(' ')
+    head = re.sub(r'CASCADE\d', 'CASCADE#', head.upper())
+    return head, arg.strip()
+
+def domain(text):
+    '''turn a sheet value description into a domain tuple
+    '''
+    text = text.strip()
+    if not text:
+        return None
+    if text == '<floating point value>':
+        return ('float',)
+    if text == '<string value>':
+        return ('string',)
+    if text == '<idn>':
+        return ('idn',)
+    match = re.fullmatch(r'(\d+)\s*-\s*(\d+)', text)
+    if match:
+        return ('int', int(match.group(1)), int(match.group(2)))
+    if '|' in text:
+        return ('enum',) + tuple(v.strip() for v in text.split('|'))
+    return ('string',)
+
+def merge_text(first, second):
+    '''common leading words of two descriptions of the same command,
+       e.g. 'Set ramping off' + 'Set ramping on startup' -> 'Set ramping';
+       the first description as is when they do not start alike
+    '''
+    words = []
+    for x, y in zip(first.split(), second.split()):
+        if x != y:
+            break
+        words.append(x)
+    return ' '.join(words) or first
+
+def index_of(head):
+    nodes = re.findall(r'([A-Z]+)#', head)
+    return tuple((node,) + INDEX_RANGES[node] for node in nodes)
+
+def build(rows):
+    '''catalog dictionary from sheet rows
+    '''
+    catalog = {}
+    family = 'common'
+    for cells in rows:
+        first = cells[0]
+        if first.startswith('#'):
+            if 'NOT for versions with Cascade' in first:
+                family = 'standard'
+            elif 'WITH Cascade' in first:
+                family = 'cascade'
+            continue
+        if first == 'Description' or len(cells) < 2:
+            continue
+        cells = cells + [''] * (6 - len(cells))
+        desc, cmd, values, rw, comment = cells[0], cells[1], cells[2], \
+                                         cells[3], cells[4]
+        head, arg = normalize(cmd)
+        if head == '*IDN?':
+            # reply fields are spread over the columns of this row
+            rw, values = 'R', '<idn>'
+        elif not rw:
+            continue
+        fam = family
+        if COMMON.match(head):
+            fam = 'common'
+        entry = catalog.get(head)
+        if rw == 'W' and arg and not arg.startswith('<'):
+            # one sheet row per literal choice: merge into an enum
+            choices = entry['values'][1:] if entry else ()
+            values = ('enum',) + choices + (arg,)
+            if entry:
+                desc = merge_text(entry['description'], desc)
+                comment = merge_text(entry['comment'], comment)
+        elif rw == 'W' and arg:
+            values = domain(values) or ('float',)
+        else:
+            values = domain(values)
+        catalog[head] = {
+            'rw': rw,
+            'values': values,
+            'index': index_of(head),
+            'family': fam,
+            'description': desc,
+            'comment': comment,
+        }
+    for desc, cmd, values, rw, comment, fam in EXTRA_ROWS:
+        head, _ = normalize(cmd)
+        catalog.setdefault(head, {
+            'rw': rw, 'values': domain(values), 'index': index_of(head),
+            'family': fam, 'description': desc, 'comment': comment})
+    return catalog
+
+def render(catalog):
+    '''python source of the catalog, one command per block
+    '''
+    lines = [HEADER.rstrip('\n'), '', 'COMMANDS = {']
+    for head in sorted(catalog):
+        entry = catalog[head]
+        lines.append(f'    {head!r}: {{')
+        for field in FIELDS:
+            lines.append(f'        {field!r}: {entry[field]!r},')
+        lines.append('    },')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'generate f4t/catalog.py from the command sheet')
+    parser.add_argument('sheet', nargs = '?', default = SHEET,
+                        help = 'command sheet (.ods)')
+    parser.add_argument('target', nargs = '?', default = TARGET,
+                        help = 'catalog module to write')
+    args = parser.parse_args(argv)
+    catalog = build(read_rows(args.sheet))
+    with open(args.target, 'w') as out:
+        out.write(render(catalog))
+    print(f'{len(catalog)} commands written to '
+          f'{os.path.normpath(args.target)}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,6 +21,9 @@ setup(
     keywords='F4T',
     include_package_data=True,
     scripts=['bin/f4t_run.py'],
+    extras_require={
+        'analysis': ['numpy>=1.20'],
+    },
 
     classicifiers=[
         'Programming Language :: Python :: 3.6.8',
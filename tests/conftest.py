@@ -0,0 +1,62 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: conftest.py
+
+Shared fixtures: simulated chambers (f4tscpi.simulator) and F4T sessions
+connected to them. The package is imported as f4tscpi; from a source
+checkout the f4t directory is loaded under that name.
+'''
+import os
+import sys
+import importlib.util
+import pytest
+
+def _import_package():
+    try:
+        import f4tscpi              # installed
+        return
+    except ImportError:
+        pass
+    root = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'f4t')
+    spec = importlib.util.spec_from_file_location(
+        'f4tscpi', os.path.join(root, '__init__.py'),
+        submodule_search_locations = [root])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['f4tscpi'] = module
+    spec.loader.exec_module(module)
+
+_import_package()
+
+from f4tscpi.simulator import Simulator
+from f4tscpi.f4t_interface import F4T
+
+@pytest.fixture
+def sim():
+    with Simulator() as simulator:
+        yield simulator
+
+@pytest.fixture
+def connect(sim):
+    '''connect(**chamber options) -> (F4T session, SimChamber)'''
+    sessions = []
+
+    def factory(timeout = 1.0, **kwargs):
+        (chamber,) = sim.add(1, seed = len(sim.ports), **kwargs)
+        dev = F4T(host = '127.0.0.1', port = sim.ports[-1][0],
+                  timeout = timeout)
+        sessions.append(dev)
+        return dev, chamber
+    yield factory
+    for dev in sessions:
+        dev.close()
+
+@pytest.fixture
+def inject():
+    '''inject(chamber, *faults): the next replies of chamber get faults,
+       in order; later ones are clean'''
+    def apply(chamber, *faults):
+        pending = list(faults)
+        chamber.faults.draw = lambda rng: pending.pop(0) if pending else None
+    return apply
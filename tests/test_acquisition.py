@@ -0,0 +1,43 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_acquisition.py
+
+Acquisition wiring (pollers, CSV log, shared table) and dashboard cells.
+'''
+import csv
+import time
+from f4tscpi.acquisition import Acquisition
+from f4tscpi.dashboard import ChamberPoller, Dashboard, field_keys
+from f4tscpi.shmtable import TableReader
+
+def test_samples_reach_log_and_table(sim, tmp_path):
+    sim.add(1, seed = 1, cascade = True)
+    log = tmp_path / 'fleet.csv'
+    acq = Acquisition(['127.0.0.1'], cascade = True, rate = 20.0,
+                      port = sim.ports[0][0], log = str(log),
+                      table = f'f4t_test_{time.monotonic_ns()}')
+    with acq:
+        deadline = time.monotonic() + 5
+        while acq.pollers[0].stamp is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+        with TableReader(acq.values.name) as reader:
+            _, values = reader.read('127.0.0.1')
+    assert values['L1 PV'] > 0
+    assert not any(poller.is_alive() for poller in acq.pollers)
+    assert acq.sink.stats()['written'] > 0
+    assert acq.sink.stats()['errors'] == 0
+    with open(log) as rows:
+        fields = {row['field'] for row in csv.DictReader(rows)}
+    assert {'L1 PV', 'Out PV', 'In SP', 'O1'} <= fields
+
+def test_output_cells_only_for_event_outputs():
+    poller = ChamberPoller('c', None, field_keys((1,), True, True, True))
+    poller.values = {'O1': 'ON', 'O2': 'OFF', 'Out ERR': 'ERROR'}
+    board = Dashboard([poller])
+    widths = dict(board.columns)
+    assert widths['O1'] == 2 and widths['Out ERR'] == 8
+    assert board._text(poller, 'O1', 2) == '*'
+    assert board._text(poller, 'O2', 2) == '.'
+    assert board._text(poller, 'Out ERR', 8) == 'ERROR'
@@ -0,0 +1,83 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_alarms.py
+
+Vectorized alarm rules and fleet snapshots from acquisition pollers.
+'''
+import time
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from f4tscpi.alarms import AlarmEngine, fleet_arrays, fleet_loops
+from f4tscpi.acquisition import Acquisition
+from f4tscpi.dashboard import ChamberPoller
+
+def _engine():
+    engine = AlarmEngine(['a', 'b'], ['L1', 'L2'])
+    engine.add('hot', 'high', 80.0, hysteresis = 2.0)
+    engine.add('far', 'deviation', 5.0, loops = ['L1'], delay = 10.0)
+    engine.add('fault', 'fault', chambers = ['b'])
+    return engine
+
+def test_high_alarm_with_hysteresis():
+    engine = _engine()
+    pv = np.array([[81.0, 20.0], [20.0, 20.0]])
+    (hot,) = engine.evaluate(0.0, pv, sp = pv)
+    assert (hot.name, hot.chamber, hot.loop, hot.active) == \
+        ('hot', 'a', 'L1', True)
+    pv[0, 0] = 79.0                     # inside the hysteresis band
+    assert engine.evaluate(1.0, pv, sp = pv) == []
+    pv[0, 0] = 77.0
+    (hot,) = engine.evaluate(2.0, pv, sp = pv)
+    assert not hot.active and engine.active() == []
+
+def test_deviation_delay_and_missing_readings():
+    engine = _engine()
+    pv = np.full((2, 2), 20.0)
+    sp = np.array([[30.0, 20.0], [20.0, 20.0]])
+    assert engine.evaluate(0.0, pv, sp) == []
+    pv[0, 0] = np.nan                   # no reading: state unchanged
+    assert engine.evaluate(5.0, pv, sp) == []
+    pv[0, 0] = 20.0
+    (far,) = engine.evaluate(10.0, pv, sp)
+    assert far.active and far.value == 10.0 and far.limit == 5.0
+
+def test_fault_rule_and_unknown_kind():
+    engine = _engine()
+    pv = np.full((2, 2), 20.0)
+    error = np.array([[True, False], [False, True]])
+    (fault,) = engine.evaluate(0.0, pv, pv, error)
+    assert (fault.chamber, fault.loop) == ('b', 'L2')
+    with pytest.raises(ValueError):
+        engine.add('x', 'sideways', 1.0)
+    with pytest.raises(ValueError):
+        engine.add('x', 'high')
+
+def test_fleet_arrays_from_pollers():
+    up = ChamberPoller('a', None, [])
+    up.values = {'L1 PV': 25.0, 'L1 SP': 30.0, 'L1 ERR': 'ERROR',
+                 'Out PV': 24.0, 'Cas SP': 40.0, 'Out ERR': 'NONE'}
+    down = ChamberPoller('b', None, [])
+    down.values = {'L1 PV': 99.0}
+    down.error = 'timeout'
+    labels = fleet_loops((1,), cascade = True)
+    pv, sp, error = fleet_arrays([up, down], labels)
+    assert labels == ['L1', 'Out', 'In']
+    assert pv[0, :2].tolist() == [25.0, 24.0] and sp[0, 1] == 40.0
+    assert error[0].tolist() == [True, False, False]
+    assert np.isnan(pv[1]).all() and not error[1].any()
+
+def test_acquisition_polls_error_flags(sim):
+    sim.add(1, seed = 1)
+    acq = Acquisition(['127.0.0.1'], rate = 20.0, port = sim.ports[0][0],
+                      outputs = False, errors = True)
+    with acq:
+        deadline = time.monotonic() + 5
+        while acq.pollers[0].stamp is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+    assert acq.pollers[0].values['L1 ERR'] == 'NONE'
+    _, _, error = fleet_arrays(acq.pollers, fleet_loops((1,)))
+    assert error.tolist() == [[False]]
@@ -0,0 +1,60 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_analysis.py
+
+Step statistics of recorded runs, including missing readings.
+'''
+import pytest
+
+np = pytest.importorskip('numpy')
+from f4tscpi import analysis
+
+def _run():
+    '''hold at 20 for 100 s, step to 50: ramp to 52 by t = 130, back to
+       50 at t = 140 and hold'''
+    t = np.arange(300.0)
+    sp = np.where(t < 100, 20.0, 50.0)
+    pv = np.full(t.shape, 20.0)
+    ramp = (t >= 100) & (t < 130)
+    pv[ramp] = 20.0 + (t[ramp] - 100) * 32.0 / 30
+    fall = (t >= 130) & (t < 140)
+    pv[fall] = 52.0 - (t[fall] - 130) * 0.2
+    pv[t >= 140] = 50.0
+    return t, pv, sp
+
+def test_as_arrays_turns_bad_readings_into_nan():
+    t, pv, sp = analysis.as_arrays([(0, '23.5', '25'), (1, 'FAILED', None)])
+    assert pv[0] == 23.5 and np.isnan(pv[1]) and np.isnan(sp[1])
+
+def test_ramp_rate_in_units_per_minute():
+    t = np.arange(10.0)
+    rate = analysis.ramp_rate(t, 2.0 * t, window = 5)
+    assert np.isnan(rate[0]) and np.isnan(rate[-1])
+    assert rate[5] == pytest.approx(120.0)
+
+def test_step_summary():
+    t, pv, sp = _run()
+    out = analysis.step_summary(t, pv, sp, tol = 0.5)
+    assert list(out['step']) == [1, 2]
+    assert list(out['sp']) == [20.0, 50.0]
+    assert out['pv_mean'][0] == pytest.approx(20.0)
+    assert out['overshoot'][1] == pytest.approx(2.0, abs = 0.05)
+    assert out['settling_time'][1] == pytest.approx(38.0, abs = 1.0)
+    assert out['time_in_tol'][0] == pytest.approx(99.0)
+
+def test_missing_readings_do_not_poison_a_step():
+    t, pv, sp = _run()
+    clean = analysis.step_summary(t, pv, sp, tol = 0.5)
+    pv[[50, 200, 299]] = np.nan
+    out = analysis.step_summary(t, pv, sp, tol = 0.5)
+    for field in ('pv_mean', 'pv_std', 'overshoot', 'undershoot',
+                  'settling_time'):
+        assert np.all(np.isfinite(out[field])), field
+        assert out[field] == pytest.approx(clean[field], abs = 0.05), field
+
+def test_stability_windows():
+    t, pv, sp = _run()
+    windows = analysis.stability_windows(t, pv, sp, 0.5, min_duration = 60)
+    assert windows.tolist() == [[0.0, 99.0], [138.0, 299.0]]
@@ -0,0 +1,46 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_capabilities.py
+
+Capability discovery on simulated chambers and the persisted cache.
+'''
+from f4tscpi import capabilities
+from f4tscpi.capabilities import CapabilityCache, discover, discover_fleet
+
+def test_probe_finds_loops_cascade_and_outputs(connect):
+    dev, _ = connect(loops = 1, cascade = True)
+    caps = discover(dev)
+    assert caps.loops == (1,) and caps.cascade and not caps.humidity
+    assert caps.family == 'cascade' and caps.outputs[1] == 'Output 1'
+    names = [name for name, _, _ in caps.field_keys(outputs = False,
+                                                    errors = True)]
+    assert 'L2 PV' not in names and 'Out ERR' in names
+
+def test_cache_skips_probing(connect, tmp_path):
+    path = str(tmp_path / 'caps.json')
+    dev, chamber = connect(loops = 2)
+    found = discover_fleet({'a': dev}, CapabilityCache(path))
+    assert found['a'].humidity
+    requests = chamber.requests
+    cached = discover(dev, CapabilityCache(path))
+    assert chamber.requests == requests
+    assert cached.to_dict() == found['a'].to_dict()
+
+def test_silent_absent_nodes_keep_the_connection(connect, monkeypatch):
+    dev, chamber = connect(timeout = 0.3, loops = 1)
+    answer = chamber.handle
+    # a controller that stays silent on absent nodes
+    monkeypatch.setattr(chamber, 'handle',
+                        lambda line: answer(line) or None)
+    monkeypatch.setattr(capabilities, 'PROBE_TIMEOUT', 0.1)
+    reconnects = []
+    swap = dev._reconnect
+    monkeypatch.setattr(dev, '_reconnect',
+                        lambda: reconnects.append(1) or swap())
+    caps = discover(dev)
+    assert caps.loops == (1,) and not caps.cascade
+    assert len(reconnects) == 1         # after the batch timeout only
+    assert not dev.health.is_down
+    assert dev.pipeline(['*IDN?']) == [chamber.idn]
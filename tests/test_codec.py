@@ -0,0 +1,71 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_codec.py
+
+Deadband compression of PV series, logs and archives.
+'''
+import math
+import pytest
+from f4tscpi.codec import compress, decompress, densify, unpack, \
+    compress_log, write_archive, read_archive
+
+def _series(n = 600):
+    times = [0.5 * k for k in range(n)]
+    values = [25.0 + 10.0 * math.sin(t / 20.0) + 0.03 * ((k * 7) % 5)
+              for k, t in enumerate(times)]
+    return times, values
+
+def test_roundtrip_within_deadband():
+    times, values = _series()
+    blob = compress(times, values, deadband = 0.1)
+    kept, _ = decompress(blob)
+    assert len(kept) < len(times) // 3
+    _, dense = decompress(blob, query = times)
+    bound = 0.1 + 0.5 / 100.0 + 1e-9
+    assert all(abs(d - v) <= bound for d, v in zip(dense, values))
+
+def test_flat_series_keeps_the_ends():
+    times = [float(t) for t in range(100)]
+    kept, values = decompress(compress(times, [20.0] * 100, 0.05))
+    assert kept == [0.0, 99.0] and values == [20.0, 20.0]
+
+def test_failed_reads_are_skipped():
+    times = [0.0, 1.0, 2.0, 3.0]
+    _, values = decompress(compress(times, [1.0, None, math.nan, 4.0], 0.0),
+                           query = times)
+    assert values == pytest.approx([1.0, 2.0, 3.0, 4.0])
+
+def test_header_and_period_grid():
+    blob = compress([0.0, 10.0], [0.0, 10.0], deadband = 0.2, scale = 10.0)
+    _, _, scale, deadband = unpack(blob)
+    assert (scale, deadband) == (10.0, 0.2)
+    times, values = decompress(blob, period = 2.5)
+    assert times == [0.0, 2.5, 5.0, 7.5, 10.0]
+    assert values == pytest.approx(times)
+    with pytest.raises(ValueError):
+        unpack(b'NOPE' + blob[4:])
+
+def test_densify_clamps_and_unordered_queries():
+    assert densify([1.0, 3.0], [10.0, 30.0], [3.0, 0.0, 2.0, 9.0]) == \
+        [30.0, 10.0, 20.0, 30.0]
+    assert all(math.isnan(v) for v in densify([], [], [1.0, 2.0]))
+
+def test_log_to_archive(tmp_path):
+    log = tmp_path / 'fleet.csv'
+    rows = ['t,chamber,field,value']
+    for t in range(50):
+        rows.append(f'{t},a,L1 PV,{20 + t * 0.1:.2f}')
+        rows.append(f'{t},b,L1 PV,{30.0:.2f}')
+        rows.append(f'{t},a,O1,ON')
+    log.write_text('\n'.join(rows) + '\n')
+    blobs = compress_log(str(log), {('b', 'L1 PV'): 0.5})
+    assert set(blobs) == {('a', 'L1 PV'), ('b', 'L1 PV')}
+    assert unpack(blobs[('b', 'L1 PV')])[3] == 0.5
+    path = str(tmp_path / 'fleet.f4ta')
+    write_archive(path, blobs)
+    assert read_archive(path) == blobs
+    _, values = decompress(read_archive(path)[('a', 'L1 PV')],
+                           query = [0.0, 49.0])
+    assert values == pytest.approx([20.0, 24.9], abs = 0.11)
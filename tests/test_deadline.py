@@ -0,0 +1,25 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_deadline.py
+
+Retries and deadlines of idempotent reads.
+'''
+import pytest
+from f4tscpi.simulator import Faults
+from f4tscpi.f4t_class import F4TTimeout
+
+PV = ':SOURCE:CLOOP1:PVALUE?'
+
+def test_protocol_error_is_retried(connect, inject):
+    dev, chamber = connect()
+    inject(chamber, 'garbage')
+    assert dev.read([PV, '*IDN?'], retries = 1)[1] == chamber.idn
+    assert chamber.injected['garbage'] == 1
+
+def test_stall_raises_timeout(connect):
+    dev, chamber = connect(timeout = 0.3)
+    chamber.faults = Faults(stall = 1.0, stall_time = 2.0)
+    with pytest.raises(F4TTimeout):
+        dev.read([PV], retries = 0)
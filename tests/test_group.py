@@ -0,0 +1,46 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_group.py
+
+Staged and synchronized program control of simulated chambers.
+'''
+import pytest
+from f4tscpi.group import ChamberGroup, GroupError, format_report
+from f4tscpi.program import RUNNING
+
+def _group(connect, count = 3, **kwargs):
+    pairs = [connect(**kwargs) for _ in range(count)]
+    group = ChamberGroup({f'c{i}': dev for i, (dev, _) in enumerate(pairs)})
+    return group, [chamber for _, chamber in pairs]
+
+def test_start_stages_and_releases_together(connect):
+    group, chambers = _group(connect)
+    report = group.start(2, step = 1)
+    assert group.staged['c0'] == (2, 1, 'Profile 2')
+    assert all(row['error'] is None and row['rtt'] > 0
+               for row in report['chambers'].values())
+    assert 0 <= report['skew'] and 0 <= report['spread']
+    assert [chamber.program for chamber in chambers] == [2, 2, 2]
+    assert [chamber.run_state for chamber in chambers] == ['START'] * 3
+    assert all(dev.program.state == RUNNING
+               for dev in group.devices.values())
+    assert format_report(report).startswith('START: send skew')
+
+def test_empty_profile_refuses_to_stage(connect):
+    group, chambers = _group(connect, count = 2, profiles = 1)
+    with pytest.raises(GroupError) as info:
+        group.stage(2)
+    assert set(info.value.errors) == {'c0', 'c1'}
+    assert group.staged == {}
+
+def test_release_normalises_and_checks_the_mode(connect):
+    group, chambers = _group(connect, count = 2)
+    assert group.release('start')['mode'] == 'START'
+    requests = [chamber.requests for chamber in chambers]
+    with pytest.raises(ValueError):
+        group.release('HALT')
+    assert [chamber.requests for chamber in chambers] == requests
+    assert all(dev.program.state == RUNNING
+               for dev in group.devices.values())
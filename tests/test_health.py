@@ -0,0 +1,58 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_health.py
+
+Typed errors and the circuit breaker against the simulator.
+'''
+import gc
+import weakref
+import pytest
+from f4tscpi.simulator import Faults
+from f4tscpi.health import MONITOR
+from f4tscpi.f4t_interface import F4T
+from f4tscpi.f4t_class import F4TError, F4TProtocolError, \
+    F4TUnavailable
+
+PV = ':SOURCE:CLOOP1:PVALUE?'
+
+def _mark_down(dev, chamber):
+    chamber.faults = Faults(garbage = 1.0)
+    for _ in range(dev.health.failure_threshold):
+        with pytest.raises(F4TError):
+            dev.read([PV], retries = 0)
+
+def test_undecodable_reply_raises_protocol_error(connect, inject):
+    dev, chamber = connect()
+    inject(chamber, 'garbage')
+    with pytest.raises(F4TProtocolError):
+        dev.read([PV], retries = 0)
+    assert float(dev.read([PV], retries = 0)[0]) > 0   # session recovered
+
+def test_chamber_marked_down_fails_fast(connect):
+    dev, chamber = connect()
+    _mark_down(dev, chamber)
+    assert dev.health.is_down
+    with pytest.raises(F4TUnavailable):
+        dev.read([PV], retries = 0)
+
+def test_closed_session_is_not_probed(connect):
+    dev, chamber = connect()
+    _mark_down(dev, chamber)
+    assert dev in MONITOR._watched
+    dev.close()
+    assert dev not in MONITOR._watched
+    chamber.faults = Faults()
+    assert dev.probe()                  # reports done, stays closed
+    assert dev._conn.fileno() == -1
+
+def test_discarded_session_is_released(sim):
+    (chamber,) = sim.add(1)
+    dev = F4T(host = '127.0.0.1', port = sim.ports[-1][0], timeout = 1.0)
+    _mark_down(dev, chamber)
+    assert dev in MONITOR._watched
+    ref = weakref.ref(dev)
+    del dev
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,54 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_planner.py
+
+Compiled read plans: field resolution, batching, caching, execution.
+'''
+import pytest
+from f4tscpi import planner
+from f4tscpi.capabilities import Capabilities
+from f4tscpi.planner import compile_plan, read_fields, read_keys, resolve
+
+def test_orderings_share_one_plan():
+    plan = compile_plan(['temp.pv', 'output3', 'loop1.pv'])
+    assert compile_plan(['loop1.pv', 'temp.pv', 'output3']) is plan
+    assert plan.round_trips == 1
+    assert len(plan.commands) == 2      # temp.pv is loop1.pv
+    with pytest.raises(KeyError):
+        resolve('loop9.pv')
+
+def test_fields_the_chamber_lacks_are_skipped():
+    caps = Capabilities('s', 'f', loops = (1,))
+    plan = compile_plan(['temp.pv', 'humi.pv', 'cascade.sp'], caps)
+    assert sorted(plan.skipped) == ['cascade.sp', 'humi.pv']
+    assert plan.parse(['21.5']) == {'temp.pv': 21.5, 'humi.pv': None,
+                                    'cascade.sp': None}
+
+def test_batches_respect_the_exchange_limits(monkeypatch):
+    monkeypatch.setattr(planner, 'MAX_QUERIES', 4)
+    fields = [f'output{n}' for n in range(1, 8)] + ['idn']
+    plan = compile_plan(fields, Capabilities('limits', 'f'))
+    assert [len(batch) for batch in plan.batches] == [4, 4]
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(planner, 'CACHE_SIZE', 2)
+    monkeypatch.setattr(planner, '_CACHE', type(planner._CACHE)())
+    first = compile_plan(['temp.pv'])
+    compile_plan(['temp.sp'])
+    compile_plan(['humi.pv'])
+    assert len(planner._CACHE) == 2
+    assert compile_plan(['temp.pv']) is not first
+
+def test_read_on_a_chamber(connect):
+    dev, chamber = connect(loops = 2)
+    requests = chamber.requests
+    values = read_fields(dev, ['temp.pv', 'humi.sp', 'output1.name',
+                               'idn'])
+    assert chamber.requests == requests + 4
+    assert isinstance(values['temp.pv'], float)
+    assert values['output1.name'] == 'Output 1'
+    pv, sp = read_keys(dev, [(':SOURCE:CLOOP#:PVALUE?', (1,)),
+                             (':SOURCE:CLOOP#:SPOINT?', (2,))])
+    assert isinstance(pv, float) and sp == values['humi.sp']
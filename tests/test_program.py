@@ -0,0 +1,84 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_program.py
+
+Program control state kept in step with every profile selection.
+'''
+import pytest
+from f4tscpi.f4t_class import F4TError
+from f4tscpi.program import PAUSED, RUNNING, STOPPED
+from f4tscpi.profiles import read_profiles, select_step
+
+def _settle(dev):
+    '''wait until the chamber has handled every write sent so far'''
+    dev.pipeline(['*IDN?'])
+
+def test_select_skips_the_selected_profile(connect):
+    dev, chamber = connect()
+    prog = dev.program
+    prog.select(2)
+    _settle(dev)
+    assert chamber.program == 2
+    requests = chamber.requests
+    prog.select(2)
+    _settle(dev)
+    assert prog.skipped == 1
+    assert chamber.requests == requests + 1      # only the *IDN?
+
+def test_select_confirm_reads_the_name(connect):
+    dev, chamber = connect(profiles = 3)
+    assert dev.program.select(3, confirm = True) == 'Profile 3'
+    with pytest.raises(ValueError):
+        dev.program.select(5, confirm = True)
+    assert dev.program.selected is None
+
+def test_read_profiles_records_the_last_slot(connect):
+    dev, chamber = connect(profiles = 3)
+    names = read_profiles(dev, (1, 2, 3))
+    assert len(names) == 3
+    assert chamber.program == dev.program.selected == 3
+    dev.program.select(1)                   # must not be skipped
+    _settle(dev)
+    assert chamber.program == 1
+
+def test_select_step_records_the_selection(connect):
+    dev, chamber = connect()
+    dev.program.select(1)
+    select_step(dev, 2, 4)
+    _settle(dev)
+    assert (chamber.program, chamber.step) == (2, 4)
+    assert dev.program.selected == 2
+    dev.program.select(1)
+    _settle(dev)
+    assert chamber.program == 1
+
+def test_run_state_follows_commands(connect):
+    dev, chamber = connect()
+    prog = dev.program
+    assert prog.start(2, confirm = True) is not None
+    assert (chamber.program, chamber.run_state) == (2, 'START')
+    assert prog.state == RUNNING
+    prog.pause(confirm = True)
+    assert (chamber.run_state, prog.state) == ('PAUSE', PAUSED)
+    prog.stop(confirm = True)
+    assert (chamber.run_state, prog.state) == ('STOP', STOPPED)
+
+def test_write_only_commands_leave_no_reply_behind(connect):
+    dev, _ = connect()
+    dev.program.select(2)
+    dev.program.start()
+    assert dev.get_id().startswith('WATLOW')
+
+def test_failed_exchange_forgets_the_state(connect, inject):
+    dev, chamber = connect(timeout = 0.3)
+    prog = dev.program
+    prog.start(2, confirm = True)
+    inject(chamber, 'reset')
+    with pytest.raises(F4TError):
+        prog.select(3, confirm = True)
+    assert prog.selected is None and prog.state is None
+    prog.select(2)                          # sent again, not skipped
+    _settle(dev)
+    assert prog.skipped == 0 and chamber.program == 2
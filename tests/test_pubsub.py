@@ -0,0 +1,65 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_pubsub.py
+
+Local fan-out of samples over a Unix socket.
+'''
+import pytest
+from f4tscpi.pubsub import Publisher, Subscriber, pack_sample, \
+    unpack_sample, _frames
+from f4tscpi.acquisition import Acquisition
+
+def _ready(publisher, subscriber):
+    '''publish a marker until the subscription is in place'''
+    for _ in range(100):
+        publisher.publish('marker', 0.0, {'x': 0.0})
+        sample = subscriber.recv(timeout = 0.05)
+        if sample is not None:
+            while subscriber.recv(timeout = 0.05) is not None:
+                pass
+            return
+    raise AssertionError('subscription not served')
+
+def test_frame_roundtrip():
+    buf = bytearray(pack_sample(1.5, 'c1', {'L1 PV': 21.5, 'O1': 'ON',
+                                            'L2 PV': None,
+                                            'idn': ('WATLOW', 'F4T')}))
+    ((_, payload),) = list(_frames(buf))
+    assert buf == b''
+    assert unpack_sample(payload) == (1.5, 'c1', {'L1 PV': 21.5,
+                                                  'O1': 'ON', 'L2 PV': None,
+                                                  'idn': 'WATLOW,F4T'})
+
+def test_history_in_order_with_topic_filter(tmp_path):
+    path = str(tmp_path / 'f4t.sock')
+    with Publisher(path) as publisher, \
+         Subscriber(path, ['c1/*', 'marker/*'], 'history') as subscriber:
+        _ready(publisher, subscriber)
+        for t in range(5):
+            publisher.publish('c1', float(t), {'L1 PV': t + 20.0})
+            publisher.publish('c2', float(t), {'L1 PV': 0.0})
+        samples = [subscriber.recv(timeout = 1.0) for _ in range(5)]
+        assert subscriber.recv(timeout = 0.1) is None
+    assert [sample.t for sample in samples] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert {sample.chamber for sample in samples} == {'c1'}
+    assert subscriber.latest['c1'] == {'L1 PV': 24.0}
+
+def test_bad_mode():
+    with pytest.raises(ValueError):
+        Subscriber('/nonexistent', mode = 'everything')
+
+def test_acquisition_publishes(sim, tmp_path):
+    sim.add(1, seed = 1)
+    path = str(tmp_path / 'acq.sock')
+    acq = Acquisition(['127.0.0.1'], rate = 20.0, port = sim.ports[0][0],
+                      outputs = False, publish = path)
+    with acq, Subscriber(path, ['*/L1 PV']) as subscriber:
+        sample = None
+        for _ in range(50):
+            sample = subscriber.recv(timeout = 0.1)
+            if sample is not None:
+                break
+    assert sample.chamber == '127.0.0.1'
+    assert list(sample.values) == ['L1 PV']
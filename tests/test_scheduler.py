@@ -0,0 +1,82 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_scheduler.py
+
+Adaptive polling, queued writes and back-off of the Scheduler.
+'''
+import time
+import pytest
+from f4tscpi.scheduler import Scheduler
+from f4tscpi.capabilities import Capabilities
+
+def _wait(condition, timeout = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+@pytest.fixture
+def scheduled(connect):
+    started = []
+
+    def factory(fields, **kwargs):
+        dev, chamber = connect()
+        sched = Scheduler(dev, fields, **kwargs)
+        sched.start()
+        started.append(sched)
+        return sched, dev, chamber
+    yield factory
+    for sched in started:
+        sched.stop()
+        sched.join(5.0)
+
+def test_fields_are_read_at_their_rates(scheduled):
+    sched, _, _ = scheduled({'temp.pv': (0.05, 0), 'units': (60.0, 2)})
+    assert _wait(lambda: sched.rates()['temp.pv'][2] >= 5)
+    assert sched.rates()['units'][2] == 1
+    assert isinstance(sched.values['temp.pv'], float)
+    assert sched.error is None
+
+def test_missing_fields_are_skipped(connect):
+    dev, _ = connect()
+    caps = Capabilities('SIM00000', '01.00', loops = (1, 2))
+    sched = Scheduler(dev, {'temp.pv': 1.0, 'cascade.outer.pv': 1.0},
+                      caps = caps)
+    assert sched.skipped == ['cascade.outer.pv']
+
+def test_write_confirm_returns_the_read_back(scheduled):
+    sched, _, chamber = scheduled({'temp.pv': 0.5})
+    future = sched.write(':SOURCE:CLOOP#:SPOINT', 1, value = 42.5,
+                         confirm = True)
+    assert future.result(2.0) == 42.5
+    assert chamber.thermal['CLOOP1'].sp == 42.5
+
+def test_unparsable_read_back_fails_the_future(scheduled):
+    sched, dev, _ = scheduled({'temp.pv': 0.5})
+    real = dev.pipeline
+
+    def pipeline(cmds, *args, **kwargs):
+        if cmds[0].startswith(':SOURCE:CLOOP1:SPOINT '):
+            real(cmds, *args, **kwargs)
+            return ['junk']
+        return real(cmds, *args, **kwargs)
+    dev.pipeline = pipeline
+    future = sched.write(':SOURCE:CLOOP#:SPOINT', 1, value = 40.0,
+                         confirm = True)
+    with pytest.raises(ValueError):
+        future.result(2.0)
+    assert sched.is_alive()
+
+def test_large_exchanges_do_not_back_off(connect):
+    dev, _ = connect()
+    sched = Scheduler(dev, {'temp.pv': 1.0})
+    sched._adapt(0.010, 1)
+    sched._adapt(0.300, 32)                 # ~9 ms per query
+    assert sched.backoff == 1.0
+    for _ in range(20):
+        sched._adapt(0.100, 1)              # the chamber got slower
+    assert sched.backoff > 1.0
@@ -0,0 +1,41 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_session.py
+
+Pipelining and the session lock shared by getters and pollers.
+'''
+import threading
+
+PV = ':SOURCE:CLOOP1:PVALUE?'
+
+def test_pipeline_reads_one_reply_per_query(connect):
+    dev, chamber = connect()
+    replies = dev.pipeline([':SOURCE:CLOOP1:SPOINT 50',
+                            ':SOURCE:CLOOP1:SPOINT?', PV, '*IDN?'])
+    assert len(replies) == 3
+    assert float(replies[0]) == 50.0
+    assert replies[2] == chamber.idn
+
+def test_getters_stay_in_step_with_a_poller(connect):
+    dev, _ = connect()
+    dev.pipeline([':SOURCE:CLOOP1:SPOINT 31.5'])
+    bad = []
+
+    def getter():
+        for _ in range(100):
+            if dev.get_sp(1) != '31.5':
+                bad.append('sp')
+            if dev.get_pv(1) in ('', 'NONE', 'OFF'):
+                bad.append('pv')
+    sub = dev.watch(rate = 100)
+    try:
+        threads = [threading.Thread(target = getter) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sub.close()
+    assert bad == []
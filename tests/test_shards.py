@@ -0,0 +1,49 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_shards.py
+
+Sharded acquisition: worker processes over simulated chambers and the
+rebalancing of lagging shards.
+'''
+import time
+from f4tscpi.shards import ShardedAcquisition, _address
+
+def test_address():
+    assert _address('10.0.0.5', 5025) == ('10.0.0.5', 5025)
+    assert _address('10.0.0.5:6000', 5025) == ('10.0.0.5', 6000)
+
+def test_lagging_shard_releases_chambers():
+    acq = ShardedAcquisition([f'c{n}' for n in range(20)], workers = 3)
+    sent = []
+    acq._send = lambda shard, message: sent.append((shard.index, message))
+    slow, idle, unknown = acq._shards
+    slow.stats = {'healthy': 7, 'behind': 5}
+    idle.stats = {'healthy': 7, 'behind': 0}
+    acq._balance()
+    ((index, message),) = sent
+    assert index == slow.index and len(message['release']) == 1
+    (name,) = message['release']
+    assert name not in slow.chambers and acq._moving[name] == (slow, idle)
+    acq._balance()                      # waits for the release
+    assert len(sent) == 1 and acq.moves == 1
+
+def test_workers_poll_their_shards(sim):
+    sim.add(3, seed = 1)
+    hosts = [f'127.0.0.1:{port}' for port, _ in sim.ports]
+    seen = set()
+    acq = ShardedAcquisition(hosts, workers = 2, rate = 20.0, flush = 0.05,
+                             listeners = [lambda c, t, v: seen.add(c)],
+                             context = 'fork')
+    with acq:
+        deadline = time.monotonic() + 10
+        while len(seen) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    assert seen == set(hosts)
+    stamp, values = acq.read(hosts[0])
+    assert stamp > 0 and values['L1 PV'] > 0
+    stats = acq.stats()
+    assert sorted(row['chambers'] for row in stats) == [1, 2]
+    assert sum(row['samples'] for row in stats) == acq.samples
+    assert all(row['restarts'] == 0 for row in stats)
@@ -0,0 +1,75 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_shmtable.py
+
+Shared-memory value table: layout, typed values and seqlock reads.
+'''
+import math
+import threading
+import pytest
+from f4tscpi import shmtable
+from f4tscpi.shmtable import ValueTable, TableReader, to_float, _SEQ
+
+FIELDS = ('L1 PV', 'L1 SP', 'O1', 'L1 ERR')
+
+@pytest.fixture
+def table():
+    with ValueTable(['a', 'b'], FIELDS) as values:
+        yield values
+
+def test_to_float():
+    assert to_float(21) == 21.0 and to_float('ON') == 1.0
+    assert to_float('NONE') == 0.0
+    assert math.isnan(to_float(None)) and math.isnan(to_float(True))
+    assert math.isnan(to_float('garbage'))
+
+def test_reader_sees_the_writes(table):
+    with TableReader(table.name) as reader:
+        assert reader.chambers == ('a', 'b') and reader.fields == FIELDS
+        stamp, values = reader.read('a')
+        assert math.isnan(stamp) and all(map(math.isnan, values.values()))
+        table.put('a', 5.0, {'L1 PV': 20.5, 'O1': 'ON', 'other': 1.0})
+        table.put('a', 6.0, {'L1 SP': 30.0, 'L1 ERR': 'NONE'})
+        assert reader.read('a') == (6.0, {'L1 PV': 20.5, 'L1 SP': 30.0,
+                                          'O1': 1.0, 'L1 ERR': 0.0})
+        assert reader.row('a')[0] == 4          # two writes
+        assert math.isnan(reader.snapshot()['b'][0])
+
+def test_busy_row_times_out(table, monkeypatch):
+    monkeypatch.setattr(shmtable, 'RETRIES', 3)
+    with TableReader(table.name) as reader:
+        _SEQ.pack_into(table.shm.buf, table.layout.offset('b'), 1)
+        with pytest.raises(TimeoutError):
+            reader.read('b')
+        assert math.isnan(reader.get('a', 'L1 PV'))    # other rows read
+
+def test_rows_are_never_torn(table):
+    halt = threading.Event()
+
+    def write():
+        n = 0
+        while not halt.is_set():
+            n += 1
+            table.put('a', float(n), dict.fromkeys(FIELDS[:2], float(n)))
+    writer = threading.Thread(target = write)
+    writer.start()
+    try:
+        with TableReader(table.name) as reader:
+            for _ in range(2000):
+                stamp, values = reader.read('a')
+                if not math.isnan(stamp):
+                    assert values['L1 PV'] == values['L1 SP'] == stamp
+    finally:
+        halt.set()
+        writer.join()
+
+def test_not_a_table():
+    shm = shmtable.shared_memory.SharedMemory(create = True, size = 64)
+    try:
+        with pytest.raises(ValueError):
+            TableReader(shm.name)
+    finally:
+        shm.close()
+        shm.unlink()
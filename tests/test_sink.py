@@ -0,0 +1,90 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_sink.py
+
+Background sample writer: overflow policies, rotation and disk failures.
+'''
+import os
+import csv
+from f4tscpi.sink import SampleWriter
+
+def _rows(path):
+    with open(path, newline = '') as data:
+        return list(csv.reader(data))
+
+def test_rows_are_written_with_header(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    with SampleWriter(path, flush_interval = 0.01) as sink:
+        sink.snapshot('c1', 1.0, {'L1 PV': 23.5, 'O1': 'ON'})
+    rows = _rows(path)
+    assert rows[0] == ['t', 'chamber', 'field', 'value']
+    assert rows[1:] == [['1.0', 'c1', 'L1 PV', '23.5'],
+                        ['1.0', 'c1', 'O1', 'ON']]
+    assert sink.stats()['written'] == 2
+
+def test_drop_oldest_counts_dropped_rows(tmp_path):
+    sink = SampleWriter(str(tmp_path / 'log.csv'), maxsize = 3)
+    for n in range(5):                  # writer not started: queue fills
+        sink.put((n, 'c', 'f', n))
+    assert sink.dropped == 2
+    assert [row[0] for row in sink._queue] == [2, 3, 4]
+
+def test_spill_keeps_every_row_in_order(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    sink = SampleWriter(path, maxsize = 2, policy = 'spill',
+                        flush_interval = 0.01)
+    for n in range(6):
+        sink.put((n, 'c', 'f', n))
+    assert sink.spilled == 4
+    sink.start()
+    sink.close()
+    assert [row[0] for row in _rows(path)[1:]] == [str(n) for n in range(6)]
+
+def test_rotation_by_size(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    with SampleWriter(path, batch = 10, flush_interval = 0.01,
+                      max_bytes = 200) as sink:
+        for n in range(100):
+            sink.put((n, 'chamber', 'field', n))
+    assert sink.rotations >= 1
+    files = os.listdir(tmp_path)
+    total = sum(len(_rows(tmp_path / name)) - 1 for name in files)
+    assert len(files) == sink.rotations + 1 and total == 100
+
+def test_failed_write_is_retried(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    sink = SampleWriter(path, flush_interval = 0.01)
+    write, failures = sink._write, [OSError(5, 'Input/output error')]
+
+    def flaky(rows):
+        if failures:
+            raise failures.pop()
+        write(rows)
+    sink._write = flaky
+    sink.put_many((n, 'c', 'f', n) for n in range(10))
+    sink.start()
+    sink.close()
+    stats = sink.stats()
+    assert stats['errors'] == 1 and stats['error'] is None
+    assert stats['written'] == 10 and stats['dropped'] == 0
+    assert len(_rows(path)) == 11
+
+def test_failed_fsync_keeps_the_writer_alive(tmp_path, monkeypatch):
+    import f4tscpi.sink
+    calls = []
+
+    def fsync(fd):
+        calls.append(fd)
+        if len(calls) == 1:
+            raise OSError(5, 'Input/output error')
+    monkeypatch.setattr(f4tscpi.sink.os, 'fsync', fsync)
+    path = str(tmp_path / 'log.csv')
+    sink = SampleWriter(path, flush_interval = 0.01, fsync_interval = 0.0)
+    sink.start()
+    sink.put((1, 'c', 'f', 1))
+    sink.put((2, 'c', 'f', 2))
+    sink.close()
+    assert sink.errors >= 1 and not sink.is_alive()
+    assert len(_rows(path)) == 3
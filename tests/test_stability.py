@@ -0,0 +1,66 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_stability.py
+
+Stability detection on PV streams and soak waits on a simulated chamber.
+'''
+import pytest
+from f4tscpi.stability import StabilityDetector, cascade_detector, \
+    wait_stable
+
+def test_stable_after_hold():
+    det = StabilityDetector(sp = 50.0, tol = 0.5, hold = 10.0)
+    fired = []
+    det.on_stable(lambda d, t: fired.append(t))
+    assert not any(det.update(pv, t = t) for t, pv in
+                   enumerate([45.0, 48.0, 49.8, 50.2, 50.1] + [50.0] * 5))
+    assert det.update(50.0, t = 12)
+    assert fired == [12] and det.event.is_set()
+
+def test_excursion_restarts_the_hold():
+    det = StabilityDetector(sp = 50.0, tol = 0.5, hold = 5.0)
+    for t in range(5):
+        det.update(50.0, t = t)
+    det.update(51.0, t = 5)
+    assert not det.update(50.0, t = 6)
+    assert det.update(50.0, t = 11)
+
+def test_sp_change_restarts_detection():
+    det = StabilityDetector(sp = 50.0, tol = 0.5, hold = 2.0)
+    for t in range(4):
+        det.update(50.0, t = t)
+    assert det.stable
+    assert not det.update(50.0, t = 4, sp = 60.0)
+    assert det.sp == 60.0
+
+def test_slope_and_std_limits():
+    det = StabilityDetector(sp = 50.0, tol = 1.0, hold = 0.0,
+                            max_slope = 0.5)
+    states = [det.update(49.5 + t / 60, t = t) for t in range(0, 60, 5)]
+    assert det.slope == pytest.approx(1.0) and not any(states)
+    det = StabilityDetector(sp = 50.0, tol = 1.0, hold = 0.0, max_std = 0.1)
+    states = [det.update(49.6 if t % 2 else 50.4, t = t) for t in range(10)]
+    assert det.std > 0.1 and not any(states)
+
+def test_unreadable_samples_are_counted():
+    det = StabilityDetector(sp = 50.0, tol = 0.5, hold = 0.0)
+    assert not det.update('FAILED', t = 0)
+    assert det.missing == 1
+
+def test_cascade_inner_follows_small_sp_moves():
+    group = cascade_detector(sp = 50.0, tol = 0.5, hold = 5.0)
+    for t in range(10):
+        inner_sp = 52.0 + (0.2 if t % 2 else -0.2)
+        group.update({'outer': 50.1, 'inner': (inner_sp, inner_sp)}, t = t)
+    assert group.stable
+
+def test_wait_stable_survives_a_timeout(connect, inject):
+    dev, chamber = connect(timeout = 0.3)
+    chamber.faults.stall_time = 1.0
+    inject(chamber, None, 'stall')
+    det = StabilityDetector(sp = 23.0, tol = 1.0, hold = 0.3)
+    assert wait_stable(dev, 1, period = 0.05, timeout = 10.0,
+                       detector = det)
+    assert det.missing == 1
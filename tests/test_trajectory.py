@@ -0,0 +1,51 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_trajectory.py
+
+Setpoint trajectories streamed to simulated chambers.
+'''
+import pytest
+from f4tscpi.trajectory import Trajectory, TrajectoryEngine, format_report
+
+def _settle(dev):
+    '''wait until the chamber has handled every write sent so far'''
+    dev.pipeline(['*IDN?'])
+
+def test_shapes():
+    steps = Trajectory.piecewise([(10, 30.0), (0, 20.0), (20, 30.0)])
+    assert steps.duration == 20
+    assert [steps(t) for t in (-5, 5, 15, 99)] == [20.0, 25.0, 30.0, 30.0]
+    ramp = Trajectory.ramp(0.0, 10.0, 10.0).map(lambda v: 2 * v)
+    assert ramp(5.0) == 10.0 and ramp(50.0) == 20.0
+    assert Trajectory.sine(40, 20, 8, 8)(2) == pytest.approx(60.0)
+
+def test_run_writes_until_the_end(connect):
+    dev, chamber = connect()
+    engine = TrajectoryEngine(rate = 20.0)
+    temp = engine.add(dev, 1, Trajectory.ramp(20.0, 21.0, 0.5),
+                      resolution = 0.25)
+    humi = engine.add(dev, 2, Trajectory.constant(50.0, 0.2))
+    engine.run()
+    _settle(dev)
+    assert temp.done and humi.done
+    assert chamber.thermal['CLOOP1'].sp == 21.0
+    assert chamber.thermal['CLOOP2'].sp == 50.0
+    assert humi.writes == 1 and humi.coalesced > 0
+    assert 1 < temp.writes <= 5
+    report = engine.report()
+    assert report[temp.name]['samples'] == len(temp.samples)
+    assert temp.name in format_report(report)
+
+def test_tick_before_run_and_bounded_samples(connect):
+    dev, chamber = connect()
+    engine = TrajectoryEngine()
+    track = engine.add(dev, 1, Trajectory.constant(30.0, 60.0),
+                       retention = 3)
+    for _ in range(5):
+        assert engine.tick()
+    assert engine.start_time is not None
+    assert len(track.samples) == 3 and track.writes == 1
+    _settle(dev)
+    assert chamber.thermal['CLOOP1'].sp == 30.0
@@ -0,0 +1,52 @@
+'''
+:author: Paul Nong-Laolam <pnong-laolam@espec.com>
+:license: MIT, see LICENSE for more detail.
+:copyright: (c) 2022. ESPEC North America, INC.
+:file: test_watch.py
+
+Change filtering and watch() subscriptions on a shared session.
+'''
+import time
+from f4tscpi.watch import ChangeFilter, Rule
+
+def _until(condition, timeout = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+def test_deadband_edges_and_heartbeat():
+    rules = {'L* PV': Rule(deadband = 0.5, max_interval = 10),
+             '* ERR': Rule(edge = 'rising')}
+    filt = ChangeFilter(rules, default = None)
+    first = filt.update('c', 0, {'L1 PV': 20.0, 'L1 ERR': 'NONE', 'O1': 1})
+    assert [c.reason for c in first] == ['initial', 'initial']
+    assert filt.update('c', 1, {'L1 PV': 20.4, 'L1 ERR': 'ERROR'})[0] \
+        .reason == 'rising'
+    assert filt.update('c', 2, {'L1 PV': 20.6, 'L1 ERR': 'NONE'})[0] \
+        .previous == 20.0
+    (beat,) = filt.update('c', 12, {'L1 PV': 20.6})
+    assert beat.reason == 'heartbeat'
+
+def test_default_fields_follow_the_chamber(connect):
+    dev, chamber = connect(loops = 1)
+    with dev.watch(rate = 50) as sub:
+        (poller,) = sub.pollers
+        assert _until(lambda: sub.changes > 0)
+    names = [name for name, _, _ in poller.keys]
+    assert 'L1 ERR' in names and 'L2 PV' not in names
+    assert poller.values['L1 ERR'] == 'NONE'
+
+def test_failed_poll_keeps_the_session_open(connect, inject):
+    dev, chamber = connect(loops = 1)
+    sub = dev.watch(rate = 50)
+    try:
+        (poller,) = sub.pollers
+        assert _until(lambda: poller.stamp is not None)
+        inject(chamber, 'reset')
+        assert _until(lambda: poller.error is not None)
+        assert not dev._closed
+        assert dev.pipeline(['*IDN?']) == [chamber.idn]
+        assert _until(lambda: poller.error is None)
+    finally:
+        sub.close()